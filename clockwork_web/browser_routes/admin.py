@@ -37,8 +37,9 @@ from clockwork_web.core.utils import to_boolean, get_custom_array_from_request_a
 from clockwork_web.core.users_helper import (
     render_template_with_user_settings,
     get_users,
+    invalidate_user_context,
 )
-from ..db import get_db
+from ..db import get_db, get_db_pool_stats
 
 flask_api = Blueprint("admin", __name__)
 
@@ -82,6 +83,21 @@ def panel():
     )
 
 
+@flask_api.route("/db_pool_stats")
+@login_required
+@admin_access_required
+def db_pool_stats():
+    """
+    Connection pool counters of the MongoClient of the worker process
+    which handles this request.
+    """
+    logging.info(
+        f"clockwork browser route: /admin/db_pool_stats - current_user={current_user.mila_email_username}"
+    )
+
+    return jsonify(get_db_pool_stats())
+
+
 @flask_api.route("/users")
 @login_required
 @admin_access_required
@@ -183,6 +199,7 @@ def user():
                 {"mila_email_username": D_user["mila_email_username"]},
                 {"$set": new_usernames},
             )
+            invalidate_user_context(D_user["mila_email_username"])
             for cluster_username_field in D_clusters_usernames_fields:
                 D_user[cluster_username_field] = new_usernames[cluster_username_field]
             user_edit_status = gettext("User successfully updated.")
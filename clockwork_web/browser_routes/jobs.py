@@ -45,6 +45,7 @@ from clockwork_web.core.jobs_helper import (
     strip_artificial_fields_from_job,
     get_jobs,
     get_inferred_job_states,
+    InvalidCursorError,
 )
 from clockwork_web.core.pagination_helper import get_pagination_values
 
@@ -88,6 +89,10 @@ def route_search():
       presenting the number of the current page
     - "nbr_items_per_page" is optional and used for the pagination: it is a
       positive integer presenting the number of items to display per page
+    - "cursor" is optional and used for the pagination: it is the cursor returned
+      with the previous page (as "next_cursor" or in the "X-Next-Cursor" header),
+      for the same sorting. The jobs following this page are then returned, and
+      "page_num" is ignored
     - "want_json" is set to True if the expected returned entity is a JSON list of the jobs
     - "want_count" is useful when want_json is True. If want_count is True, the returned JSON
       has the following format:
@@ -124,16 +129,28 @@ def route_search():
     # Retrieve the jobs and display or return them #
     ################################################
 
-    (query, LD_jobs, nbr_total_jobs) = search_request(
-        current_user,
-        request.args,
-        # The default pagination parameters are different whether or not a JSON response is requested.
-        # This is because we are using `want_json=True` along with no pagination arguments for a special
-        # case when we want to retrieve all the jobs in the dashboard for a given user.
-        # There is a certain notion with `want_json` that we are retrieving the data for the purposes
-        # of listing them exhaustively, and not just for displaying them with scroll bars in some HTML page.
-        force_pagination=not want_json,
-    )
+    try:
+        (query, LD_jobs, nbr_total_jobs) = search_request(
+            current_user,
+            request.args,
+            # The default pagination parameters are different whether or not a JSON response is requested.
+            # This is because we are using `want_json=True` along with no pagination arguments for a special
+            # case when we want to retrieve all the jobs in the dashboard for a given user.
+            # There is a certain notion with `want_json` that we are retrieving the data for the purposes
+            # of listing them exhaustively, and not just for displaying them with scroll bars in some HTML page.
+            force_pagination=not want_json,
+        )
+    except InvalidCursorError:
+        if want_json:
+            return jsonify(gettext("Invalid cursor.")), 400  # Bad Request
+        return (
+            render_template_with_user_settings(
+                "error.html",
+                error_msg=gettext("Invalid cursor."),
+                previous_request_args={},
+            ),
+            400,  # Bad Request
+        )
 
     LD_jobs = [strip_artificial_fields_from_job(D_job) for D_job in LD_jobs]
 
@@ -141,12 +158,23 @@ def route_search():
         # If requested, return the list as JSON
         if query.want_count:
             # If the number of all the jobs is requested, return the jobs list
-            # and the number of jobs
-            return {"jobs": LD_jobs, "nbr_total_jobs": nbr_total_jobs}
+            # and the number of jobs, along with the cursor of the next page
+            response = jsonify(
+                {
+                    "jobs": LD_jobs,
+                    "nbr_total_jobs": nbr_total_jobs,
+                    "next_cursor": query.next_cursor,
+                }
+            )
 
         else:
             # Otherwise, only the jobs list is returned
-            return jsonify(LD_jobs)
+            response = jsonify(LD_jobs)
+
+        # The cursor to provide in order to get the next page, if any
+        if query.next_cursor is not None:
+            response.headers["X-Next-Cursor"] = query.next_cursor
+        return response
     else:
         # Display the HTML page
         return render_template_with_user_settings(
@@ -0,0 +1,497 @@
+"""
+Declaration of the indexes of the Clockwork database, along with a catalogue
+of the query shapes sent by the web server and the scripts.
+
+The indexes are created by the `flask ensure-indexes` command, which can also
+explain each query shape in order to report the ones which are not served
+by an index (that is, those using a collection scan or an in-memory sort).
+"""
+
+from bson import ObjectId
+from pymongo import IndexModel
+
+from clockwork_web.core.jobs_helper import (
+    JOBS_SORT_FIELDS,
+    get_filter_after_cursor,
+    get_jobs_sorting,
+)
+
+# Indexes of each collection.
+#
+# Most sorts of the jobs list use "slurm.job_id" (ascending) as secondary
+# key, whatever the direction of the primary key. As an index can only be
+# read backwards when the directions of all its keys are reversed, each of
+# these sorts needs an index per direction.
+INDEXES = {
+    "jobs": [
+        # Used by the ingestion of the jobs, and by the job pages
+        IndexModel(
+            [("slurm.job_id", 1), ("slurm.cluster_name", 1)],
+            name="job_id_and_cluster_name",
+        ),
+        IndexModel(
+            [("slurm.submit_time", -1), ("slurm.job_id", 1)],
+            name="submit_time_desc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.submit_time", 1), ("slurm.job_id", 1)],
+            name="submit_time_asc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.start_time", -1), ("slurm.job_id", 1)],
+            name="start_time_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.start_time", 1), ("slurm.job_id", 1)],
+            name="start_time_asc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.end_time", -1), ("slurm.job_id", 1)],
+            name="end_time_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.end_time", 1), ("slurm.job_id", 1)],
+            name="end_time_asc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.job_state", 1), ("slurm.job_id", 1)],
+            name="job_state_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.job_state", -1), ("slurm.job_id", 1)],
+            name="job_state_desc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.cluster_name", 1), ("slurm.job_id", 1)],
+            name="cluster_name_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.cluster_name", -1), ("slurm.job_id", 1)],
+            name="cluster_name_desc_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.name", 1), ("slurm.job_id", 1)],
+            name="name_and_job_id",
+        ),
+        IndexModel(
+            [("slurm.name", -1), ("slurm.job_id", 1)],
+            name="name_desc_and_job_id",
+        ),
+        IndexModel(
+            [("cw.mila_email_username", 1), ("slurm.job_id", 1)],
+            name="user_and_job_id",
+        ),
+        IndexModel(
+            [("cw.mila_email_username", -1), ("slurm.job_id", 1)],
+            name="user_desc_and_job_id",
+        ),
+        # Jobs of a user, as listed on the dashboard
+        IndexModel(
+            [
+                ("cw.mila_email_username", 1),
+                ("slurm.submit_time", -1),
+                ("slurm.job_id", 1),
+            ],
+            name="user_and_submit_time",
+        ),
+        IndexModel(
+            [
+                ("slurm.array_job_id", 1),
+                ("slurm.submit_time", -1),
+                ("slurm.job_id", 1),
+            ],
+            name="array_job_id_and_submit_time",
+        ),
+        # Used by the cleanup, archive and cluster status scripts
+        IndexModel([("cw.last_slurm_update", 1)], name="last_slurm_update"),
+        IndexModel(
+            [("cw.mila_email_username", 1), ("cw.last_slurm_update", -1)],
+            name="user_and_last_slurm_update",
+        ),
+        IndexModel(
+            [("slurm.cluster_name", 1), ("cw.last_slurm_update", -1)],
+            name="cluster_name_and_last_slurm_update",
+        ),
+    ],
+    "nodes": [
+        IndexModel(
+            [("slurm.name", 1), ("slurm.cluster_name", 1)],
+            name="name_and_cluster_name",
+        ),
+        IndexModel([("cw.last_slurm_update", 1)], name="last_slurm_update"),
+    ],
+    "users": [
+        IndexModel([("mila_email_username", 1)], name="users_email_index"),
+    ],
+    "gpu": [
+        IndexModel([("name", 1)], name="gpu_name"),
+        IndexModel([("cw_name", 1)], name="gpu_cw_name"),
+    ],
+    "job_user_props": [
+        IndexModel(
+            [("mila_email_username", 1), ("job_id", 1), ("cluster_name", 1)],
+            name="job_user_props_index",
+        ),
+        # Used when the props of deleted jobs are removed
+        IndexModel(
+            [("job_id", 1), ("cluster_name", 1)],
+            name="job_user_props_job_id_and_cluster_name",
+        ),
+    ],
+    "cluster_status": [
+        IndexModel(
+            [("cluster_name", 1), ("jobs_are_old", 1), ("cluster_has_error", 1)],
+            name="cluster_status_index",
+        ),
+        # Used to check whether the statuses have been updated
+        IndexModel([("last_update", -1)], name="cluster_status_last_update"),
+    ],
+}
+
+# Example values of the sort fields of the jobs, used in the cursors
+# of the query shapes (see get_jobs_sorting_query_shapes)
+_JOBS_SORT_EXAMPLE_VALUES = {
+    "cluster_name": "mila",
+    "user": "student00@mila.quebec",
+    "job_id": "1000",
+    "name": "job_name",
+    "job_state": "RUNNING",
+    "submit_time": 1680000000,
+    "start_time": 1680000000,
+    "end_time": 1680000000,
+}
+
+
+def get_jobs_sorting_query_shapes():
+    """
+    Build the query shapes of the jobs list, for each field and direction
+    accepted by get_jobs_sorting: from the first page, and after a cursor
+    (see get_filter_after_cursor) whose sort value is set or missing.
+
+    Returns:
+        A list of query shapes, as found in QUERY_SHAPES
+    """
+    L_query_shapes = []
+    for sort_by in JOBS_SORT_FIELDS:
+        for sort_asc in (1, -1):
+            sorting = [tuple(s) for s in get_jobs_sorting(sort_by, sort_asc)]
+            direction = "ascending" if sort_asc == 1 else "descending"
+            L_filters = [(f"jobs sorted by {sort_by} ({direction})", {})]
+            # (The cursors of the sort by job ID only use the job ID)
+            L_values = [_JOBS_SORT_EXAMPLE_VALUES[sort_by]]
+            if sort_by != "job_id":
+                L_values.append(None)
+            for value in L_values:
+                D_cursor = {
+                    "sort_by": sort_by,
+                    "sort_asc": sort_asc,
+                    "value": value,
+                    "job_id": "1000",
+                }
+                L_filters.append(
+                    (
+                        f"jobs after a cursor"
+                        f"{'' if value is not None else ' without value'}, "
+                        f"sorted by {sort_by} ({direction})",
+                        get_filter_after_cursor(D_cursor),
+                    )
+                )
+            for name, D_filter in L_filters:
+                L_query_shapes.append(
+                    {
+                        "name": name,
+                        "collection": "jobs",
+                        "filter": D_filter,
+                        "sort": sorting,
+                        "limit": 25,
+                    }
+                )
+    return L_query_shapes
+
+
+# Shapes of the queries sent to the database. Only the fields and operators
+# of the filters matter: their values are examples.
+QUERY_SHAPES = [
+    # clockwork_web.core.jobs_helper.get_filtered_and_paginated_jobs,
+    # with each of the sorts proposed on the jobs pages
+    *get_jobs_sorting_query_shapes(),
+    # clockwork_web.core.jobs_helper.get_global_filter
+    {
+        "name": "jobs of a user",
+        "collection": "jobs",
+        "filter": {"cw.mila_email_username": "student00@mila.quebec"},
+        "sort": [("slurm.submit_time", -1), ("slurm.job_id", 1)],
+        "limit": 25,
+    },
+    {
+        "name": "jobs of some clusters",
+        "collection": "jobs",
+        "filter": {"slurm.cluster_name": {"$in": ["mila", "narval"]}},
+        "sort": [("slurm.submit_time", -1), ("slurm.job_id", 1)],
+        "limit": 25,
+    },
+    {
+        "name": "jobs in some states",
+        "collection": "jobs",
+        "filter": {"slurm.job_state": {"$in": ["RUNNING", "PENDING"]}},
+        "sort": [("slurm.submit_time", -1), ("slurm.job_id", 1)],
+        "limit": 25,
+    },
+    {
+        "name": "jobs from their ids",
+        "collection": "jobs",
+        "filter": {"slurm.job_id": {"$in": ["1000", "1001"]}},
+    },
+    {
+        "name": "jobs of a job array",
+        "collection": "jobs",
+        "filter": {"slurm.array_job_id": "1000"},
+        "sort": [("slurm.submit_time", -1), ("slurm.job_id", 1)],
+        "limit": 25,
+    },
+    # slurm_state.mongo_update
+    {
+        "name": "job from its id and cluster",
+        "collection": "jobs",
+        "filter": {"slurm.job_id": "1000", "slurm.cluster_name": "mila"},
+    },
+    # scripts/archive_stale_data.py and scripts/cleanup_jobs.py
+    {
+        "name": "jobs not updated since a date",
+        "collection": "jobs",
+        "filter": {"cw.last_slurm_update": {"$lt": 1700000000}},
+    },
+    {
+        "name": "batch of jobs not updated since a date",
+        "collection": "jobs",
+        "filter": {
+            "cw.last_slurm_update": {"$lt": 1700000000},
+            "_id": {"$gt": ObjectId("000000000000000000000000")},
+        },
+        "sort": [("_id", 1)],
+        "limit": 1000,
+    },
+    {
+        "name": "jobs sorted by last update",
+        "collection": "jobs",
+        "filter": {},
+        "sort": [("cw.last_slurm_update", -1)],
+    },
+    {
+        "name": "jobs of users sorted by last update",
+        "collection": "jobs",
+        "filter": {"cw.mila_email_username": {"$in": ["student00@mila.quebec"]}},
+        "sort": [("cw.mila_email_username", 1), ("cw.last_slurm_update", -1)],
+    },
+    # scripts/update_clusters_status.py
+    {
+        "name": "last updated job of a cluster",
+        "collection": "jobs",
+        "filter": {"slurm.cluster_name": "mila"},
+        "sort": [("cw.last_slurm_update", -1)],
+        "limit": 1,
+    },
+    # clockwork_web.core.nodes_helper.get_nodes
+    {
+        "name": "nodes",
+        "collection": "nodes",
+        "filter": {},
+        "sort": [("slurm.name", 1), ("slurm.cluster_name", 1)],
+        "limit": 25,
+    },
+    {
+        "name": "node from its name and cluster",
+        "collection": "nodes",
+        "filter": {"slurm.name": "cn-a001", "slurm.cluster_name": "mila"},
+        "sort": [("slurm.name", 1), ("slurm.cluster_name", 1)],
+    },
+    {
+        "name": "batch of nodes not updated since a date",
+        "collection": "nodes",
+        "filter": {
+            "cw.last_slurm_update": {"$lt": 1700000000},
+            "_id": {"$gt": ObjectId("000000000000000000000000")},
+        },
+        "sort": [("_id", 1)],
+        "limit": 1000,
+    },
+    # clockwork_web.core.users_helper and the authentication
+    {
+        "name": "user from its email",
+        "collection": "users",
+        "filter": {"mila_email_username": "student00@mila.quebec"},
+    },
+    {
+        "name": "users sorted by email",
+        "collection": "users",
+        "filter": {},
+        "sort": [("mila_email_username", 1)],
+    },
+    # clockwork_web.core.gpu_helper
+    {
+        "name": "GPU from its Clockwork name",
+        "collection": "gpu",
+        "filter": {"cw_name": "a100"},
+    },
+    # clockwork_web.core.job_user_props_helper and jobs_helper
+    {
+        "name": "user props of a job",
+        "collection": "job_user_props",
+        "filter": {
+            "job_id": "1000",
+            "cluster_name": "mila",
+            "mila_email_username": "student00@mila.quebec",
+        },
+    },
+    {
+        "name": "user props of listed jobs",
+        "collection": "job_user_props",
+        "filter": {
+            "job_id": {"$in": ["1000", "1001"]},
+            "mila_email_username": "student00@mila.quebec",
+        },
+    },
+    {
+        "name": "user props of deleted jobs",
+        "collection": "job_user_props",
+        "filter": {"job_id": "1000", "cluster_name": "mila"},
+    },
+    # clockwork_web.core.users_helper._load_clusters_with_status
+    {
+        "name": "statuses of the clusters",
+        "collection": "cluster_status",
+        "filter": {"cluster_name": {"$in": ["mila", "narval"]}},
+    },
+    # clockwork_web.core.users_helper.get_last_cluster_status_update
+    {
+        "name": "last updated cluster status",
+        "collection": "cluster_status",
+        "filter": {},
+        "sort": [("last_update", -1)],
+        "limit": 1,
+    },
+]
+
+# Stages of a query plan which are reported, along with their explanation
+PLAN_ISSUES = {
+    "COLLSCAN": "collection scan",
+    "SORT": "in-memory sort",
+}
+
+
+def _get_index_key(D_index):
+    """
+    Get the key of an index as a list of (field, direction) tuples,
+    from its description given by index_information() or IndexModel.document.
+    """
+    return [
+        (field, int(direction) if isinstance(direction, float) else direction)
+        for (field, direction) in dict(D_index["key"]).items()
+    ]
+
+
+def ensure_indexes(db, drop_conflicting=False):
+    """
+    Create the indexes of INDEXES which do not exist yet.
+
+    An index is considered as existing if an index with the same key exists,
+    even with another name. An index with the same name but another key
+    conflicts with the declared one. It is left as is, unless drop_conflicting
+    is True, in which case it is replaced by the declared one.
+
+    Parameters:
+        db                  The database in which the indexes are created
+        drop_conflicting    Whether or not the conflicting indexes are replaced
+
+    Returns:
+        A list of tuples (collection name, index name, status), where the
+        status is "created", "exists", "conflict" or "replaced"
+    """
+    L_results = []
+    for collection_name, L_indexes in INDEXES.items():
+        collection = db[collection_name]
+        D_existing_keys = {
+            name: _get_index_key(D_index)
+            for (name, D_index) in collection.index_information().items()
+        }
+
+        for index in L_indexes:
+            name = index.document["name"]
+            key = _get_index_key(index.document)
+
+            if key in D_existing_keys.values():
+                status = "exists"
+            elif name in D_existing_keys:
+                if not drop_conflicting:
+                    L_results.append((collection_name, name, "conflict"))
+                    continue
+                collection.drop_index(name)
+                status = "replaced"
+            else:
+                status = "created"
+
+            if status != "exists":
+                collection.create_indexes([index])
+                D_existing_keys[name] = key
+            L_results.append((collection_name, name, status))
+
+    return L_results
+
+
+def get_plan_stages(D_plan):
+    """
+    List the stages of a query plan, as found in the output of explain().
+
+    Parameters:
+        D_plan      A query plan (or a part of it), containing its stage in
+                    "stage" and its input stages in fields such as "inputStage",
+                    "inputStages" or "queryPlan" (for the slot-based engine)
+
+    Returns:
+        The list of the names of the stages, from the root of the plan
+    """
+    L_stages = []
+    if isinstance(D_plan, dict):
+        if "stage" in D_plan:
+            L_stages.append(D_plan["stage"])
+        for v in D_plan.values():
+            L_stages.extend(get_plan_stages(v))
+    elif isinstance(D_plan, list):
+        for v in D_plan:
+            L_stages.extend(get_plan_stages(v))
+    return L_stages
+
+
+def explain_query_shape(db, D_query_shape):
+    """
+    Explain a query shape of QUERY_SHAPES.
+
+    Returns:
+        A dictionary containing the name of the query shape under "name",
+        the stages of its winning plan under "stages", and the explanations
+        of the stages listed in PLAN_ISSUES it contains under "issues"
+    """
+    cursor = db[D_query_shape["collection"]].find(D_query_shape["filter"])
+    if D_query_shape.get("sort"):
+        cursor = cursor.sort(D_query_shape["sort"])
+    if D_query_shape.get("limit"):
+        cursor = cursor.limit(D_query_shape["limit"])
+
+    L_stages = get_plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+    return {
+        "name": D_query_shape["name"],
+        "stages": L_stages,
+        "issues": [PLAN_ISSUES[stage] for stage in L_stages if stage in PLAN_ISSUES],
+    }
+
+
+def explain_query_shapes(db, L_query_shapes=None):
+    """
+    Explain the query shapes, by default those of QUERY_SHAPES.
+
+    Returns:
+        A list of the results of explain_query_shape, one per query shape
+    """
+    if L_query_shapes is None:
+        L_query_shapes = QUERY_SHAPES
+    return [explain_query_shape(db, D_query_shape) for D_query_shape in L_query_shapes]
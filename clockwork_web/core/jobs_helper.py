@@ -3,6 +3,8 @@ This file contains a lot of arbitrary decisions that could change in the future.
 """
 
 from collections import defaultdict
+import base64
+import json
 import re
 import time
 
@@ -11,6 +13,10 @@ from flask_login import current_user
 from ..db import get_db
 
 
+class InvalidCursorError(ValueError):
+    """Exception raised when a cursor of the jobs list cannot be read."""
+
+
 def get_filter_cluster_name(cluster_name):
     if cluster_name is None:
         return {}
@@ -90,6 +96,7 @@ def get_filtered_and_paginated_jobs(
     want_count=False,
     sort_by="submit_time",
     sort_asc=-1,
+    cursor=None,
 ):
     """
     Talk to the database and get the information.
@@ -106,6 +113,9 @@ def get_filtered_and_paginated_jobs(
                                 defined.
         sort_asc                Whether or not to sort in ascending order (1)
                                 or descending order (-1).
+        cursor                  Position, as returned by decode_jobs_cursor, after
+                                which the jobs are listed. If set, it replaces
+                                nbr_skipped_items.
 
     Returns:
         Returns a tuple (jobs_list, jobs_count or None).
@@ -130,29 +140,19 @@ def get_filtered_and_paginated_jobs(
     mc = get_db()
     # Get the jobs from it
     if nbr_skipped_items != None and nbr_items_to_display:
-        # Check sorting parameters
-        assert sort_by in {
-            "cluster_name",
-            "user",
-            "job_id",
-            "name",  # job name
-            "job_state",
-            "submit_time",
-            "start_time",
-            "end_time",
-        }
-        assert sort_asc in (-1, 1)
-        # Set sorting
-        if sort_by == "user":
-            sorting = [["cw.mila_email_username", sort_asc]]
+        sorting = get_jobs_sorting(sort_by, sort_asc)
+        if cursor is not None:
+            # Keyset pagination: the page starts right after the cursor,
+            # so that no job has to be skipped
+            page_filter = combine_all_mongodb_filters(
+                mongodb_filter, get_filter_after_cursor(cursor)
+            )
+            nbr_skipped_items = 0
         else:
-            sorting = [[f"slurm.{sort_by}", sort_asc]]
-        # Is sorting is not by job_id, add supplementary sorting
-        if sort_by != "job_id":
-            sorting.append(["slurm.job_id", 1])
+            page_filter = mongodb_filter
         LD_jobs = list(
             mc["jobs"]
-            .find(mongodb_filter)
+            .find(page_filter)
             .sort(sorting)
             .skip(nbr_skipped_items)
             .limit(nbr_items_to_display)
@@ -224,6 +224,150 @@ def get_filtered_and_paginated_jobs(
     return (LD_jobs, nbr_total_jobs)
 
 
+# Fields by which the jobs can be sorted (see get_jobs_sorting)
+JOBS_SORT_FIELDS = (
+    "cluster_name",
+    "user",
+    "job_id",
+    "name",  # job name
+    "job_state",
+    "submit_time",
+    "start_time",
+    "end_time",
+)
+
+
+def get_jobs_sorting(sort_by, sort_asc):
+    """
+    Get the sorting of the jobs, which is completed by their job ID, so that
+    the jobs are always listed in the same order.
+
+    Parameters:
+        sort_by     Field to sort jobs
+        sort_asc    Whether or not to sort in ascending order (1)
+                    or descending order (-1).
+
+    Returns:
+        A list of [field, direction] lists, as expected by pymongo
+    """
+    # Check sorting parameters
+    assert sort_by in JOBS_SORT_FIELDS
+    assert sort_asc in (-1, 1)
+    # Set sorting
+    if sort_by == "user":
+        sorting = [["cw.mila_email_username", sort_asc]]
+    else:
+        sorting = [[f"slurm.{sort_by}", sort_asc]]
+    # Is sorting is not by job_id, add supplementary sorting
+    if sort_by != "job_id":
+        sorting.append(["slurm.job_id", 1])
+    return sorting
+
+
+def encode_jobs_cursor(D_job, sort_by, sort_asc):
+    """
+    Build the cursor pointing after a job, for a given sorting.
+
+    The cursor is an opaque string, which contains the sorting
+    and the values of the sort keys of the job.
+
+    Parameters:
+        D_job       The last job of a page
+        sort_by     Field used to sort the jobs
+        sort_asc    Whether the jobs are sorted in ascending order (1)
+                    or descending order (-1).
+
+    Returns:
+        The cursor, to provide to decode_jobs_cursor in order to
+        retrieve the next page
+    """
+    ((field, _), *_) = get_jobs_sorting(sort_by, sort_asc)
+    value = D_job
+    for k in field.split("."):
+        value = value.get(k, None) if isinstance(value, dict) else None
+    D_cursor = {
+        "sort_by": sort_by,
+        "sort_asc": sort_asc,
+        "value": value,
+        "job_id": D_job["slurm"]["job_id"],
+    }
+    return base64.urlsafe_b64encode(json.dumps(D_cursor).encode("utf-8")).decode(
+        "ascii"
+    )
+
+
+def decode_jobs_cursor(cursor, sort_by, sort_asc):
+    """
+    Read a cursor built by encode_jobs_cursor.
+
+    Parameters:
+        cursor      The cursor to read
+        sort_by     Field used to sort the jobs
+        sort_asc    Whether the jobs are sorted in ascending order (1)
+                    or descending order (-1).
+
+    Returns:
+        A dictionary containing the sorting ("sort_by" and "sort_asc"), the "value"
+        of the sort field and the "job_id" of the last job of the previous page
+
+    Raises:
+        InvalidCursorError if the cursor is invalid, or if it has been built
+        for another sorting
+    """
+    try:
+        D_cursor = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not (
+            D_cursor["sort_by"] == sort_by
+            and D_cursor["sort_asc"] == sort_asc
+            and isinstance(D_cursor["job_id"], str)
+            # The value is inserted in the MongoDB filter, so that anything
+            # else than a scalar (such as {"$ne": None}) is rejected
+            and isinstance(D_cursor["value"], (type(None), str, int, float, bool))
+        ):
+            raise ValueError()
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise InvalidCursorError("Invalid cursor.")
+    return D_cursor
+
+
+def get_filter_after_cursor(D_cursor):
+    """
+    Set up a filter for MongoDB in order to select the jobs listed after
+    a cursor, for the sorting of the cursor (see get_jobs_sorting).
+
+    The filter is a range on the sort field, which can be served by the
+    index on the sort field and the job ID. The jobs sharing the value of
+    the sort field of the cursor are excluded up to its job ID. MongoDB sorts
+    the jobs without a value (None or missing) before all the others.
+
+    Parameters:
+        D_cursor    The cursor, as returned by decode_jobs_cursor
+
+    Returns:
+        The filter to combine with the filter of the listed jobs
+    """
+    ((field, sort_asc), *_) = get_jobs_sorting(
+        D_cursor["sort_by"], D_cursor["sort_asc"]
+    )
+    (value, job_id) = (D_cursor["value"], D_cursor["job_id"])
+
+    if field == "slurm.job_id":
+        return {field: {"$gt" if sort_asc == 1 else "$lt": job_id}}
+
+    after_ties = {"$nor": [{field: value, "slurm.job_id": {"$lte": job_id}}]}
+    if value is None:
+        if sort_asc == 1:
+            # All the jobs with a value come after the cursor
+            return after_ties
+        # Only the jobs without a value come after the cursor
+        return {field: None, "slurm.job_id": {"$gt": job_id}}
+
+    if sort_asc == 1:
+        return {"$and": [{field: {"$gte": value}}, after_ties]}
+    # The jobs without a value are matched as well
+    return {"$and": [{field: {"$not": {"$gt": value}}}, after_ties]}
+
+
 def get_global_filter(
     username=None, job_ids=[], cluster_names=None, job_states=[], job_array=None
 ):
@@ -292,6 +436,7 @@ def get_jobs(
     job_array=None,
     user_prop_name=None,
     user_prop_content=None,
+    cursor=None,
 ):
     """
     Set up the filters according to the parameters and retrieve the requested jobs from the database.
@@ -311,6 +456,8 @@ def get_jobs(
         job_array               ID of job array in which we look for jobs.
         user_prop_name          name of user prop (string) we must find in jobs to look for.
         user_prop_content       content of user prop (string) we must find in jobs to look for.
+        cursor                  Position, as returned by decode_jobs_cursor, after which the jobs
+                                are listed (instead of skipping nbr_skipped_items jobs)
 
     Returns:
         A tuple containing:
@@ -354,7 +501,63 @@ def get_jobs(
         want_count=want_count,
         sort_by=sort_by,
         sort_asc=sort_asc,
+        cursor=cursor,
+    )
+
+
+def get_jobs_statistics_per_cluster(cluster_names):
+    """
+    Count the jobs of each cluster, and get the oldest and latest
+    modification dates of their jobs, with a single aggregation.
+
+    Parameters:
+        cluster_names   List of the names of the clusters to consider
+
+    Returns:
+        A dictionary associating each cluster name to a dictionary containing
+        "nb_jobs" and, if at least one of its jobs has a "cw.last_slurm_update",
+        "job_dates" (a dictionary containing the "min" and "max" of these dates)
+    """
+    pipeline = [
+        {"$match": {"slurm.cluster_name": {"$in": cluster_names}}},
+        {
+            "$group": {
+                "_id": "$slurm.cluster_name",
+                "nb_jobs": {"$sum": 1},
+                "min": {"$min": "$cw.last_slurm_update"},
+                "max": {"$max": "$cw.last_slurm_update"},
+            }
+        },
+    ]
+    D_statistics = {cluster_name: {"nb_jobs": 0} for cluster_name in cluster_names}
+    for D_group in get_db()["jobs"].aggregate(pipeline):
+        D_cluster_statistics = D_statistics[D_group["_id"]]
+        D_cluster_statistics["nb_jobs"] = D_group["nb_jobs"]
+        if D_group["min"] is not None:
+            D_cluster_statistics["job_dates"] = {
+                "min": D_group["min"],
+                "max": D_group["max"],
+            }
+    return D_statistics
+
+
+def get_last_jobs_update():
+    """
+    Get the most recent "cw.last_slurm_update" of the jobs, which changes
+    each time jobs are ingested. It is served by the index on this field.
+
+    Returns:
+        The timestamp of the last update, or None if no job has been updated
+    """
+    LD_jobs = list(
+        get_db()["jobs"]
+        .find({}, {"_id": 0, "cw.last_slurm_update": 1})
+        .sort([("cw.last_slurm_update", -1)])
+        .limit(1)
     )
+    if not LD_jobs:
+        return None
+    return LD_jobs[0].get("cw", {}).get("last_slurm_update", None)
 
 
 def strip_artificial_fields_from_job(D_job):
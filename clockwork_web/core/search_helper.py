@@ -1,7 +1,12 @@
 from types import SimpleNamespace
 
 from clockwork_web.core.clusters_helper import get_all_clusters
-from clockwork_web.core.jobs_helper import get_inferred_job_states, get_jobs
+from clockwork_web.core.jobs_helper import (
+    decode_jobs_cursor,
+    encode_jobs_cursor,
+    get_inferred_job_states,
+    get_jobs,
+)
 from clockwork_web.core.utils import (
     get_custom_array_from_request_args,
     to_boolean,
@@ -14,6 +19,8 @@ def parse_search_request(user, args, force_pagination=True):
     user: The current user.
     args: A reference to request.args.
     force_pagination: Whether to force pagination or not.
+
+    Raises an InvalidCursorError if the "cursor" argument is invalid.
     """
     from clockwork_web.core.pagination_helper import get_pagination_values
 
@@ -61,6 +68,11 @@ def parse_search_request(user, args, force_pagination=True):
             # Default value of sort_asc is descending otherwise
             sort_asc = -1
 
+    # The cursor returned with the previous page, if any
+    cursor = args.get("cursor", type=str, default=None) or None
+    if cursor is not None:
+        cursor = decode_jobs_cursor(cursor, sort_by, sort_asc)
+
     query = SimpleNamespace(
         username=args.get("username"),
         cluster_name=cluster_names,
@@ -71,6 +83,7 @@ def parse_search_request(user, args, force_pagination=True):
         pagination_nbr_items_per_page=args.get("nbr_items_per_page", type=int),
         sort_by=sort_by,
         sort_asc=sort_asc,
+        cursor=cursor,
         want_count=want_count,
         job_array=job_array,
         user_prop_name=user_prop_name,
@@ -85,6 +98,7 @@ def parse_search_request(user, args, force_pagination=True):
         not force_pagination
         and not query.pagination_page_num
         and not query.pagination_nbr_items_per_page
+        and not query.cursor
     ):
         # In this particular case, we set the default pagination arguments to be `None`,
         # which will effectively disable pagination.
@@ -94,6 +108,7 @@ def parse_search_request(user, args, force_pagination=True):
         # Otherwise (ie if at least one of the pagination parameters is provided),
         # we assume that a pagination is expected from the user. Then, the pagination helper
         # is used to define the number of elements to skip, and the number of elements to display
+        # (When a cursor is provided, the page starts after it and nothing is skipped)
         (query.nbr_skipped_items, query.nbr_items_to_display) = get_pagination_values(
             user.mila_email_username,
             query.pagination_page_num,
@@ -104,7 +119,16 @@ def parse_search_request(user, args, force_pagination=True):
 
 
 def search_request(user, args, force_pagination=True):
+    """Retrieve the jobs of a search request.
+
+    The cursor pointing after the last returned job is stored in
+    `query.next_cursor`. It is None if there is no pagination, or if
+    the page is not full (so that there is no next page).
+
+    Raises an InvalidCursorError if the "cursor" argument is invalid.
+    """
     query = parse_search_request(user, args, force_pagination=force_pagination)
+    query.next_cursor = None
 
     username = None
     if not user.is_admin() and query.username and query.username != user.get_id():
@@ -127,5 +151,10 @@ def search_request(user, args, force_pagination=True):
         job_array=query.job_array,
         user_prop_name=query.user_prop_name,
         user_prop_content=query.user_prop_content,
+        cursor=query.cursor,
     )
+
+    if query.nbr_items_to_display and len(jobs) == query.nbr_items_to_display:
+        query.next_cursor = encode_jobs_cursor(jobs[-1], query.sort_by, query.sort_asc)
+
     return (query, jobs, nbr_total_jobs)
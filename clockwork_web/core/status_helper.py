@@ -0,0 +1,80 @@
+"""
+Helper functions related to the status of the server, as presented on the
+status page and on the clusters pages.
+"""
+
+import time
+
+from clockwork_web.config import get_config, register_config
+from clockwork_web.core.clusters_helper import get_all_clusters
+from clockwork_web.core.jobs_helper import (
+    get_jobs_statistics_per_cluster,
+    get_last_jobs_update,
+)
+from clockwork_web.core.users_helper import get_users_statistics
+
+# Maximum number of seconds during which a worker process reuses the statistics
+# of the server (see get_server_status). They are computed again before that
+# if jobs have been ingested in the meantime. 0 disables the cache.
+register_config("settings.server_status_cache_ttl", 60, validator=int)
+
+# Statistics of the server computed by the current process, in a tuple
+# (expiration time, last jobs update when they were computed, statistics)
+_server_status = (0, None, None)
+
+
+def _compute_server_status():
+    """
+    Compute the statistics of the server, with one aggregation
+    on the users and one on the jobs.
+    """
+    D_all_clusters = get_all_clusters()
+    D_jobs_statistics = get_jobs_statistics_per_cluster(list(D_all_clusters))
+
+    clusters = {
+        cluster_name: {
+            "display_order": D_cluster["display_order"],
+            **D_jobs_statistics[cluster_name],
+        }
+        for (cluster_name, D_cluster) in D_all_clusters.items()
+    }
+
+    return {
+        **get_users_statistics(),
+        "clusters": clusters or None,
+    }
+
+
+def get_server_status():
+    """
+    Get the statistics of the server:
+    - the number of users, of enabled users, and of users having a DRAC account
+    - for each cluster, its number of jobs and the oldest and latest
+      modification dates of its jobs
+
+    The statistics are kept by the current process for at most
+    settings.server_status_cache_ttl seconds, and computed again
+    as soon as jobs have been ingested.
+
+    The returned dictionary is shared, and thus must not be modified.
+
+    Returns:
+        A dictionary containing "nb_users", "nb_enabled_users", "nb_drac_users"
+        and "clusters". The latter associates each cluster name to a dictionary
+        containing "display_order", "nb_jobs" and (if the cluster has jobs)
+        "job_dates", a dictionary containing the "min" and "max" dates. It is
+        None if no cluster is configured.
+    """
+    global _server_status
+
+    now = time.monotonic()
+    last_jobs_update = get_last_jobs_update()
+    (expiration_time, cached_last_jobs_update, D_server_status) = _server_status
+    if expiration_time <= now or cached_last_jobs_update != last_jobs_update:
+        D_server_status = _compute_server_status()
+        _server_status = (
+            now + get_config("settings.server_status_cache_ttl"),
+            last_jobs_update,
+            D_server_status,
+        )
+    return D_server_status
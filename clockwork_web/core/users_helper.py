@@ -5,9 +5,12 @@ Helper functions related to the User entity and the users entries from the datab
 from datetime import datetime, timedelta
 from flask_login import current_user
 from flask_babel import gettext
-from flask import render_template
+from flask import render_template, current_app, g, has_app_context
 import json
 import re
+import threading
+import time
+from types import MappingProxyType
 
 from clockwork_web.db import get_db
 
@@ -30,6 +33,35 @@ from clockwork_web.core.utils import (
 register_config("settings.default_values.nbr_items_per_page", validator=int)
 register_config("settings.default_values.dark_mode", validator=valid_boolean)
 register_config("settings.default_values.language", validator=valid_string)
+# Number of seconds during which a worker process reuses the context of a user
+# (see get_user_context) instead of reading it from the database. The context
+# is only invalidated in the process which modifies the user, so this is also
+# how long the other processes can serve an outdated context. 0 disables the cache.
+register_config("settings.user_context_cache_ttl", 30, validator=int)
+
+# Number of seconds during which a worker process reuses the statuses of the
+# clusters (see get_clusters_with_status) without any request to the database.
+# The statuses are then only retrieved again if scripts/update_clusters_status.py
+# has updated them. 0 disables the cache.
+register_config("settings.cluster_status_cache_ttl", 60, validator=int)
+
+# Contexts of the users recently loaded by the current process, associating
+# the mila_email_username of each user to a tuple (expiration time, context)
+_user_contexts = {}
+_user_contexts_lock = threading.Lock()
+
+# Clusters along with their statuses, as loaded by the current process, in a
+# tuple (expiration time, last status update when they were loaded, clusters)
+_clusters_with_status = (0, None, None)
+_clusters_with_status_lock = threading.Lock()
+
+# Status of a cluster which has not been updated by scripts/update_clusters_status.py
+DEFAULT_CLUSTER_STATUS = MappingProxyType(
+    {
+        "jobs_are_old": False,
+        "cluster_has_error": False,
+    }
+)
 
 
 def get_default_web_settings_values():
@@ -115,6 +147,7 @@ def _set_web_setting(mila_email_username, setting_key, setting_value):
             },  # identify the element to update
             {"$set": {web_settings_key: setting_value}},  # update to do
         )
+        invalidate_user_context(mila_email_username)
 
         # (We use matched_count here instead of modified_count in order to not return
         # an error if the old value was just the same as the value we want to set)
@@ -260,16 +293,16 @@ def get_nbr_items_per_page(mila_email_username):
         The value of nbr_items_per_page from the user's settings if a user has been
         found; the default value of the number of items to display per page otherwise
     """
-    # Retrieve the user from mila_email_username
-    user = get_users_one(mila_email_username)
+    # Retrieve the context of the user from mila_email_username
+    D_context = get_user_context(mila_email_username)
 
-    if not user:
+    if not D_context:
         # If no user has been found, return the default value of the number of items
         # to display per page
         return get_default_setting_value("nbr_items_per_page")
     else:
         # If a user has been found, return the value stored in its settings
-        v = user.get("web_settings", {}).get("nbr_items_per_page", None)
+        v = D_context["web_settings"].get("nbr_items_per_page", None)
         if v is None:
             return get_default_setting_value("nbr_items_per_page")
         else:
@@ -315,6 +348,47 @@ def get_users():
     return list(users)
 
 
+def get_users_statistics():
+    """
+    Count the users, the enabled users and the users having a DRAC account
+    (that is, a valid value for the field "cc_account_username"), with a
+    single aggregation.
+
+    Returns:
+        A dictionary containing "nb_users", "nb_enabled_users" and "nb_drac_users"
+    """
+    pipeline = [
+        {
+            "$group": {
+                "_id": None,
+                "nb_users": {"$sum": 1},
+                "nb_enabled_users": {
+                    "$sum": {"$cond": [{"$eq": ["$status", "enabled"]}, 1, 0]}
+                },
+                "nb_drac_users": {
+                    "$sum": {
+                        "$cond": [
+                            {
+                                "$in": [
+                                    {"$ifNull": ["$cc_account_username", ""]},
+                                    ["", False],
+                                ]
+                            },
+                            0,
+                            1,
+                        ]
+                    }
+                },
+            }
+        },
+    ]
+    LD_groups = list(get_db()["users"].aggregate(pipeline))
+    D_statistics = {"nb_users": 0, "nb_enabled_users": 0, "nb_drac_users": 0}
+    if LD_groups:
+        D_statistics.update({k: LD_groups[0][k] for k in D_statistics})
+    return D_statistics
+
+
 def get_available_clusters_from_user_dict(D_user):
     """
     Retrieve the clusters a user can access.
@@ -413,11 +487,140 @@ def get_available_clusters_from_db(mila_email_username):
     Returns:
         A list of strings (these strings being the requested names of the clusters)
     """
-    # Retrieve the current user
-    D_user = get_users_one(mila_email_username)
+    # Retrieve the context of the current user, in which the available
+    # clusters have been computed from its user dictionary
+    D_context = get_user_context(mila_email_username)
+    if not D_context:
+        return []
+
+    return list(D_context["available_clusters"])
+
+
+def get_user_web_settings(web_settings):
+    """
+    Complete the web settings stored in a user dictionary with the default values
+    of the missing (or invalid) ones.
+
+    Parameters:
+        web_settings    The "web_settings" dictionary of a user. It is not modified
+
+    Returns:
+        A new dictionary containing all the web settings of the user
+    """
+    web_settings = {
+        k: v
+        for (k, v) in web_settings.items()
+        if k not in ["nbr_items_per_page", "dark_mode", "language"]
+        or is_correct_type_for_web_setting(k, v)
+    }
+    web_settings = get_default_web_settings_values() | web_settings
+    column_display = {
+        page_name: dict(D_columns)
+        for (page_name, D_columns) in web_settings.get("column_display", {}).items()
+    }
+    web_settings["column_display"] = column_display
+    # Force column "actions" to not be displayed in job tables.
+    column_display.setdefault("dashboard", {})["actions"] = False
+    column_display.setdefault("jobs_list", {})["actions"] = False
+    # By default, do not display column "job_user_props" in job tables.
+    column_display["jobs_list"].setdefault("job_user_props", False)
+    return web_settings
+
+
+def _load_user_context(mila_email_username):
+    """
+    Read a user from the database and build its context (see get_user_context).
+
+    Returns:
+        The context of the user, or None if there is not exactly one user
+        with this mila_email_username
+    """
+    LD_users = list(
+        get_db()["users"]
+        .find({"mila_email_username": mila_email_username}, {"_id": 0})
+        .limit(2)
+    )
+
+    # This is not an error from which we expect to be able to recover gracefully.
+    # It could happen if you copied data from your database directly
+    # using an external script, and ended up with many instances of your users.
+    # In that case, you might have other issues as well, so let's not even try
+    # to just return the first instance of that user (ignoring the rest),
+    # because that might hide more problems downstream.
+    if len(LD_users) > 1:
+        current_app.logger.error(
+            "Found several users with email %s. This can't happen.",
+            mila_email_username,
+        )
+        return None
+    elif len(LD_users) == 0:
+        return None
+
+    (D_user,) = LD_users
+    return {
+        "user": D_user,
+        "available_clusters": get_available_clusters_from_user_dict(D_user),
+        "web_settings": get_user_web_settings(D_user.get("web_settings", {})),
+    }
+
+
+def get_user_context(mila_email_username):
+    """
+    Retrieve the context of a user, which is a dictionary containing:
+        - "user": the user dictionary, as stored in the database
+        - "available_clusters": the names of the clusters the user can access
+        - "web_settings": the web settings of the user, completed with the default values
+
+    The context is loaded from the database at most once per request. It is also
+    kept by the current process for settings.user_context_cache_ttl seconds,
+    unless it is invalidated by a modification of the user (see invalidate_user_context).
+
+    The returned context is shared, and thus must not be modified.
+
+    Parameters:
+        mila_email_username     Element identifying the User in the users
+                                collection of the database
+
+    Returns:
+        The context of the user, or None if it has not been found
+    """
+    if mila_email_username is None:
+        return None
+
+    D_request_contexts = g.setdefault("user_contexts", {}) if has_app_context() else {}
+    if mila_email_username in D_request_contexts:
+        return D_request_contexts[mila_email_username]
+
+    ttl = get_config("settings.user_context_cache_ttl")
+    now = time.monotonic()
+    with _user_contexts_lock:
+        (expiration_time, D_context) = _user_contexts.get(
+            mila_email_username, (0, None)
+        )
+    if expiration_time <= now:
+        D_context = _load_user_context(mila_email_username)
+        # A missing user is not kept, as it may be added at any time
+        if D_context is not None and ttl > 0:
+            with _user_contexts_lock:
+                _user_contexts[mila_email_username] = (now + ttl, D_context)
+
+    D_request_contexts[mila_email_username] = D_context
+    return D_context
+
+
+def invalidate_user_context(mila_email_username):
+    """
+    Discard the context of a user, so that it is read again from the database
+    the next time it is needed. This must be called each time a user is modified.
 
-    # Retrieve the available clusters from it
-    return get_available_clusters_from_user_dict(D_user)
+    Parameters:
+        mila_email_username     Element identifying the User in the users
+                                collection of the database
+    """
+    with _user_contexts_lock:
+        _user_contexts.pop(mila_email_username, None)
+    if has_app_context():
+        g.get("user_contexts", {}).pop(mila_email_username, None)
 
 
 def enable_dark_mode(mila_email_username):
@@ -580,13 +783,9 @@ def render_template_with_user_settings(template_name_or_list, **context):
     # used for the actual `web_settings` variable from "base.html" (prompted by GEN-160)
     context["web_settings_json_str"] = json.dumps(context["web_settings"])
 
-    # Send the clusters infos to the template
-    # NB: get_all_clusters() seems to return the clusters dict itself
-    # from config, not a copy. So, any modification on clusters dict
-    # returned by this function will be propagated into config.
-    # As we don't want this behaviour here, we will make a copy
-    # of each cluster dict.
-    context["clusters"] = {k: v.copy() for k, v in get_all_clusters().items()}
+    # Send the clusters infos to the template, along with their statuses
+    # (if jobs are old and cluster has error)
+    context["clusters"] = get_clusters_with_status()
     # List clusters available for connected user,
     # or set an empty list for anon user.
     context["user_clusters"] = (
@@ -595,29 +794,92 @@ def render_template_with_user_settings(template_name_or_list, **context):
         else current_user.get_available_clusters()
     )
 
-    # Get cluster status (if jobs are old and cluster has error).
-    for cluster_name in context["clusters"]:
-        context["clusters"][cluster_name]["status"] = _get_cluster_status(cluster_name)
-
     return render_template(template_name_or_list, **context)
 
 
-def _get_cluster_status(cluster_name):
+def _load_clusters_with_status():
     """
-    Get cluster status from DB collection `cluster_status`.
+    Retrieve the statuses of all the clusters from DB collection `cluster_status`,
+    with a single query, and add them to the clusters of the configuration.
 
-    Collection should be updated from an independent script
-    (`scripts/update_clusters_status.py`) regularly.
-    """
-    mc = get_db()
-    statuses = list(mc["cluster_status"].find({"cluster_name": cluster_name}))
-    if statuses:
-        # Status found
-        (status,) = statuses
-        return status
-    else:
-        # No status found, return default values
-        return {
-            "jobs_are_old": False,
-            "cluster_has_error": False,
+    Returns:
+        The immutable view described in get_clusters_with_status
+    """
+    D_clusters = get_all_clusters()
+    D_statuses = {
+        D_status["cluster_name"]: D_status
+        for D_status in get_db()["cluster_status"].find(
+            {"cluster_name": {"$in": list(D_clusters)}}, {"_id": 0}
+        )
+    }
+    return MappingProxyType(
+        {
+            cluster_name: MappingProxyType(
+                {
+                    **D_cluster,
+                    "status": (
+                        MappingProxyType(D_statuses[cluster_name])
+                        if cluster_name in D_statuses
+                        else DEFAULT_CLUSTER_STATUS
+                    ),
+                }
+            )
+            for (cluster_name, D_cluster) in D_clusters.items()
         }
+    )
+
+
+def get_last_cluster_status_update():
+    """
+    Get the most recent "last_update" of the statuses of the clusters, which
+    changes each time scripts/update_clusters_status.py is run. It is served
+    by the index on this field.
+
+    Returns:
+        The timestamp of the last update, or None if no status has been updated
+    """
+    LD_statuses = list(
+        get_db()["cluster_status"]
+        .find({}, {"_id": 0, "last_update": 1})
+        .sort([("last_update", -1)])
+        .limit(1)
+    )
+    if not LD_statuses:
+        return None
+    return LD_statuses[0].get("last_update", None)
+
+
+def get_clusters_with_status():
+    """
+    Get the clusters of the configuration along with their status, as stored
+    in DB collection `cluster_status`.
+
+    Collection should be updated from an independent script
+    (`scripts/update_clusters_status.py`) regularly. The statuses are thus
+    kept by the current process for settings.cluster_status_cache_ttl seconds,
+    without any request to the database. Once this delay has expired, they are
+    only retrieved again if the script has updated them in the meantime.
+
+    Returns:
+        An immutable dictionary associating each cluster name to an immutable copy
+        of the cluster's information from the configuration, in which the "status"
+        key contains the "jobs_are_old" and "cluster_has_error" booleans
+    """
+    global _clusters_with_status
+
+    ttl = get_config("settings.cluster_status_cache_ttl")
+    if ttl <= 0:
+        return _load_clusters_with_status()
+
+    now = time.monotonic()
+    with _clusters_with_status_lock:
+        (expiration_time, cached_last_update, D_clusters) = _clusters_with_status
+    if expiration_time > now:
+        return D_clusters
+
+    last_update = get_last_cluster_status_update()
+    if D_clusters is None or cached_last_update != last_update:
+        D_clusters = _load_clusters_with_status()
+    with _clusters_with_status_lock:
+        _clusters_with_status = (now + ttl, last_update, D_clusters)
+    return D_clusters
@@ -1,44 +1,196 @@
-from pymongo import MongoClient
+import os
+import threading
+import time
+
+import click
+from pymongo import MongoClient, monitoring
 
 from flask import current_app
-from flask import g
 from flask.cli import with_appcontext
 
-from clockwork_web.config import get_config, register_config, string
+from clockwork_web.config import get_config, register_config, string, integer
 
 register_config("mongo.connection_string", validator=string)
 register_config("mongo.database_name", "clockwork", validator=string)
+# Connection pool of the MongoClient shared by all the requests of a worker process
+register_config("mongo.max_pool_size", 100, validator=integer)
+register_config("mongo.min_pool_size", 0, validator=integer)
+# 0 means that a request waits indefinitely for a connection to become available
+register_config("mongo.wait_queue_timeout_ms", 0, validator=integer)
+# 0 means that idle connections are never evicted from the pool
+register_config("mongo.max_idle_time_ms", 0, validator=integer)
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Count the connection pool events of a MongoClient, in order
+    to help sizing the number of web workers against MongoDB.
+
+    The duration of a checkout is measured between the "check out started"
+    and "checked out" (or "check out failed") events, which are emitted
+    by the thread requesting the connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {
+                "created": 0,  # Connections opened since the client creation
+                "closed": 0,  # Connections closed since the client creation
+                "checked_out": 0,  # Connections currently used by a thread
+                "max_checked_out": 0,  # Highest value reached by "checked_out"
+                "checkouts": 0,  # Successful checkouts
+                "checkout_failures": 0,  # Failed checkouts (e.g. wait queue timeout)
+                "wait_time_total": 0.0,  # Seconds spent waiting for a connection
+                "wait_time_max": 0.0,  # Longest wait for a connection, in seconds
+                "pool_cleared": 0,  # Times the pool was cleared after an error
+            }
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["wait_time_avg"] = (
+            stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        )
+        return stats
+
+    def _incr(self, key, value=1):
+        with self._lock:
+            self._counters[key] += value
+
+    def _end_wait(self):
+        started = getattr(self._local, "checkout_started", None)
+        self._local.checkout_started = None
+        return time.monotonic() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("closed")
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        self._end_wait()
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        wait_time = self._end_wait()
+        with self._lock:
+            c = self._counters
+            c["checkouts"] += 1
+            c["checked_out"] += 1
+            c["max_checked_out"] = max(c["max_checked_out"], c["checked_out"])
+            c["wait_time_total"] += wait_time
+            c["wait_time_max"] = max(c["wait_time_max"], wait_time)
+
+    def connection_checked_in(self, event):
+        self._incr("checked_out", -1)
+
+
+# The MongoClient shared by all the requests handled by the current process,
+# along with the pid of that process. A MongoClient is not fork-safe, so a
+# forked worker (e.g. gunicorn with --preload) has to create its own client.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_pool_stats = PoolStatsListener()
+
+
+def _create_client():
+    wait_queue_timeout_ms = get_config("mongo.wait_queue_timeout_ms")
+    max_idle_time_ms = get_config("mongo.max_idle_time_ms")
+    return MongoClient(
+        get_config("mongo.connection_string"),
+        maxPoolSize=get_config("mongo.max_pool_size"),
+        minPoolSize=get_config("mongo.min_pool_size"),
+        waitQueueTimeoutMS=wait_queue_timeout_ms or None,
+        maxIdleTimeMS=max_idle_time_ms or None,
+        event_listeners=[_pool_stats],
+    )
 
 
 def _get_db():
-    """Connect to the application's configured database.
+    """Get the MongoClient of the current process.
 
-    The connection is unique for each request and will be reused
-    if this is called again in the same request context.
+    The client (and thus its connection pool) is created once per
+    process and shared by all the requests it handles. If the process
+    has been forked since the client creation, a new client is created.
 
     Returns:
         MongoClient: a client to the mongodb server (but not a specific collection)
     """
-    if "db" not in g:
-        g.db = MongoClient(get_config("mongo.connection_string"))
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                # Do not close a client inherited from the parent process:
+                # its sockets are shared with the parent.
+                _pool_stats.reset()
+                _client = _create_client()
+                _client_pid = pid
 
-    return g.db
+    return _client
 
 
 def get_db():
     return _get_db()[get_config("mongo.database_name")]
 
 
+def get_db_pool_stats():
+    """Get the connection pool counters of the current process.
+
+    Returns:
+        A dictionary containing the pool settings and counters
+        (see PoolStatsListener), and the pid of the process
+    """
+    stats = _pool_stats.get_stats()
+    stats["pid"] = os.getpid()
+    stats["max_pool_size"] = get_config("mongo.max_pool_size")
+    stats["min_pool_size"] = get_config("mongo.min_pool_size")
+    return stats
+
+
 def close_db(e=None):
-    """If this request connected to the database, close the connection.
+    """Close the MongoClient of the current process, if any.
+
+    The client is shared by all the requests, so this must not be
+    called at the end of each request, but only when the process
+    does not need the database anymore (e.g. at the end of the tests).
 
     Disclaimer: The `e=None` code is cargo code. Not sure why it's there.
     Not really worth investigating too deeply now, but maybe later.
     """
-    db = g.pop("db", None)
+    global _client, _client_pid
 
-    if db is not None:
-        db.close()
+    with _client_lock:
+        client, _client, _client_pid = _client, None, None
+
+    if client is not None:
+        client.close()
 
 
 # Note that all the `init_db` and `init_app` code were
@@ -83,9 +235,47 @@ def init_db_command():
     init_db()
 
 
+@click.command("ensure-indexes")
+@click.option(
+    "--drop-conflicting",
+    is_flag=True,
+    help="Replace the existing indexes having the name of a declared index but another key.",
+)
+@click.option(
+    "--explain",
+    is_flag=True,
+    help="Explain the query shapes of the catalogue, and report those not served by an index.",
+)
+@with_appcontext
+def ensure_indexes_command(drop_conflicting, explain):
+    """Create the indexes of the database which do not exist yet."""
+    # The query shapes are built from the helpers, which use this module
+    from clockwork_web.core.indexes_helper import ensure_indexes, explain_query_shapes
+
+    db = get_db()
+    for collection_name, index_name, status in ensure_indexes(
+        db, drop_conflicting=drop_conflicting
+    ):
+        click.echo(f"{collection_name}.{index_name}: {status}")
+
+    if explain:
+        L_unserved_query_shapes = []
+        for D_result in explain_query_shapes(db):
+            click.echo(f"{D_result['name']}: {' < '.join(D_result['stages'])}")
+            if D_result["issues"]:
+                L_unserved_query_shapes.append(D_result)
+
+        for D_result in L_unserved_query_shapes:
+            click.echo(
+                f"Not served by an index: {D_result['name']} ({', '.join(D_result['issues'])})",
+                err=True,
+            )
+        if L_unserved_query_shapes:
+            raise SystemExit(1)
+
+
 def init_app(app):
     """Register database functions with the Flask app. This is called by
     the application factory.
     """
-    app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
@@ -19,7 +19,7 @@ from flask.globals import current_app
 from flask import request
 from flask.json import jsonify
 
-from ..db import get_db
+from clockwork_web.core.users_helper import get_user_context
 
 
 def authentication_required(f):
@@ -32,21 +32,18 @@ def authentication_required(f):
             logging.warning("REST authentication error : no authorization in request")
             return jsonify("Authorization error."), 401
 
-        mc = get_db()
-        L = list(mc["users"].find({"mila_email_username": auth["username"]}))
+        # The user is read from the database at most once per request,
+        # and reused by the worker for a short time (see get_user_context).
+        # Its context is invalidated when its key is rotated.
+        D_context = get_user_context(auth["username"])
 
-        if not L:
+        if D_context is None:
             logging.warning(
                 f"REST authentication error : user {auth['username']} not in database"
             )
             return jsonify("Authorization error."), 401
-        elif len(L) > 1:
-            logging.warning(
-                f"REST authentication error : database error (user {auth['username']} present {len(L)} times in database)"
-            )
-            return jsonify("Database error."), 500
 
-        D_user = L[0]
+        D_user = D_context["user"]
         if D_user["clockwork_api_key"] is not None and secrets.compare_digest(
             D_user["clockwork_api_key"], auth["password"]
         ):
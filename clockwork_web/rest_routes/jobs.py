@@ -21,6 +21,7 @@ from clockwork_web.core.jobs_helper import (
     combine_all_mongodb_filters,
     strip_artificial_fields_from_job,
     get_jobs,
+    InvalidCursorError,
 )
 from clockwork_web.core.utils import to_boolean, get_custom_array_from_request_args
 from clockwork_web.core.job_user_props_helper import (
@@ -54,20 +55,34 @@ def route_api_v1_jobs_list():
     # want_count = to_boolean(want_count)
 
     # Parse the request arguments
-    (query, LD_jobs, nbr_total_jobs) = search_request(
-        current_user,
-        request.args,
-        force_pagination=False,
-    )
+    try:
+        (query, LD_jobs, nbr_total_jobs) = search_request(
+            current_user,
+            request.args,
+            force_pagination=False,
+        )
+    except InvalidCursorError:
+        return jsonify("Invalid cursor."), 400  # bad request
 
     # Return the requested jobs, and the number of all the jobs
     LD_jobs = [
         strip_artificial_fields_from_job(D_job) for D_job in LD_jobs
     ]  # Remove the field "_id" of each job before jsonification
     if query.want_count:
-        return jsonify({"nbr_total_jobs": nbr_total_jobs, "jobs": LD_jobs})
+        response = jsonify(
+            {
+                "nbr_total_jobs": nbr_total_jobs,
+                "jobs": LD_jobs,
+                "next_cursor": query.next_cursor,
+            }
+        )
     else:
-        return jsonify(LD_jobs)
+        response = jsonify(LD_jobs)
+
+    # The cursor to provide in order to get the next page, if any
+    if query.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = query.next_cursor
+    return response
 
 
 @flask_api.route("/jobs/one")
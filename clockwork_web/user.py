@@ -19,6 +19,7 @@ from flask import session
 from flask_login import UserMixin, AnonymousUserMixin
 from flask_babel import gettext
 
+import copy
 import secrets
 
 from .db import get_db
@@ -33,9 +34,8 @@ from clockwork_web.core.users_helper import (
     set_date_format,
     set_time_format,
     set_language,
-    is_correct_type_for_web_setting,
-    get_default_web_settings_values,
-    get_available_clusters_from_db,
+    get_user_context,
+    invalidate_user_context,
 )
 
 
@@ -56,10 +56,14 @@ class User(UserMixin):
         cc_account_username=None,
         cc_account_update_key=None,
         web_settings={},
+        available_clusters=[],
     ):
         """
         This constructor is called only by the `get` method.
         We never call it directly.
+
+        The web_settings are expected to be already completed with
+        their default values (see get_user_web_settings).
         """
 
         def boolean(value):
@@ -80,23 +84,8 @@ class User(UserMixin):
         self.mila_cluster_username = mila_cluster_username
         self.cc_account_username = cc_account_username
         self.cc_account_update_key = cc_account_update_key
-        for k in ["nbr_items_per_page", "dark_mode", "language"]:
-            if k in web_settings and not is_correct_type_for_web_setting(
-                k, web_settings[k]
-            ):
-                del web_settings[k]
-        self.web_settings = get_default_web_settings_values() | web_settings
-        # Force column "actions" to not be displayed in job tables.
-        self.web_settings.setdefault("column_display", {}).setdefault("dashboard", {})[
-            "actions"
-        ] = False
-        self.web_settings.setdefault("column_display", {}).setdefault("jobs_list", {})[
-            "actions"
-        ] = False
-        # By default, do not display column "job_user_props" in job tables.
-        self.web_settings.setdefault("column_display", {}).setdefault(
-            "jobs_list", {}
-        ).setdefault("job_user_props", False)
+        self.web_settings = web_settings
+        self.available_clusters = available_clusters
 
     def get_id(self):
         return self.mila_email_username
@@ -111,30 +100,16 @@ class User(UserMixin):
         """
         from flask import current_app
 
-        mc = get_db()
-
+        # The user is read from the database at most once per request
         try:
-            L = list(mc["users"].find({"mila_email_username": mila_email_username}))
+            D_context = get_user_context(mila_email_username)
         except:
             return None
 
-        # This is not an error from which we expect to be able to recover gracefully.
-        # It could happen if you copied data from your database directly
-        # using an external script, and ended up with many instances of your users.
-        # In that case, you might have other issues as well, so let's not even try
-        # to just return the first instance of that user (ignoring the rest),
-        # because that might hide more problems downstream.
-        if len(L) not in [0, 1]:
-            current_app.logger.error(
-                "Found %d users with email %s. This can't happen.",
-                len(L),
-                mila_email_username,
-            )
-            return None
-        elif len(L) == 0:
+        if D_context is None:
             return None
         else:
-            e = L[0]
+            e = D_context["user"]
             user = User(
                 mila_email_username=e["mila_email_username"],
                 status=e["status"],
@@ -143,7 +118,10 @@ class User(UserMixin):
                 mila_cluster_username=e["mila_cluster_username"],
                 cc_account_username=e["cc_account_username"],
                 cc_account_update_key=e.get("cc_account_update_key", ""),
-                web_settings=e.get("web_settings", {}),
+                # The context is shared by the requests of the current process,
+                # so that the User gets its own copy of the mutable values
+                web_settings=copy.deepcopy(D_context["web_settings"]),
+                available_clusters=list(D_context["available_clusters"]),
             )
             current_app.logger.debug(
                 "Retrieved entry for user with email %s.", user.mila_email_username
@@ -165,6 +143,7 @@ class User(UserMixin):
             {"mila_email_username": self.mila_email_username},
             {"$set": {"clockwork_api_key": self.clockwork_api_key}},
         )
+        invalidate_user_context(self.mila_email_username)
         if res.modified_count != 1:
             self.clockwork_api_key = old_key
             raise ValueError(gettext("could not modify api key"))
@@ -179,6 +158,7 @@ class User(UserMixin):
             {"mila_email_username": self.mila_email_username},
             {"$set": {"cc_account_update_key": self.cc_account_update_key}},
         )
+        invalidate_user_context(self.mila_email_username)
         if res.modified_count != 1:
             raise ValueError(gettext("could not modify update key"))
 
@@ -186,7 +166,7 @@ class User(UserMixin):
         """
         Get a list of the names of the clusters to which the user have access.
         """
-        return get_available_clusters_from_db(self.mila_email_username)
+        return list(self.available_clusters)
 
     ###
     #   Web settings
@@ -322,7 +302,7 @@ class User(UserMixin):
                 "nbr_items_per_page": <integer>
             }
         """
-        return get_default_web_settings_values() | self.web_settings
+        return self.web_settings
 
 
 class AnonUser(AnonymousUserMixin):
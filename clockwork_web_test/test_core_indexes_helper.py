@@ -0,0 +1,162 @@
+"""
+Tests for the clockwork_web.core.indexes_helper functions.
+"""
+
+import pytest
+
+from clockwork_web.core.indexes_helper import *
+from clockwork_web.db import get_db
+
+
+@pytest.fixture
+def scratch_db(app):
+    """
+    Database in which the indexes are created, so that
+    the ones of the test database are not modified.
+    """
+    with app.app_context():
+        client = get_db().client
+        client.drop_database("clockwork_test_indexes")
+        yield client["clockwork_test_indexes"]
+        client.drop_database("clockwork_test_indexes")
+
+
+def test_ensure_indexes(scratch_db):
+    """
+    Test that the declared indexes are created once, and
+    that the conflicting ones are only replaced on request.
+    """
+    L_declared = [
+        (collection_name, index.document["name"])
+        for (collection_name, L_indexes) in INDEXES.items()
+        for index in L_indexes
+    ]
+
+    # An index with the key of a declared one, but another name
+    scratch_db["users"].create_index([("mila_email_username", 1)], name="email")
+    # An index with the name of a declared one, but another key
+    scratch_db["gpu"].create_index([("vendor", 1)], name="gpu_name")
+
+    L_results = ensure_indexes(scratch_db)
+    assert [(c, i) for (c, i, _) in L_results] == L_declared
+    assert ("users", "users_email_index", "exists") in L_results
+    assert ("gpu", "gpu_name", "conflict") in L_results
+    assert all(
+        status == "created"
+        for (c, i, status) in L_results
+        if (c, i) not in [("users", "users_email_index"), ("gpu", "gpu_name")]
+    )
+
+    # Nothing is created the second time
+    L_results = ensure_indexes(scratch_db)
+    assert ("gpu", "gpu_name", "conflict") in L_results
+    assert all(
+        status == "exists"
+        for (c, i, status) in L_results
+        if (c, i) != ("gpu", "gpu_name")
+    )
+
+    L_results = ensure_indexes(scratch_db, drop_conflicting=True)
+    assert ("gpu", "gpu_name", "replaced") in L_results
+    assert list(scratch_db["gpu"].index_information()["gpu_name"]["key"]) == [
+        ("name", 1)
+    ]
+
+
+def test_get_plan_stages():
+    """
+    Test that the stages of the query plans are found, whatever their nesting.
+    """
+    # Classic query engine
+    D_plan = {
+        "stage": "LIMIT",
+        "inputStage": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "IXSCAN", "indexName": "user_and_submit_time"},
+        },
+    }
+    assert get_plan_stages(D_plan) == ["LIMIT", "FETCH", "IXSCAN"]
+
+    # Slot-based query engine, with an in-memory sort
+    D_plan = {
+        "queryPlan": {
+            "stage": "SORT",
+            "inputStage": {
+                "stage": "OR",
+                "inputStages": [{"stage": "COLLSCAN"}, {"stage": "IXSCAN"}],
+            },
+        },
+        "slotBasedPlan": {"stages": "[2] sort [s4] ..."},
+    }
+    assert get_plan_stages(D_plan) == ["SORT", "OR", "COLLSCAN", "IXSCAN"]
+
+
+def test_ensure_indexes_command(app):
+    """
+    Test the `flask ensure-indexes` command on the test database,
+    whose indexes have been created with the fake data.
+    """
+    result = app.test_cli_runner().invoke(args=["ensure-indexes"])
+    assert result.exit_code == 0
+    assert "jobs.job_id_and_cluster_name: exists" in result.output
+
+
+@pytest.mark.parametrize("sort_by", JOBS_SORT_FIELDS)
+@pytest.mark.parametrize("sort_asc", [1, -1])
+def test_jobs_sorting_query_shapes(sort_by, sort_asc):
+    """
+    Test that the catalogue contains the query shapes of each sort of the jobs,
+    and that a declared index provides their order, read forwards or backwards.
+    """
+    sorting = [tuple(s) for s in get_jobs_sorting(sort_by, sort_asc)]
+    L_query_shapes = [
+        D_query_shape
+        for D_query_shape in QUERY_SHAPES
+        if D_query_shape.get("sort") == sorting
+    ]
+    direction = "ascending" if sort_asc == 1 else "descending"
+    assert f"jobs sorted by {sort_by} ({direction})" in [
+        D_query_shape["name"] for D_query_shape in L_query_shapes
+    ]
+    assert f"jobs after a cursor, sorted by {sort_by} ({direction})" in [
+        D_query_shape["name"] for D_query_shape in L_query_shapes
+    ]
+
+    reversed_sorting = [(field, -direction) for (field, direction) in sorting]
+    assert any(
+        list(index.document["key"].items())[: len(sorting)]
+        in [sorting, reversed_sorting]
+        for index in INDEXES["jobs"]
+    )
+
+
+@pytest.mark.parametrize("sort_by", JOBS_SORT_FIELDS)
+@pytest.mark.parametrize("sort_asc", [1, -1])
+def test_explain_jobs_sorting_query_shapes(scratch_db, sort_by, sort_asc):
+    """
+    Test that the query shapes of each sort of the jobs, with or without
+    a cursor, are served by the declared indexes, without any in-memory sort.
+    """
+    ensure_indexes(scratch_db)
+    scratch_db["jobs"].insert_many(
+        [
+            {
+                "slurm": {"job_id": str(job_id), "cluster_name": "mila"},
+                "cw": {"mila_email_username": "student00@mila.quebec"},
+            }
+            for job_id in range(10)
+        ]
+    )
+
+    sorting = [tuple(s) for s in get_jobs_sorting(sort_by, sort_asc)]
+    L_results = explain_query_shapes(
+        scratch_db,
+        [
+            D_query_shape
+            for D_query_shape in QUERY_SHAPES
+            if D_query_shape.get("sort") == sorting
+        ],
+    )
+    assert L_results
+    for D_result in L_results:
+        assert D_result["issues"] == [], D_result["name"]
@@ -2,6 +2,8 @@
 Tests fort the clockwork_web.core.jobs_helper functions.
 """
 
+import base64
+import json
 import pytest
 
 from clockwork_web.core.jobs_helper import *
@@ -92,6 +94,104 @@ def test_get_jobs_with_pagination(app, fake_data, page_num, nbr_items_per_page):
         assert jobs_count == None
 
 
+@pytest.mark.parametrize(
+    "sort_by",
+    [
+        "cluster_name",
+        "user",
+        "job_id",
+        "name",
+        "job_state",
+        "submit_time",
+        "start_time",
+        "end_time",
+    ],
+)
+@pytest.mark.parametrize("sort_asc", [1, -1])
+def test_get_jobs_with_cursor(app, fake_data, sort_by, sort_asc):
+    """
+    Test the function get_jobs by providing the cursors of the previous pages,
+    instead of the numbers of the pages.
+
+    Parameters:
+        app                 The scope of our tests, used to set the context (to access MongoDB)
+        fake_data           The data on which our tests are based
+        sort_by             Field used to sort the jobs
+        sort_asc            Whether the jobs are sorted in ascending order (1)
+                            or descending order (-1).
+    """
+    nbr_items_per_page = 7
+    with app.app_context():
+        # All the jobs, in the order of the pages
+        (LD_all_jobs, _) = get_jobs(
+            nbr_skipped_items=0,
+            nbr_items_to_display=len(fake_data["jobs"]),
+            sort_by=sort_by,
+            sort_asc=sort_asc,
+        )
+        assert len(LD_all_jobs) == len(fake_data["jobs"])
+
+        LD_paginated_jobs = []
+        cursor = None
+        while True:
+            (LD_jobs, _) = get_jobs(
+                nbr_skipped_items=0,
+                nbr_items_to_display=nbr_items_per_page,
+                sort_by=sort_by,
+                sort_asc=sort_asc,
+                cursor=cursor,
+            )
+            LD_paginated_jobs.extend(LD_jobs)
+            if len(LD_jobs) < nbr_items_per_page:
+                break
+            cursor = decode_jobs_cursor(
+                encode_jobs_cursor(LD_jobs[-1], sort_by, sort_asc), sort_by, sort_asc
+            )
+
+    assert [D_job["_id"] for D_job in LD_paginated_jobs] == [
+        D_job["_id"] for D_job in LD_all_jobs
+    ]
+
+
+def test_decode_jobs_cursor_invalid():
+    """
+    Test that the function decode_jobs_cursor rejects the cursors which have not
+    been built by encode_jobs_cursor for the same sorting.
+    """
+    D_job = {"slurm": {"job_id": "123", "submit_time": 1680000000}}
+    cursor = encode_jobs_cursor(D_job, "submit_time", -1)
+    assert decode_jobs_cursor(cursor, "submit_time", -1) == {
+        "sort_by": "submit_time",
+        "sort_asc": -1,
+        "value": 1680000000,
+        "job_id": "123",
+    }
+
+    for invalid_cursor, sort_by, sort_asc in [
+        (cursor, "submit_time", 1),
+        (cursor, "end_time", -1),
+        ("not a cursor", "submit_time", -1),
+        ("e30=", "submit_time", -1),  # {}
+        (
+            # The value must not inject an operator in the MongoDB filter
+            base64.urlsafe_b64encode(
+                json.dumps(
+                    {
+                        "sort_by": "submit_time",
+                        "sort_asc": -1,
+                        "value": {"$ne": None},
+                        "job_id": "123",
+                    }
+                ).encode("utf-8")
+            ).decode("ascii"),
+            "submit_time",
+            -1,
+        ),
+    ]:
+        with pytest.raises(InvalidCursorError):
+            decode_jobs_cursor(invalid_cursor, sort_by, sort_asc)
+
+
 @pytest.mark.parametrize("want_count", [(True, False)])
 def test_get_and_count_jobs_without_filters_or_pagination(app, fake_data, want_count):
     """
@@ -0,0 +1,107 @@
+"""
+Tests for the clockwork_web.core.status_helper functions.
+"""
+
+import clockwork_web.core.status_helper as status_helper
+from clockwork_web.config import get_config
+from clockwork_web.core.clusters_helper import get_all_clusters
+from clockwork_web.core.status_helper import get_server_status
+from clockwork_web.db import get_db
+
+
+def test_get_server_status(app, fake_data):
+    """
+    Test that the statistics of the server are the ones
+    computed from the fake data.
+
+    Parameters:
+    - app           The scope of our tests, used to set the context
+                    (to access MongoDB)
+    - fake_data     The data on which our tests are based
+    """
+    with app.app_context():
+        D_server_status = get_server_status()
+
+    users = fake_data["users"]
+    assert D_server_status["nb_users"] == len(users)
+    assert D_server_status["nb_enabled_users"] == len(
+        [user for user in users if user["status"] == "enabled"]
+    )
+    assert D_server_status["nb_drac_users"] == len(
+        [user for user in users if user.get("cc_account_username", None)]
+    )
+
+    assert set(D_server_status["clusters"]) == set(get_all_clusters())
+    for cluster_name, D_cluster in D_server_status["clusters"].items():
+        job_dates = [
+            D_job["cw"]["last_slurm_update"]
+            for D_job in fake_data["jobs"]
+            if D_job["slurm"]["cluster_name"] == cluster_name
+            and "last_slurm_update" in D_job["cw"]
+        ]
+        assert (
+            D_cluster["display_order"]
+            == get_all_clusters()[cluster_name]["display_order"]
+        )
+        assert D_cluster["nb_jobs"] == len(
+            [
+                D_job
+                for D_job in fake_data["jobs"]
+                if D_job["slurm"]["cluster_name"] == cluster_name
+            ]
+        )
+        if job_dates:
+            assert D_cluster["job_dates"] == {
+                "min": min(job_dates),
+                "max": max(job_dates),
+            }
+        else:
+            assert "job_dates" not in D_cluster
+
+
+def test_get_server_status_cache(app, fake_data, monkeypatch):
+    """
+    Test that the statistics of the server are kept by the process
+    until jobs are ingested.
+
+    Parameters:
+    - app           The scope of our tests, used to set the context
+                    (to access MongoDB)
+    - fake_data     The data on which our tests are based
+    - monkeypatch   Used to count the computations of the statistics
+    """
+    L_computed = []
+    compute_server_status = status_helper._compute_server_status
+
+    def counting_compute_server_status():
+        L_computed.append(True)
+        return compute_server_status()
+
+    monkeypatch.setattr(
+        status_helper, "_compute_server_status", counting_compute_server_status
+    )
+    monkeypatch.setattr(status_helper, "_server_status", (0, None, None))
+    monkeypatch.setitem(get_config("settings"), "server_status_cache_ttl", 60)
+
+    D_job = fake_data["jobs"][0]
+    with app.app_context():
+        D_server_status = get_server_status()
+        assert get_server_status() is D_server_status
+        assert L_computed == [True]
+
+        # An ingestion updates the jobs
+        jobs_collection = get_db()["jobs"]
+        old_job = jobs_collection.find_one({"slurm.job_id": D_job["slurm"]["job_id"]})
+        last_slurm_update = max(
+            D["cw"].get("last_slurm_update", 0) for D in fake_data["jobs"]
+        )
+        try:
+            jobs_collection.update_one(
+                {"_id": old_job["_id"]},
+                {"$set": {"cw.last_slurm_update": last_slurm_update + 1}},
+            )
+            D_cluster = get_server_status()["clusters"][D_job["slurm"]["cluster_name"]]
+            assert L_computed == [True, True]
+            assert D_cluster["job_dates"]["max"] == last_slurm_update + 1
+        finally:
+            jobs_collection.replace_one({"_id": old_job["_id"]}, old_job)
@@ -7,6 +7,7 @@ import pytest
 from clockwork_web.core.users_helper import *
 from clockwork_web.core.users_helper import _set_web_setting, get_users
 from clockwork_web.db import get_db
+from clockwork_web.user import User
 
 
 @pytest.mark.parametrize(
@@ -1254,6 +1255,170 @@ def test_get_available_clusters_from_db(app, user_id, expected_clusters):
         assert set(expected_clusters) == set(retrieved_clusters)
 
 
+def test_get_user_context(app, client, fake_data, monkeypatch):
+    """
+    Test that the context of a user is read from the database at most once
+    per request, kept for settings.user_context_cache_ttl seconds, and
+    invalidated when the user is modified.
+
+    Parameters:
+    - app           The scope of our tests, used to set the context
+                    (to access MongoDB)
+    - client        The web client to request
+    - fake_data     The data on which our tests are based
+    - monkeypatch   Used to count the reads of the users from the database
+    """
+    import clockwork_web.core.users_helper as users_helper
+
+    L_loaded = []
+    load_user_context = users_helper._load_user_context
+
+    def counting_load_user_context(mila_email_username):
+        L_loaded.append(mila_email_username)
+        return load_user_context(mila_email_username)
+
+    monkeypatch.setattr(users_helper, "_load_user_context", counting_load_user_context)
+    known_user = fake_data["users"][0]
+    mila_email_username = known_user["mila_email_username"]
+
+    # Without cache, the user is read once per request
+    with app.app_context():
+        D_context = get_user_context(mila_email_username)
+        assert D_context["user"]["mila_email_username"] == mila_email_username
+        assert D_context["web_settings"]["nbr_items_per_page"] == (
+            known_user["web_settings"]["nbr_items_per_page"]
+        )
+        assert get_available_clusters_from_db(mila_email_username) == (
+            D_context["available_clusters"]
+        )
+        get_nbr_items_per_page(mila_email_username)
+    assert L_loaded == [mila_email_username]
+
+    # An authenticated page view reads the user once
+    assert (
+        client.get(f"/login/testing?user_id={mila_email_username}").status_code == 302
+    )
+    L_loaded.clear()
+    assert client.get("/jobs/search").status_code == 200
+    assert L_loaded == [mila_email_username]
+
+    # With cache, the user is read once for several requests...
+    monkeypatch.setitem(get_config("settings"), "user_context_cache_ttl", 60)
+    L_loaded.clear()
+    for _ in range(3):
+        with app.app_context():
+            get_user_context(mila_email_username)
+    assert L_loaded == [mila_email_username]
+
+    # The cached context is not modified through the User
+    with app.app_context():
+        User.get(mila_email_username).get_web_settings()["nbr_items_per_page"] = 0
+    with app.app_context():
+        assert get_user_context(mila_email_username)["web_settings"][
+            "nbr_items_per_page"
+        ] == (known_user["web_settings"]["nbr_items_per_page"])
+
+    # ... until it is modified
+    old_value = known_user["web_settings"]["nbr_items_per_page"]
+    with app.app_context():
+        assert set_items_per_page(mila_email_username, old_value + 33)[0] == 200
+    with app.app_context():
+        assert get_nbr_items_per_page(mila_email_username) == old_value + 33
+    assert L_loaded == [mila_email_username] * 2
+
+    with app.app_context():
+        set_items_per_page(mila_email_username, old_value)
+
+
+def test_get_clusters_with_status(app, monkeypatch):
+    """
+    Test that the statuses of all the clusters are retrieved with a single query,
+    and kept for settings.cluster_status_cache_ttl seconds without any query.
+    After that, they are only retrieved again if they have been updated.
+
+    Parameters:
+    - app           The scope of our tests, used to set the context
+                    (to access MongoDB)
+    - monkeypatch   Used to count the reads of the statuses from the database
+    """
+    import clockwork_web.core.users_helper as users_helper
+
+    L_loaded = []
+    load_clusters_with_status = users_helper._load_clusters_with_status
+
+    def counting_load_clusters_with_status():
+        L_loaded.append(True)
+        return load_clusters_with_status()
+
+    L_collections = []
+
+    class CountingDatabase:
+        def __init__(self, db):
+            self.db = db
+
+        def __getitem__(self, collection_name):
+            L_collections.append(collection_name)
+            return self.db[collection_name]
+
+    monkeypatch.setattr(
+        users_helper, "_load_clusters_with_status", counting_load_clusters_with_status
+    )
+    monkeypatch.setattr(users_helper, "get_db", lambda: CountingDatabase(get_db()))
+    monkeypatch.setattr(users_helper, "_clusters_with_status", (0, None, None))
+    monkeypatch.setitem(get_config("settings"), "cluster_status_cache_ttl", 60)
+
+    def expire_clusters_with_status():
+        (_, last_update, D_clusters) = users_helper._clusters_with_status
+        users_helper._clusters_with_status = (0, last_update, D_clusters)
+
+    with app.app_context():
+        get_db()["cluster_status"].insert_one(
+            {"cluster_name": "mila", "jobs_are_old": True, "cluster_has_error": False}
+        )
+        try:
+            D_clusters = get_clusters_with_status()
+            assert L_loaded == [True]
+
+            # A render within the TTL does not query the statuses
+            L_collections.clear()
+            with app.test_request_context("/"):
+                render_template_with_user_settings(
+                    "error.html", error_msg="", previous_request_args={}
+                )
+            assert "cluster_status" not in L_collections
+            assert get_clusters_with_status() is D_clusters
+
+            # An update by the script is only seen once the TTL has expired
+            get_db()["cluster_status"].update_one(
+                {"cluster_name": "mila"}, {"$set": {"last_update": 1700000000.0}}
+            )
+            assert get_clusters_with_status() is D_clusters
+            expire_clusters_with_status()
+            D_clusters = get_clusters_with_status()
+            assert get_clusters_with_status() is D_clusters
+            assert L_loaded == [True, True]
+
+            # Without update, the statuses are kept for another TTL
+            expire_clusters_with_status()
+            assert get_clusters_with_status() is D_clusters
+            assert L_loaded == [True, True]
+        finally:
+            get_db()["cluster_status"].delete_many({"cluster_name": "mila"})
+
+    assert list(D_clusters) == list(get_all_clusters())
+    for cluster_name, D_cluster in D_clusters.items():
+        assert D_cluster["display_order"] == get_all_clusters()[cluster_name].get(
+            "display_order"
+        )
+        assert D_cluster["status"]["jobs_are_old"] == (cluster_name == "mila")
+        assert D_cluster["status"]["cluster_has_error"] is False
+
+    # The configuration is not modified through the view
+    with pytest.raises(TypeError):
+        D_clusters["mila"]["status"] = {}
+    assert "status" not in get_all_clusters()["mila"]
+
+
 def test_get_users(app, fake_data):
     """
     Test the function get_users() used to retrieve all users in database.
@@ -1,7 +1,7 @@
 from flask import current_app
 
 import pytest
-from clockwork_web.db import get_db, init_db
+from clockwork_web.db import get_db, get_db_pool_stats, init_db
 
 
 def test_insert_and_retrieve(app):
@@ -29,3 +29,25 @@ def test_insert_and_retrieve(app):
 
         # clean up
         mc["jobs"].delete_many({"slurm.job_id": job_id, "slurm.cluster_name": "mila"})
+
+
+def test_db_client_shared_between_requests(app):
+    """
+    The MongoClient is created once per process and reused
+    by the following application contexts.
+    """
+    with app.app_context():
+        client_1 = get_db().client
+        get_db()["jobs"].find_one()
+
+    with app.app_context():
+        client_2 = get_db().client
+        get_db()["jobs"].find_one()
+
+    assert client_1 is client_2
+
+    stats = get_db_pool_stats()
+    assert stats["created"] >= 1
+    assert stats["checkouts"] >= 2
+    assert stats["checked_out"] == 0
+    assert stats["max_pool_size"] == 100
@@ -26,3 +26,49 @@ def test_bad_key(client, valid_rest_auth_headers):
     response = client.get("api/v1/clusters/jobs/list", headers=valid_rest_auth_headers)
     assert response.status_code == 401
     assert "Authorization error" in response.get_data(as_text=True)
+
+
+def test_authentication_cache(app, client, valid_rest_auth_headers, monkeypatch):
+    import clockwork_web.core.users_helper as users_helper
+    from clockwork_web.config import get_config
+    from clockwork_web.db import get_db
+    from clockwork_web.user import User
+
+    L_loaded = []
+    load_user_context = users_helper._load_user_context
+
+    def counting_load_user_context(mila_email_username):
+        L_loaded.append(mila_email_username)
+        return load_user_context(mila_email_username)
+
+    monkeypatch.setattr(users_helper, "_load_user_context", counting_load_user_context)
+    monkeypatch.setitem(get_config("settings"), "user_context_cache_ttl", 60)
+    email = get_config("clockwork.test.email")
+    users_helper.invalidate_user_context(email)
+
+    # The user is read once, even if the route also retrieves it
+    for _ in range(3):
+        response = client.get(
+            "api/v1/clusters/jobs/list", headers=valid_rest_auth_headers
+        )
+        assert response.status_code == 200
+    assert L_loaded == [email]
+
+    # The old key is rejected as soon as the key is rotated
+    with app.app_context():
+        user = User.get(email)
+        old_key = user.clockwork_api_key
+        user.new_api_key()
+    try:
+        response = client.get(
+            "api/v1/clusters/jobs/list", headers=valid_rest_auth_headers
+        )
+        assert response.status_code == 401
+        assert L_loaded == [email, email]
+    finally:
+        with app.app_context():
+            get_db()["users"].update_one(
+                {"mila_email_username": email},
+                {"$set": {"clockwork_api_key": old_key}},
+            )
+        users_helper.invalidate_user_context(email)
@@ -135,3 +135,50 @@ def test_jobs_list_with_filter(
     assert response.status_code == 200
     LD_jobs_results = response.get_json()
     validator(LD_jobs_results)
+
+
+def test_jobs_list_with_cursor(client, fake_data, valid_admin_rest_auth_headers):
+    """
+    Test that all the jobs are listed by following the cursors
+    returned with each page.
+    """
+    L_job_ids = []
+    cursor = None
+    while True:
+        response = client.get(
+            "/api/v1/clusters/jobs/list",
+            query_string={"nbr_items_per_page": 9, "want_count": True}
+            | ({"cursor": cursor} if cursor else {}),
+            headers=valid_admin_rest_auth_headers,
+        )
+        assert response.status_code == 200
+        D_results = response.get_json()
+        assert D_results["nbr_total_jobs"] == len(fake_data["jobs"])
+        assert D_results["next_cursor"] == response.headers.get("X-Next-Cursor")
+        L_job_ids.extend(
+            (D_job["slurm"]["cluster_name"], D_job["slurm"]["job_id"])
+            for D_job in D_results["jobs"]
+        )
+        cursor = D_results["next_cursor"]
+        if cursor is None:
+            break
+
+    assert sorted(L_job_ids) == sorted(
+        (D_job["slurm"]["cluster_name"], D_job["slurm"]["job_id"])
+        for D_job in fake_data["jobs"]
+    )
+
+    # A cursor can only be used with the sorting it was built for
+    response = client.get(
+        "/api/v1/clusters/jobs/list",
+        query_string={"nbr_items_per_page": 9},
+        headers=valid_admin_rest_auth_headers,
+    )
+    cursor = response.headers["X-Next-Cursor"]
+    for sort_by, expected_status_code in [("submit_time", 200), ("end_time", 400)]:
+        response = client.get(
+            "/api/v1/clusters/jobs/list",
+            query_string={"cursor": cursor, "sort_by": sort_by},
+            headers=valid_admin_rest_auth_headers,
+        )
+        assert response.status_code == expected_status_code
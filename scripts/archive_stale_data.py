@@ -5,18 +5,28 @@ everything that hasn't been updated for a month (or some other timestamp).
 We refer to the field e["cw]["last_slurm_update"] to know
 if some element e was updated recently or not.
 
-If a JSON output file is specified, we will store the results in that file.
+If an archive file is specified, we will append the results to that file,
+as JSON lines of the form {"collection": "jobs", "document": {...}}.
+The archive is compressed according to its extension (".gz" or ".zst").
+
+The stale elements are handled in batches, so that they never have to be
+all held in memory. A batch is deleted from the database only once it has
+been durably written in the archive. The progress is recorded in the file
+`<archive_path>.checkpoint`, so that an interrupted archival can be resumed
+by running the script again with the same archive file.
 """
 
+import io
 import os
 import sys
 import argparse
 import time
-from pprint import pprint
 import json
 
-from pymongo import MongoClient, DeleteOne
-from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from pymongo import MongoClient
+
+from slurm_state.helpers.stream_helper import open_report_file
 
 try:
     # in actual usage
@@ -30,6 +40,9 @@ except:
     # while running unit tests
     from scripts_test.config import register_config, get_config
 
+# Collections from which the stale elements are archived
+ARCHIVED_COLLECTIONS = ["jobs", "nodes"]
+
 
 def main(argv):
     # Retrieve the args
@@ -41,7 +54,7 @@ def main(argv):
     parser.add_argument(
         "-u",
         "--archive_path",
-        help="Optional. JSON file where we will put the elements removed.",
+        help='Optional. JSON lines file (compressed if it ends with ".gz" or ".zst") to which we will append the elements removed.',
     )
 
     # parser.add_argument(
@@ -55,13 +68,164 @@ def main(argv):
         help="How many days since last update.",
     )
 
+    parser.add_argument(
+        "--batch_size",
+        default=1000,
+        type=int,
+        help="Number of elements archived and deleted at a time.",
+    )
+
     args = parser.parse_args(argv[1:])
     assert isinstance(args.days_since_last_update, int)
 
-    archive(args.archive_path, args.days_since_last_update)
+    archive(args.archive_path, args.days_since_last_update, batch_size=args.batch_size)
+
+
+def get_checkpoint_path(archive_path):
+    return f"{archive_path}.checkpoint"
+
+
+def load_checkpoint(archive_path):
+    """
+    Load the progress of an interrupted archival.
+
+    Returns:
+        The checkpoint dictionary (see save_checkpoint), or None if the
+        previous archival to this file (if any) has been completed
+    """
+    checkpoint_path = get_checkpoint_path(archive_path)
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(archive_path, D_checkpoint):
+    """
+    Atomically write the progress of the archival, which is a dictionary containing:
+        - "threshold_timestamp": the elements updated before it are archived
+        - "archive_size": the size of the archive file once the last batch has been written
+        - "last_ids": a dictionary associating to each collection the "_id"
+          (as a string) of the last element written in the archive
+    """
+    checkpoint_path = get_checkpoint_path(archive_path)
+    with open(f"{checkpoint_path}.tmp", "w") as f:
+        json.dump(D_checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def write_batch(archive_path, collection_name, LD_documents):
+    """
+    Append a batch of documents to the archive, and wait until
+    it is written on disk.
+
+    Returns:
+        The size of the archive file after the batch has been written
+    """
+    with open_report_file(archive_path, "ab") as f:
+        for D_document in LD_documents:
+            line = json.dumps({"collection": collection_name, "document": D_document})
+            f.write(line.encode("utf-8") + b"\n")
+
+    fd = os.open(archive_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return os.path.getsize(archive_path)
+
+
+def delete_archived_range(collection, stale_filter, first_id, last_id):
+    """
+    Delete the stale elements of a collection whose "_id" are between
+    first_id and last_id (that is, the ones of an archived batch).
+    If first_id is None, all the stale elements up to last_id are deleted.
+
+    Returns:
+        The number of deleted elements
+    """
+    id_range = {"$lte": last_id}
+    if first_id is not None:
+        id_range["$gte"] = first_id
+    result = collection.delete_many({**stale_filter, "_id": id_range})
+    return result.deleted_count
+
+
+def archive_collection(
+    collection,
+    collection_name,
+    threshold_timestamp,
+    archive_path,
+    D_checkpoint,
+    batch_size,
+):
+    """
+    Archive and delete the stale elements of a collection, one batch at a time,
+    in the order of their "_id".
+
+    Returns:
+        The number of elements archived (or deleted, if archive_path is None) by this call
+    """
+    stale_filter = {"cw.last_slurm_update": {"$lt": threshold_timestamp}}
+
+    last_id = None
+    if D_checkpoint is not None and collection_name in D_checkpoint["last_ids"]:
+        # The last batch written before the interruption
+        # may not have been deleted
+        last_id = ObjectId(D_checkpoint["last_ids"][collection_name])
+        delete_archived_range(collection, stale_filter, None, last_id)
+
+    nbr_archived = 0
+    while True:
+        batch_filter = dict(stale_filter)
+        if last_id is not None:
+            batch_filter["_id"] = {"$gt": last_id}
+        LD_documents = list(
+            collection.find(batch_filter).sort([("_id", 1)]).limit(batch_size)
+        )
+        if not LD_documents:
+            break
+
+        (first_id, last_id) = (LD_documents[0]["_id"], LD_documents[-1]["_id"])
+        # We don't want to store those "_id"
+        for D_document in LD_documents:
+            del D_document["_id"]
+
+        if archive_path:
+            D_checkpoint["archive_size"] = write_batch(
+                archive_path, collection_name, LD_documents
+            )
+            D_checkpoint["last_ids"][collection_name] = str(last_id)
+            save_checkpoint(archive_path, D_checkpoint)
+
+        nbr_deleted = delete_archived_range(collection, stale_filter, first_id, last_id)
+        nbr_archived += len(LD_documents)
+        print(
+            f"{collection_name}: archived {len(LD_documents)} elements, deleted {nbr_deleted} (total: {nbr_archived})."
+        )
+
+    return nbr_archived
 
 
-def archive(archive_path, days_since_last_update, database_name=None):
+def archive(archive_path, days_since_last_update, database_name=None, batch_size=1000):
+    """
+    Archive and delete the elements of the "jobs" and "nodes" collections
+    which have not been updated for days_since_last_update days.
+
+    Parameters:
+        archive_path            The archive file to which the elements are appended.
+                                If None, the elements are only deleted
+        days_since_last_update  Number of days since the last update of the archived elements
+        database_name           The database from which the elements are archived.
+                                Default is the mongo.database_name configuration
+        batch_size              Number of elements archived and deleted at a time
+
+    Returns:
+        A dictionary associating to each collection the number of
+        elements archived from it by this call
+    """
 
     assert isinstance(
         days_since_last_update, int
@@ -71,100 +235,74 @@ def archive(archive_path, days_since_last_update, database_name=None):
     # to use a different database to avoid messing up our fake_data.
     # The actual value in practice comes from the CLOCKWORK_CONFIG file.
 
-    threshold_timestamp = time.time() - days_since_last_update * 24 * 60 * 60
-
-    # Okay, so here's a minor problem.
-    # We don't want to leave out certain jobs by running the same query twice
-    # but with the filter catching different jobs due to time moving on.
-    #
-    # We also don't want to remove jobs before we archive them.
-    # We'll run a bulk update with the unique ids, then, even though
-    # that will be slower than just a `delete_many` call with a filter.
-    # That way, we won't get duplicates in the archives, unless some deletion
-    # operation fails, in which case we'll have archived something that stuck
-    # around in the database.
+    if archive_path and os.path.dirname(archive_path):
+        assert os.path.exists(
+            os.path.dirname(archive_path)
+        ), f"The directory of the archive {archive_path} does not exist."
+
+    D_checkpoint = load_checkpoint(archive_path) if archive_path else None
+    if D_checkpoint is not None:
+        # Resume the interrupted archival. Its threshold is kept, and what
+        # has been written to the archive after its last checkpoint is discarded.
+        print(f"Resuming the archival recorded in {get_checkpoint_path(archive_path)}.")
+        threshold_timestamp = D_checkpoint["threshold_timestamp"]
+        with open(archive_path, "ab") as f:
+            f.truncate(D_checkpoint["archive_size"])
+    else:
+        # The threshold is computed once, so that the elements becoming
+        # stale during the archival are left for the next one
+        threshold_timestamp = time.time() - days_since_last_update * 24 * 60 * 60
+        if archive_path:
+            D_checkpoint = {
+                "threshold_timestamp": threshold_timestamp,
+                "archive_size": (
+                    os.path.getsize(archive_path) if os.path.exists(archive_path) else 0
+                ),
+                "last_ids": {},
+            }
+            save_checkpoint(archive_path, D_checkpoint)
+        else:
+            print("Not saving the archived contents to filesystem.")
 
     # Connect to MongoDB
     client = MongoClient(get_config("mongo.connection_string"))
     if database_name is None:
         database_name = get_config("mongo.database_name")
 
-    ###################
-    ## Retrieve jobs ##
-    ###################
-    jobs_collection = client[database_name]["jobs"]
-    LD_jobs_to_archive = list(
-        jobs_collection.find({"cw.last_slurm_update": {"$lt": threshold_timestamp}})
-    )
-
-    # We don't want to store those "_id",
-    # but we need them later to make a deletion operation.
-    L_jobs_deletion_requests = [
-        DeleteOne({"_id": D_job["_id"]}) for D_job in LD_jobs_to_archive
-    ]
-    for D_job in LD_jobs_to_archive:
-        del D_job["_id"]
-
-    ####################
-    ## Retrieve nodes ##
-    ####################
-    nodes_collection = client[database_name]["nodes"]
-    LD_nodes_to_archive = list(
-        nodes_collection.find({"cw.last_slurm_update": {"$lt": threshold_timestamp}})
-    )
-
-    L_nodes_deletion_requests = [
-        DeleteOne({"_id": D_node["_id"]}) for D_node in LD_nodes_to_archive
-    ]
-    for D_node in LD_nodes_to_archive:
-        del D_node["_id"]
+    D_nbr_archived = {}
+    for collection_name in ARCHIVED_COLLECTIONS:
+        D_nbr_archived[collection_name] = archive_collection(
+            client[database_name][collection_name],
+            collection_name,
+            threshold_timestamp,
+            archive_path,
+            D_checkpoint,
+            batch_size,
+        )
+
+    if archive_path:
+        # The archival is complete
+        os.remove(get_checkpoint_path(archive_path))
+        print(f"Wrote {archive_path}.")
 
     print(
-        f"We have {len(LD_jobs_to_archive)} jobs to archive and {len(LD_nodes_to_archive)} nodes to archive."
+        f"We have archived {D_nbr_archived['jobs']} jobs and {D_nbr_archived['nodes']} nodes."
     )
-    print(
-        f"We have {len(L_jobs_deletion_requests)} jobs to delete and {len(L_nodes_deletion_requests)} nodes to delete."
-    )
-
-    #############################
-    ## Write things in archive ##
-    #############################
-    contents_archived = {"jobs": LD_jobs_to_archive, "nodes": LD_nodes_to_archive}
-    if archive_path and (
-        not os.path.dirname(archive_path)
-        or os.path.exists(os.path.dirname(archive_path))
-    ):
-        # if `archive_path` is given, then either the dirname is empty '' or otherwise it needs to exist,
-        # for us to be saving the file there
-        with open(archive_path, "w") as f:
-            json.dump(contents_archived, f, indent=2)
-            print(f"Wrote {archive_path}.")
-    else:
-        print(f"archive_path : {archive_path}")
-        # print(f"os.path.exists(os.path.dirname(archive_path)) : {os.path.exists(os.path.dirname(archive_path))}")
-        print("Not saving the archived contents to filesystem.")
+    return D_nbr_archived
 
-    #################################
-    ## Deletions from the database ##
-    #################################
-    try:
-        if L_jobs_deletion_requests:
-            result = jobs_collection.bulk_write(L_jobs_deletion_requests, ordered=False)
-            pprint(result.bulk_api_result)
-    except BulkWriteError as bwe:
-        pprint(bwe.details)
 
-    try:
-        if L_nodes_deletion_requests:
-            result = nodes_collection.bulk_write(
-                L_nodes_deletion_requests, ordered=False
-            )
-            pprint(result.bulk_api_result)
-    except BulkWriteError as bwe:
-        pprint(bwe.details)
+def read_archive(archive_path):
+    """
+    Iterate over the elements of an archive.
 
-    # Might as well return it. It also helps with testing this method.
-    return contents_archived
+    Returns:
+        An iterator of tuples (collection name, element)
+    """
+    with open_report_file(archive_path) as f:
+        # The zstd stream readers cannot be iterated line by line
+        for line in io.BufferedReader(f):
+            D_line = json.loads(line)
+            yield (D_line["collection"], D_line["document"])
 
 
 if __name__ == "__main__":
@@ -174,6 +312,6 @@ if __name__ == "__main__":
 export CLOCKWORK_CONFIG=/etc/clockwork/clockwork.toml
 export PYTHONPATH=$PYTHONPATH:/opt/clockwork
 
-python3 /opt/clockwork/scripts/archive_stale_data.py --days_since_last_update=14 --archive_path=2023-02-09_old_stuff.json
+python3 /opt/clockwork/scripts/archive_stale_data.py --days_since_last_update=14 --archive_path=2023-02-09_old_stuff.ndjson.gz
 
 """
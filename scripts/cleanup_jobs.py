@@ -2,6 +2,10 @@
 Script to clean-up jobs in database.
 
 To evaluate job status, we check job["slurm"]["slurm_last_update"].
+
+The jobs to delete are selected by a single aggregation, which only returns
+their keys, and are then deleted (along with their user props) in batches.
+Ranking the jobs per user requires MongoDB 5.0 or later.
 """
 
 import argparse
@@ -10,6 +14,12 @@ from datetime import datetime, timedelta
 from slurm_state.mongo_client import get_mongo_client
 from slurm_state.config import get_config
 
+# Number of jobs deleted at a time
+DEFAULT_BATCH_SIZE = 1000
+
+# Fields of the jobs needed to delete them and their user props
+JOB_KEYS_PROJECTION = {"_id": 1, "slurm.job_id": 1, "slurm.cluster_name": 1}
+
 
 def main(arguments: list):
     parser = argparse.ArgumentParser(description="Delete old jobs from database.")
@@ -51,6 +61,12 @@ def main(arguments: list):
             "If specified, script will delete all jobs updated before latest <--days> days."
         ),
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Number of jobs deleted at a time.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -65,146 +81,139 @@ def main(arguments: list):
         _debug_db_jobs()
 
     if args.jobs is not None:
-        keep_n_most_recent_jobs(args.jobs)
+        keep_n_most_recent_jobs(args.jobs, args.batch_size)
     elif args.jobs_per_user is not None:
-        keep_n_most_recent_jobs_per_user(args.jobs_per_user)
+        keep_n_most_recent_jobs_per_user(args.jobs_per_user, args.batch_size)
     elif args.days is not None:
         print(f"Keeping jobs updated in latest {args.days} days.")
         older_date = datetime.now() - timedelta(days=args.days)
-        keep_jobs_from_date(older_date)
+        keep_jobs_from_date(older_date, args.batch_size)
     else:
         if args.date.count("-") == 2:
             date_format = "%Y-%m-%d"
         else:
             date_format = "%Y-%m-%d-%H:%M:%S"
         date = datetime.strptime(args.date, date_format)
-        keep_jobs_from_date(date)
+        keep_jobs_from_date(date, args.batch_size)
 
     if args.debug:
         _debug_db_jobs()
 
 
-def keep_n_most_recent_jobs(n: int):
+def keep_n_most_recent_jobs(n: int, batch_size: int = DEFAULT_BATCH_SIZE):
     print(f"Keeping {n} most recent jobs")
     mc = _get_db()
-    db_jobs = mc["jobs"]
-    nb_total_jobs = db_jobs.count_documents({})
+    nb_total_jobs = mc["jobs"].estimated_document_count()
 
     if nb_total_jobs <= n:
         print(f"{nb_total_jobs} jobs in database, {n} to keep, nothing to do.")
         return
 
-    # Find jobs to delete.
-    # Sort jobs by slurm_last_update ascending
-    # and keep only first jobs, excluding n last jobs.
-    jobs_to_delete = list(
-        db_jobs.find({}).sort([("cw.last_slurm_update", 1)]).limit(nb_total_jobs - n)
-    )
-    assert len(jobs_to_delete) == nb_total_jobs - n
-    # Delete jobs
-    filter_to_delete = {"_id": {"$in": [job["_id"] for job in jobs_to_delete]}}
-    result = db_jobs.delete_many(filter_to_delete)
-    nb_deleted_jobs = result.deleted_count
-    # Delete user props associated to deleted jobs
-    _delete_user_props(mc, jobs_to_delete)
-
-    nb_remaining_jobs = db_jobs.count_documents({})
-
-    print(
-        f"Jobs in database: initially {nb_total_jobs}, deleted {nb_deleted_jobs}, remaining {nb_remaining_jobs}"
-    )
+    # Jobs to delete: all the jobs but the n most recently updated ones.
+    # The sort is served by an index, so the jobs are streamed.
+    pipeline = [
+        {"$sort": {"cw.last_slurm_update": -1}},
+        {"$skip": n},
+        {"$project": JOB_KEYS_PROJECTION},
+    ]
+    _delete_jobs(mc, pipeline, batch_size)
 
 
-def keep_n_most_recent_jobs_per_user(n: int):
+def keep_n_most_recent_jobs_per_user(n: int, batch_size: int = DEFAULT_BATCH_SIZE):
     mc = _get_db()
-    db_jobs = mc["jobs"]
-    nb_total_jobs = db_jobs.count_documents({})
-
-    db_users = mc["users"]
-    nb_users = db_users.count_documents({})
-    print(f"Keeping {n} most recent jobs for each of {nb_users} users.")
-
-    jobs_to_delete = []
-    for user in db_users.find({}).sort([("mila_email_username", 1)]):
-        mila_email_username = user["mila_email_username"]
-        user_filter = {"cw.mila_email_username": mila_email_username}
-        nb_user_jobs = db_jobs.count_documents(user_filter)
-        if nb_user_jobs <= n:
-            # print(f"[{mila_email_username}] {nb_user_jobs} user jobs, nothing to do.")
-            continue
-
-        # Find user jobs to delete.
-        # Sort jobs by slurm_last_update ascending
-        # and keep only first jobs, excluding n last jobs.
-        user_jobs_to_delete = list(
-            db_jobs.find(user_filter)
-            .sort([("cw.last_slurm_update", 1)])
-            .limit(nb_user_jobs - n)
-        )
-        assert len(user_jobs_to_delete) == nb_user_jobs - n
-        jobs_to_delete.extend(user_jobs_to_delete)
-        # print(f"[{mila_email_username}] {nb_user_jobs} user jobs, {len(user_jobs_to_delete)} to delete.")
-
-    if not jobs_to_delete:
+    L_users = mc["users"].distinct("mila_email_username")
+    print(f"Keeping {n} most recent jobs for each of {len(L_users)} users.")
+
+    # Jobs to delete: the jobs of each user ranked after its n most recently
+    # updated ones. Only the jobs of the known users are considered.
+    pipeline = [
+        {"$match": {"cw.mila_email_username": {"$in": L_users}}},
+        {
+            "$setWindowFields": {
+                "partitionBy": "$cw.mila_email_username",
+                "sortBy": {"cw.last_slurm_update": -1},
+                "output": {"rank": {"$documentNumber": {}}},
+            }
+        },
+        {"$match": {"rank": {"$gt": n}}},
+        {"$project": JOB_KEYS_PROJECTION},
+    ]
+    if not _delete_jobs(mc, pipeline, batch_size):
         print(f"Each user has at most {n} jobs, nothing to do.")
-        return
 
-    filter_to_delete = {"_id": {"$in": [job["_id"] for job in jobs_to_delete]}}
-    result = db_jobs.delete_many(filter_to_delete)
-    nb_deleted_jobs = result.deleted_count
-    # Delete user props associated to deleted jobs
-    _delete_user_props(mc, jobs_to_delete)
 
-    nb_remaining_jobs = db_jobs.count_documents({})
+def keep_jobs_from_date(date: datetime, batch_size: int = DEFAULT_BATCH_SIZE):
+    print(f"Keeping jobs updated since: {date}")
+    mc = _get_db()
 
-    print(
-        f"Jobs in database: initially {nb_total_jobs}, deleted {nb_deleted_jobs}, remaining {nb_remaining_jobs}"
-    )
+    pipeline = [
+        {"$match": {"cw.last_slurm_update": {"$lt": date.timestamp()}}},
+        {"$project": JOB_KEYS_PROJECTION},
+    ]
+    if not _delete_jobs(mc, pipeline, batch_size):
+        print(f"No job updated before {date}, nothing to do.")
 
 
-def keep_jobs_from_date(date: datetime):
-    print(f"Keeping jobs updated since: {date}")
-    mc = _get_db()
-    db_jobs = mc["jobs"]
-    nb_total_jobs = db_jobs.count_documents({})
+def _delete_jobs(mc, pipeline: list, batch_size: int):
+    """
+    Delete the jobs returned by an aggregation pipeline, along with
+    their user props, batch_size jobs at a time.
 
-    # Find jobs to delete
+    Parameters:
+        mc              The database
+        pipeline        Aggregation pipeline on the jobs collection, returning
+                        the jobs to delete projected on JOB_KEYS_PROJECTION
+        batch_size      Number of jobs deleted at a time
 
-    jobs_to_delete = list(
-        db_jobs.find({"cw.last_slurm_update": {"$lt": date.timestamp()}})
-    )
-    if not jobs_to_delete:
-        print(f"No job updated before {date}, nothing to do.")
-        return
+    Returns:
+        The number of deleted jobs
+    """
+    db_jobs = mc["jobs"]
+    nb_total_jobs = db_jobs.estimated_document_count()
 
-    # Delete jobs
-    filter_to_delete = {"_id": {"$in": [job["_id"] for job in jobs_to_delete]}}
-    result = db_jobs.delete_many(filter_to_delete)
-    nb_deleted_jobs = result.deleted_count
-    # Delete user props associated to deleted jobs
-    _delete_user_props(mc, jobs_to_delete)
+    nb_deleted_jobs = 0
+    nb_deleted_user_props = 0
+    jobs_to_delete = []
+    cursor = db_jobs.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    for job in cursor:
+        jobs_to_delete.append(job)
+        if len(jobs_to_delete) == batch_size:
+            nb_deleted_jobs += _delete_jobs_batch(mc, jobs_to_delete)
+            nb_deleted_user_props += _delete_user_props(mc, jobs_to_delete)
+            jobs_to_delete = []
+    if jobs_to_delete:
+        nb_deleted_jobs += _delete_jobs_batch(mc, jobs_to_delete)
+        nb_deleted_user_props += _delete_user_props(mc, jobs_to_delete)
+
+    if nb_deleted_jobs:
+        nb_remaining_jobs = db_jobs.estimated_document_count()
+        print(
+            f"Jobs in database: initially {nb_total_jobs}, deleted {nb_deleted_jobs}, remaining {nb_remaining_jobs}"
+        )
+        print(f"Deleted {nb_deleted_user_props} user props.")
+    return nb_deleted_jobs
 
-    nb_remaining_jobs = db_jobs.count_documents({})
 
-    print(
-        f"Jobs in database: initially {nb_total_jobs}, deleted {nb_deleted_jobs}, remaining {nb_remaining_jobs}"
-    )
+def _delete_jobs_batch(mc, jobs: list):
+    """Delete given jobs, from their _id."""
+    result = mc["jobs"].delete_many({"_id": {"$in": [job["_id"] for job in jobs]}})
+    return result.deleted_count
 
 
 def _delete_user_props(mc, jobs: list):
     """Delete user props associated to given jobs."""
     # Build filter.
-    # Use OR, to delete any of given jobs.
+    # Group the job IDs by cluster name, so that the filter contains
+    # one clause per cluster instead of one clause per job.
+    job_ids_per_cluster = {}
+    for job in jobs:
+        job_ids_per_cluster.setdefault(job["slurm"]["cluster_name"], []).append(
+            job["slurm"]["job_id"]
+        )
     filter_jobs = {
         "$or": [
-            # For each job, find user prop with same job ID and cluster name.
-            {
-                "$and": [
-                    {"job_id": job["slurm"]["job_id"]},
-                    {"cluster_name": job["slurm"]["cluster_name"]},
-                ]
-            }
-            for job in jobs
+            {"job_id": {"$in": job_ids}, "cluster_name": cluster_name}
+            for cluster_name, job_ids in job_ids_per_cluster.items()
         ]
     }
 
@@ -19,6 +19,15 @@ but we only want to update the most recent jobs. Updating "users" doesn't make a
 This means that the calls to this script should be mindful of specifying a `days_to_expire`
 argument only when dealing with the "jobs" collection.
 
+The entries are copied with unordered bulk writes of `--batch_size` replacements.
+The source collection is split into `--workers` ranges of "_id", copied in parallel.
+The progress of each range is recorded in the "sync_state" collection of the
+destination database, so that an interrupted sync is resumed by running the
+script again with the same arguments.
+
+With `--incremental`, only the entries whose "cw.last_slurm_update" is not older than
+the most recent one at the time of the previous (completed) sync are copied.
+
 TODO : There's probably a reason to clean up the entries in the "nodes" collection from time
        to time, because nodes that get decommissioned shouldn't stay in the database forever.
        If we totally wiped "nodes" all the time, before updating them, this might be a little
@@ -29,91 +38,320 @@ TODO : There's probably a reason to clean up the entries in the "nodes" collecti
        since the rules are somewhat different.
 """
 
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import argparse
-from pymongo import MongoClient
-
-parser = argparse.ArgumentParser(
-    description="Migrate data from one instance of mongodb to another."
-)
-parser.add_argument("--src_host", type=str, help="source mongodb connection string")
-parser.add_argument(
-    "--dst_host", type=str, help="destination mongodb connection string"
-)
-parser.add_argument(
-    "--src_db", type=str, default="clockwork", help="source mongodb database"
-)
-parser.add_argument(
-    "--dst_db", type=str, default="clockwork", help="destination mongodb database"
-)
-parser.add_argument("--coll", type=str, default="jobs", help="collection to transfer")
-parser.add_argument(
-    "--days_to_expiration",
-    type=int,
-    default=None,  # default is to not apply filtering
-    help="how many days before we ignore the source data (and purge from destination)",
-)
-
-args = parser.parse_args()
-
-
-def main(
-    src_host: str,
-    src_db: str,
-    dst_host: str,
-    dst_db: str,
-    coll: str,
-    days_to_expiration,
+from bson import ObjectId
+from pymongo import MongoClient, ReplaceOne
+
+# Collection of the destination database in which the progress of the syncs is recorded
+SYNC_STATE_COLLECTION = "sync_state"
+
+
+def get_id_ranges(collection, mongodb_filter, nbr_ranges):
+    """
+    Split the entries of a collection into ranges of "_id" of similar sizes,
+    assuming that the entries have been inserted at a steady pace.
+
+    The ranges are computed from the creation times contained in the
+    ObjectIds of the oldest and newest entries. If the "_id" are not
+    ObjectIds, a single range is returned.
+
+    Returns:
+        A list of tuples (lower bound (excluded), upper bound (included)),
+        where None means that the range is not bounded on that side
+    """
+    L_ids = []
+    for direction in [1, -1]:
+        cursor = collection.find(mongodb_filter, {"_id": 1}).sort("_id", direction)
+        L_ids.extend(e["_id"] for e in cursor.limit(1))
+    if len(L_ids) < 2 or not all(isinstance(id, ObjectId) for id in L_ids):
+        return [(None, None)]
+
+    (first_time, last_time) = (int(id.generation_time.timestamp()) for id in L_ids)
+    L_bounds = sorted(
+        {
+            first_time + (last_time - first_time) * i // nbr_ranges
+            for i in range(1, nbr_ranges)
+        }
+        - {last_time}
+    )
+    # The ObjectIds created during the second t are lower than
+    # or equal to "<t>ffffffffffffffff"
+    L_bounds = [ObjectId(f"{t:08x}" + "f" * 16) for t in L_bounds]
+    return list(zip([None] + L_bounds, L_bounds + [None]))
+
+
+def write_batch(dst_collection, LD_entries):
+    """
+    Replace (or insert) a batch of entries in the destination collection,
+    with an unordered bulk write.
+    """
+    result = dst_collection.bulk_write(
+        [ReplaceOne({"_id": e["_id"]}, e, upsert=True) for e in LD_entries],
+        ordered=False,
+    )
+    return result.bulk_api_result
+
+
+def sync_range(
+    src_collection,
+    dst_collection,
+    state_collection,
+    state_id,
+    range_index,
+    D_range,
+    mongodb_filter,
+    batch_size,
+):
+    """
+    Copy the entries of a range of "_id", batch_size entries at a time,
+    recording the last copied "_id" of the range after each batch.
+
+    Parameters:
+        D_range     Dictionary describing the range, with the keys "lower" and
+                    "upper" (its bounds, see get_id_ranges) and "last_id" (the
+                    last "_id" copied, or None), as stored in the sync state
+
+    Returns:
+        The number of entries copied
+    """
+    nbr_copied = 0
+    lower = D_range["last_id"] if D_range["last_id"] is not None else D_range["lower"]
+    while True:
+        id_filter = {}
+        if lower is not None:
+            id_filter["$gt"] = lower
+        if D_range["upper"] is not None:
+            id_filter["$lte"] = D_range["upper"]
+        range_filter = (
+            {**mongodb_filter, "_id": id_filter} if id_filter else mongodb_filter
+        )
+
+        LD_entries = list(
+            src_collection.find(range_filter).sort("_id", 1).limit(batch_size)
+        )
+        if not LD_entries:
+            break
+
+        write_batch(dst_collection, LD_entries)
+        nbr_copied += len(LD_entries)
+        lower = LD_entries[-1]["_id"]
+        state_collection.update_one(
+            {"_id": state_id}, {"$set": {f"ranges.{range_index}.last_id": lower}}
+        )
+
+    state_collection.update_one(
+        {"_id": state_id}, {"$set": {f"ranges.{range_index}.done": True}}
+    )
+    return nbr_copied
+
+
+def get_src_filter_for_update(expiration_time, incremental_since):
+    """
+    Build the filter of the entries of the source to copy.
+
+    Parameters:
+        expiration_time     The jobs which ended before this timestamp are
+                            not copied. If None, the end time is not filtered
+        incremental_since   Only the entries updated since this timestamp are
+                            copied. If None, the update time is not filtered
+    """
+    filters = []
+    if expiration_time is not None:
+        # Those jobs; you want to update.
+        filters.append(
+            {
+                "$or": [
+                    {"end_time": {"$gt": expiration_time}},
+                    {"end_time": 0},
+                ]
+            }
+        )
+    if incremental_since is not None:
+        filters.append({"cw.last_slurm_update": {"$gte": incremental_since}})
+
+    if len(filters) == 0:
+        return {}
+    elif len(filters) == 1:
+        return filters[0]
+    return {"$and": filters}
+
+
+def sync_collection(
+    src,
+    dst,
+    coll,
+    days_to_expiration=None,
+    incremental=False,
+    nbr_workers=4,
+    batch_size=1000,
 ):
+    """
+    Copy the entries of a collection from the source database to the destination one.
+
+    If a previous sync of this collection has been interrupted, it is resumed
+    with its own parameters.
+
+    Parameters:
+        src                 The source database
+        dst                 The destination database
+        coll                The name of the collection to copy
+        days_to_expiration  How many days before we ignore the source data. If None,
+                            the source data is not filtered on its end time
+        incremental         Whether or not only the entries updated since the previous
+                            sync are copied
+        nbr_workers         Number of ranges of "_id" copied in parallel
+        batch_size          Number of entries sent in each bulk write
+
+    Returns:
+        The number of entries copied
+    """
+    state_collection = dst[SYNC_STATE_COLLECTION]
+    state_id = f"{src.name}.{coll}"
+    D_state = state_collection.find_one({"_id": state_id}) or {"_id": state_id}
 
-    src = MongoClient(src_host)[src_db]
-    dst = MongoClient(dst_host)[dst_db]
-
-    if days_to_expiration is None:
-        mongodb_src_filter_for_update = {}
-        # We might as well cause an interpreter error here,
-        # by omitting to define `mongodb_filter_for_removal`.
-        # We never want to reach code that requires
-        # the variable `mongodb_filter_for_removal` when
-        # `days_to_expiration` is None.
-        # mongodb_filter_for_removal = None
+    if "ranges" in D_state:
+        print(f"Resuming the interrupted sync of collection {coll}.")
     else:
+        # Most recent update in the source, which will be the starting point
+        # of the next incremental sync once this one is completed
+        D_last_updated = next(
+            iter(
+                src[coll]
+                .find({}, {"cw.last_slurm_update": 1})
+                .sort("cw.last_slurm_update", -1)
+                .limit(1)
+            ),
+            {},
+        )
+        D_state["watermark"] = D_last_updated.get("cw", {}).get("last_slurm_update")
+        D_state["expiration_time"] = (
+            int(time.time() - days_to_expiration * 3600 * 24)
+            if days_to_expiration is not None
+            else None
+        )
+        D_state["incremental_since"] = (
+            D_state.get("last_sync_watermark") if incremental else None
+        )
+        mongodb_filter = get_src_filter_for_update(
+            D_state["expiration_time"], D_state["incremental_since"]
+        )
+        D_state["ranges"] = [
+            {"lower": lower, "upper": upper, "last_id": None, "done": False}
+            for (lower, upper) in get_id_ranges(src[coll], mongodb_filter, nbr_workers)
+        ]
+        state_collection.replace_one({"_id": state_id}, D_state, upsert=True)
+
+    mongodb_filter = get_src_filter_for_update(
+        D_state["expiration_time"], D_state["incremental_since"]
+    )
+
+    with ThreadPoolExecutor(max_workers=max(len(D_state["ranges"]), 1)) as executor:
+        L_futures = [
+            executor.submit(
+                sync_range,
+                src[coll],
+                dst[coll],
+                state_collection,
+                state_id,
+                range_index,
+                D_range,
+                mongodb_filter,
+                batch_size,
+            )
+            for range_index, D_range in enumerate(D_state["ranges"])
+            if not D_range["done"]
+        ]
+        nbr_copied = sum(future.result() for future in L_futures)
+
+    # The sync is completed
+    update = {"$unset": {"ranges": ""}}
+    if D_state["watermark"] is not None:
+        update["$set"] = {"last_sync_watermark": D_state["watermark"]}
+    state_collection.update_one({"_id": state_id}, update)
+    return nbr_copied
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Migrate data from one instance of mongodb to another."
+    )
+    parser.add_argument("--src_host", type=str, help="source mongodb connection string")
+    parser.add_argument(
+        "--dst_host", type=str, help="destination mongodb connection string"
+    )
+    parser.add_argument(
+        "--src_db", type=str, default="clockwork", help="source mongodb database"
+    )
+    parser.add_argument(
+        "--dst_db", type=str, default="clockwork", help="destination mongodb database"
+    )
+    parser.add_argument(
+        "--coll", type=str, default="jobs", help="collection to transfer"
+    )
+    parser.add_argument(
+        "--days_to_expiration",
+        type=int,
+        default=None,  # default is to not apply filtering
+        help="how many days before we ignore the source data (and purge from destination)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only transfer the entries updated since the previous sync",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="number of ranges of entries transferred in parallel",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="number of entries written at a time in the destination",
+    )
+
+    args = parser.parse_args(argv[1:])
+
+    src = MongoClient(args.src_host)[args.src_db]
+    dst = MongoClient(args.dst_host)[args.dst_db]
+    coll = args.coll.replace(" ", "")
+    days_to_expiration = args.days_to_expiration
+
+    # Query is on SOURCE.
+    nbr_updated = sync_collection(
+        src,
+        dst,
+        coll,
+        days_to_expiration=days_to_expiration,
+        incremental=args.incremental,
+        nbr_workers=args.workers,
+        batch_size=args.batch_size,
+    )
+    print(f"Updated {nbr_updated} from collection {coll} in destination.")
+
+    # Hardcoding a certain protection.
+    # This is a sign that the tool wasn't designed as something elegant and general,
+    # but it's to prevent accidents.
+    if coll == "jobs" and days_to_expiration is not None:
         seconds_to_expiration = days_to_expiration * 3600 * 24
-        # Those jobs; you want to update.
-        mongodb_src_filter_for_update = {
-            "$or": [
-                {"end_time": {"$gt": int(time.time() - seconds_to_expiration)}},
-                {"end_time": 0},
-            ]
-        }
         # Those jobs; you want to remove them.
         # At least remove them from the destination,
         # but maybe we'd want to remove them from the
         # source as well. TBD.
         # This filter is pretty much the negation of the
-        # previous filter.
+        # filter of the jobs to update.
         mongodb_filter_for_removal = {
             "$and": [
                 {"end_time": {"$lt": int(time.time() - seconds_to_expiration)}},
                 {"end_time": {"$ne": 0}},
             ]
         }
-
-    # Query is on SOURCE.
-    nbr_updated = 0
-    for e in src[coll].find(mongodb_src_filter_for_update):
-        # Perform the updates by mongodb '_id' field so we
-        # don't have to know anything about the particular
-        # meaning of the data contained.
-        dst[coll].update_one({"_id": e["_id"]}, {"$set": e}, upsert=True)
-        nbr_updated += 1
-    print(f"Updated {nbr_updated} from collection {coll} in destination.")
-
-    # Hardcoding a certain protection.
-    # This is a sign that the tool wasn't designed as something elegant and general,
-    # but it's to prevent accidents.
-    if coll == "jobs" and days_to_expiration is not None:
         # Query is on DESTINATION.
         nbr_deleted = dst[coll].delete_many(mongodb_filter_for_removal)
         print(f"Deleted {nbr_deleted} from collection {coll} in destination.")
@@ -123,12 +361,4 @@ def main(
 
 
 if __name__ == "__main__":
-
-    main(
-        src_host=args.src_host,
-        src_db=args.src_db,
-        dst_host=args.dst_host,
-        dst_db=args.dst_db,
-        coll=args.coll.replace(" ", ""),
-        days_to_expiration=args.days_to_expiration,
-    )
+    main(sys.argv)
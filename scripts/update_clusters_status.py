@@ -20,7 +20,9 @@ def main():
     # Get clusters
     clusters = get_all_clusters()
 
-    # Generate clusters statuses
+    # Generate clusters statuses. Their update time lets the web server
+    # know that its copy of the statuses is outdated
+    now = datetime.now().timestamp()
     cluster_to_status = []
     for cluster_name in clusters:
         # Cluster error cannot yet be checked, so
@@ -31,6 +33,7 @@ def main():
                 "cluster_name": cluster_name,
                 "jobs_are_old": _jobs_are_old(db_insertion_point, cluster_name),
                 "cluster_has_error": cluster_has_error,
+                "last_update": now,
             }
         )
 
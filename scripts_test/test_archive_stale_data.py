@@ -12,11 +12,14 @@ from scripts_test.config import get_config
 
 import json
 import numpy as np
+import os
+import pytest
 import tempfile
 import time
 
 
-def test_archive_stale_data():
+@pytest.mark.parametrize("archive_extension", [".gz", ".zst"])
+def test_archive_stale_data(archive_extension):
     """ """
 
     # Pick something unique that we don't care about, because we're going
@@ -120,22 +123,26 @@ def test_archive_stale_data():
         if (D_node["cw"]["last_slurm_update"] >= now - seconds_since_last_update)
     ]
 
-    # We're going to have the contents archived to a JSON file, but also returned
-    # by the function call. We can compare all that. If we didn't care about the JSON,
-    # we wouldn't be doing this `NamedTemporaryFile` approach.
+    # We're going to have the contents archived to a compressed JSON lines file,
+    # in several batches, and the number of archived elements returned
+    # by the function call. We can compare all that.
 
-    with tempfile.NamedTemporaryFile(mode="w", dir=None, delete=False) as f_out:
-        # remember the name because you're going to read it later
-        archive_path = f_out.name
+    with tempfile.TemporaryDirectory() as archive_dir:
+        archive_path = os.path.join(archive_dir, f"archive.ndjson{archive_extension}")
 
-        contents_archived_0 = archive_stale_data.archive(
+        nbr_archived = archive_stale_data.archive(
             archive_path,
             days_since_last_update=days_since_last_update,
             database_name=database_name,
+            batch_size=3,
         )
 
-    with open(archive_path, "r") as f_in:
-        contents_archived_1 = json.load(f_in)
+        contents_archived = {"jobs": [], "nodes": []}
+        for collection_name, D in archive_stale_data.read_archive(archive_path):
+            contents_archived[collection_name].append(D)
+
+        # The archival has been completed
+        assert not os.path.exists(f"{archive_path}.checkpoint")
 
     def sorted_by_last_update(E):
         """
@@ -156,16 +163,15 @@ def test_archive_stale_data():
             # we expect "jobs" and "nodes" in there only
             return dict((k, sorted_by_last_update(v)) for (k, v) in E.items())
 
-    # Almost trival verification, more of a validation that `json.dump`
-    # is indeed being called inside of `archive_stale_data.archive`.
-    assert sorted_by_last_update(contents_archived_0) == sorted_by_last_update(
-        contents_archived_1
-    )
+    assert nbr_archived == {
+        "jobs": len(LD_stale_jobs),
+        "nodes": len(LD_stale_nodes),
+    }
 
     # Validate that the archived contents is the old stuff.
     assert sorted_by_last_update(
         {"jobs": LD_stale_jobs, "nodes": LD_stale_nodes}
-    ) == sorted_by_last_update(contents_archived_1)
+    ) == sorted_by_last_update(contents_archived)
 
     # Validate that the fresh stuff is still in the database.
     LD_jobs_still_in_database = list(mc["jobs"].find({}))
@@ -186,3 +192,86 @@ def test_archive_stale_data():
     # clean up (not really necessary)
     mc["jobs"].delete_many({})
     mc["nodes"].delete_many({})
+
+
+def test_archive_stale_data_resumes_after_interruption(monkeypatch):
+    """
+    Interrupt the archival after a batch has been written to the archive,
+    but before it has been deleted from the database, then resume it.
+    Each stale element should be archived exactly once.
+    """
+    database_name = "stale_data_48723mds"
+
+    client = MongoClient(get_config("mongo.connection_string"))
+    mc = client[database_name]
+
+    now = time.time()
+    LD_jobs = [
+        {
+            "cw": {"last_slurm_update": float(now - (40 if i % 3 else 20) * 86400)},
+            "slurm": {"cluster_name": "mila", "job_id": str(i)},
+        }
+        for i in range(20)
+    ]
+    mc["jobs"].delete_many({})
+    mc["jobs"].insert_many(LD_jobs)
+    mc["nodes"].delete_many({})
+    L_stale_job_ids = [
+        D_job["slurm"]["job_id"]
+        for D_job in LD_jobs
+        if D_job["cw"]["last_slurm_update"] < now - 30 * 86400
+    ]
+
+    delete_archived_range = archive_stale_data.delete_archived_range
+    L_calls = []
+
+    def interrupted_delete_archived_range(collection, stale_filter, first_id, last_id):
+        L_calls.append(last_id)
+        if len(L_calls) == 2:
+            raise KeyboardInterrupt()
+        return delete_archived_range(collection, stale_filter, first_id, last_id)
+
+    with tempfile.TemporaryDirectory() as archive_dir:
+        archive_path = os.path.join(archive_dir, "archive.ndjson.gz")
+
+        monkeypatch.setattr(
+            archive_stale_data,
+            "delete_archived_range",
+            interrupted_delete_archived_range,
+        )
+        with pytest.raises(KeyboardInterrupt):
+            archive_stale_data.archive(
+                archive_path,
+                days_since_last_update=30,
+                database_name=database_name,
+                batch_size=4,
+            )
+        assert os.path.exists(f"{archive_path}.checkpoint")
+        # The second batch is still in the database
+        assert mc["jobs"].count_documents({}) == len(LD_jobs) - 4
+
+        # Simulate a batch partially written when the interruption happened
+        with open(archive_path, "ab") as f:
+            f.write(b"partial")
+
+        monkeypatch.setattr(
+            archive_stale_data, "delete_archived_range", delete_archived_range
+        )
+        nbr_archived = archive_stale_data.archive(
+            archive_path,
+            days_since_last_update=30,
+            database_name=database_name,
+            batch_size=4,
+        )
+        assert nbr_archived == {"jobs": len(L_stale_job_ids) - 8, "nodes": 0}
+        assert not os.path.exists(f"{archive_path}.checkpoint")
+
+        L_archived_job_ids = [
+            D["slurm"]["job_id"]
+            for (_, D) in archive_stale_data.read_archive(archive_path)
+        ]
+
+    assert sorted(L_archived_job_ids) == sorted(L_stale_job_ids)
+    assert mc["jobs"].count_documents({}) == len(LD_jobs) - len(L_stale_job_ids)
+
+    mc["jobs"].delete_many({})
@@ -0,0 +1,122 @@
+"""
+Tests that the script to sync two databases copies the entries
+in batches, resumes an interrupted sync, and copies only the
+updated entries in incremental mode.
+"""
+
+from bson import ObjectId
+from pymongo import MongoClient
+import pytest
+
+from scripts import sync_from_one_mongodb_to_another
+from scripts.sync_from_one_mongodb_to_another import (
+    SYNC_STATE_COLLECTION,
+    get_id_ranges,
+    sync_collection,
+)
+from scripts_test.config import get_config
+
+
+@pytest.fixture
+def databases():
+    client = MongoClient(get_config("mongo.connection_string"))
+    for database_name in ["sync_src_58d2k", "sync_dst_58d2k"]:
+        client.drop_database(database_name)
+    yield (client["sync_src_58d2k"], client["sync_dst_58d2k"])
+    for database_name in ["sync_src_58d2k", "sync_dst_58d2k"]:
+        client.drop_database(database_name)
+
+
+def insert_jobs(collection, nbr_jobs, last_slurm_update):
+    """
+    Insert jobs whose "_id" were created one hour apart,
+    and which were updated one second apart.
+    """
+    collection.insert_many(
+        [
+            {
+                "_id": ObjectId(f"{1700000000 + 3600 * i:08x}{i:016x}"),
+                "slurm": {"cluster_name": "mila", "job_id": str(i)},
+                "cw": {"last_slurm_update": last_slurm_update + i},
+            }
+            for i in range(nbr_jobs)
+        ]
+    )
+
+
+def get_entries(collection):
+    return list(collection.find({}).sort("_id", 1))
+
+
+def test_get_id_ranges(databases):
+    (src, _) = databases
+    insert_jobs(src["jobs"], 50, 1000.0)
+
+    L_ranges = get_id_ranges(src["jobs"], {}, 4)
+    assert len(L_ranges) == 4
+    assert L_ranges[0][0] is None and L_ranges[-1][1] is None
+
+    # Each entry belongs to exactly one range
+    for D_job in src["jobs"].find({}):
+        assert (
+            sum(
+                (lower is None or D_job["_id"] > lower)
+                and (upper is None or D_job["_id"] <= upper)
+                for (lower, upper) in L_ranges
+            )
+            == 1
+        )
+
+    # Empty collection
+    assert get_id_ranges(src["nodes"], {}, 4) == [(None, None)]
+
+
+def test_sync_collection(databases):
+    (src, dst) = databases
+    insert_jobs(src["jobs"], 50, 1000.0)
+    # Entries already in the destination are replaced
+    dst["jobs"].insert_one({"_id": src["jobs"].find_one({})["_id"], "outdated": True})
+
+    assert sync_collection(src, dst, "jobs", nbr_workers=3, batch_size=4) == 50
+    assert get_entries(dst["jobs"]) == get_entries(src["jobs"])
+    D_state = dst[SYNC_STATE_COLLECTION].find_one({"_id": "sync_src_58d2k.jobs"})
+    assert "ranges" not in D_state
+    assert D_state["last_sync_watermark"] == 1049.0
+
+    # Only the jobs updated since the previous sync are copied
+    # (along with the last updated one, whose update time is the watermark)
+    src["jobs"].update_many(
+        {"slurm.job_id": {"$in": ["3", "30"]}},
+        {"$set": {"cw.last_slurm_update": 2000.0}},
+    )
+    assert (
+        sync_collection(src, dst, "jobs", incremental=True, nbr_workers=3, batch_size=4)
+        == 3
+    )
+    assert get_entries(dst["jobs"]) == get_entries(src["jobs"])
+
+
+def test_sync_collection_resumes_after_interruption(databases, monkeypatch):
+    (src, dst) = databases
+    insert_jobs(src["jobs"], 20, 1000.0)
+
+    write_batch = sync_from_one_mongodb_to_another.write_batch
+    L_batches = []
+
+    def interrupted_write_batch(dst_collection, LD_entries):
+        L_batches.append(LD_entries)
+        if len(L_batches) == 3:
+            raise KeyboardInterrupt()
+        return write_batch(dst_collection, LD_entries)
+
+    monkeypatch.setattr(
+        sync_from_one_mongodb_to_another, "write_batch", interrupted_write_batch
+    )
+    with pytest.raises(KeyboardInterrupt):
+        sync_collection(src, dst, "jobs", nbr_workers=1, batch_size=4)
+    assert dst["jobs"].count_documents({}) == 8
+
+    monkeypatch.setattr(sync_from_one_mongodb_to_another, "write_batch", write_batch)
+    # The entries copied before the interruption are not copied again
+    assert sync_collection(src, dst, "jobs", nbr_workers=1, batch_size=4) == 12
+    assert get_entries(dst["jobs"]) == get_entries(src["jobs"])
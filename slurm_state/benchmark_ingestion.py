@@ -0,0 +1,371 @@
+"""
+To be run as standalone script, manually, in order to measure the
+throughput of the ingestion of the Slurm reports.
+
+Synthetic sacct and sinfo reports of the requested sizes are generated from
+the entities of the reports of slurm_state_test/files. Each report is then
+ingested twice (once in an empty database, then once again, in which case all
+the entities are unchanged), and the following stages are timed separately:
+    - parse:        decoding the entities from the report
+    - translate:    translating them into Clockwork entities
+    - user_lookup:  associating the jobs to their Clockwork users
+    - diff:         computing the database operations
+    - bulk_write:   writing these operations into the database
+
+The results are written as JSON, so that they can be compared across releases.
+
+The database used is the one of the configuration (it should not be the
+production one), in which the collections of the benchmark are created and
+dropped. With --in_process, an in-memory stand-in of MongoDB is used instead,
+which requires the mongomock package.
+
+Example:
+    python3 -m slurm_state.benchmark_ingestion --sizes 10000 100000 --in_process
+"""
+
+import argparse, copy, datetime, json, os, platform, tempfile, time
+from contextlib import contextmanager
+
+from slurm_state.config import get_config
+from slurm_state.helpers.bulk_write_helper import bulk_write_in_chunks
+from slurm_state.helpers.json_stream_helper import iter_json_object_items
+from slurm_state.mongo_update import (
+    UserAccountIndex,
+    get_jobs_updates_and_insertions,
+    get_nodes_updates,
+    slurm_job_to_clockwork_job,
+    slurm_node_to_clockwork_node,
+)
+from slurm_state.parsers.job_parser import translate_job_v21_v22_and_23
+from slurm_state.parsers.node_parser import translate_node_v21_and_v22
+
+# Reports from which the synthetic entities are modeled
+TEMPLATE_REPORTS = {
+    "jobs": ["slurm_state_test/files/sacct_1", "slurm_state_test/files/sacct_2"],
+    "nodes": ["slurm_state_test/files/sinfo_1", "slurm_state_test/files/sinfo_2"],
+}
+
+# Number of users to which the synthetic jobs belong
+NBR_USERS = 1000
+
+JOB_STATES = ["PENDING", "RUNNING", "COMPLETED", "FAILED", "CANCELLED", "TIMEOUT"]
+NODE_STATES = ["idle", "mixed", "allocated", "down", "drain"]
+
+
+def load_template_entities(entity):
+    """
+    Load the entities of the template reports of an entity ("jobs" or "nodes").
+
+    Returns:
+        A 2-tuple containing the "meta" field of the first report, and
+        the list of the entities of the reports
+    """
+    L_entities = []
+    D_meta = None
+    for report_path in TEMPLATE_REPORTS[entity]:
+        with open(report_path, "r") as f:
+            D_report = json.load(f)
+        D_meta = D_meta or D_report["meta"]
+        L_entities.extend(D_report[entity])
+    return (D_meta, L_entities)
+
+
+def generate_synthetic_job(template, index, cluster_name, now):
+    """
+    Generate a job from a template job, with realistic variations
+    of its identifiers, user, state and times.
+    """
+    job = copy.deepcopy(template)
+    job["job_id"] = 1000000 + index
+    job["name"] = f"synthetic-job-{index % 5000}"
+    job["cluster"] = cluster_name
+    job["user"] = f"user{index % NBR_USERS:04d}"
+    job["account"] = f"def-account-{index % 20}"
+    job["array"]["job_id"] = 0 if index % 4 else 1000000 + index - index % 10
+    job["array"]["task_id"] = None if index % 4 else index % 10
+    job["state"]["current"] = JOB_STATES[index % len(JOB_STATES)]
+    job["time"]["submission"] = now - 3600 - index % 86400
+    job["time"]["start"] = 0 if job["state"]["current"] == "PENDING" else now - 3600
+    job["time"]["end"] = (
+        0 if job["state"]["current"] in ["PENDING", "RUNNING"] else now - index % 3600
+    )
+    job["time"]["limit"] = 60 * (1 + index % 48)
+    job["nodes"] = f"cn-{index % 500:04d}"
+    job["working_directory"] = f"/home/user{index % NBR_USERS:04d}/project"
+    return job
+
+
+def generate_synthetic_node(template, index, cluster_name, now):
+    """
+    Generate a node from a template node, with a unique name and a varying state.
+    """
+    node = copy.deepcopy(template)
+    node["name"] = f"cn-{index:07d}"
+    node["address"] = node["name"]
+    node["hostname"] = node["name"]
+    node["state"] = NODE_STATES[index % len(NODE_STATES)]
+    node["last_busy"] = now - index % 3600
+    return node
+
+
+def generate_synthetic_report(entity, nbr_entities, cluster_name, report_path):
+    """
+    Write a synthetic report of sacct --json (for the jobs) or sinfo --json (for
+    the nodes) containing nbr_entities entities. The entities are written one at
+    a time, so that large reports can be generated without holding them in memory.
+    """
+    (D_meta, L_templates) = load_template_entities(entity)
+    generate_entity = (
+        generate_synthetic_job if entity == "jobs" else generate_synthetic_node
+    )
+    now = int(time.time())
+
+    with open(report_path, "w") as f:
+        f.write(f'{{"meta": {json.dumps(D_meta)}, "errors": [], "{entity}": [')
+        for index in range(nbr_entities):
+            if index:
+                f.write(",\n")
+            template = L_templates[index % len(L_templates)]
+            json.dump(generate_entity(template, index, cluster_name, now), f)
+        f.write("]}")
+
+
+def generate_synthetic_users(users_collection):
+    """
+    Store in the database the users to which the synthetic jobs belong.
+    """
+    users_collection.insert_many(
+        [
+            {
+                "mila_email_username": f"user{i:04d}@mila.quebec",
+                "mila_cluster_username": f"user{i:04d}",
+                "cc_account_username": f"user{i:04d}",
+                "status": "enabled",
+            }
+            for i in range(NBR_USERS)
+        ]
+    )
+
+
+class StageTimer:
+    """
+    Measure the duration of the stages of an ingestion.
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        timestamp_start = time.perf_counter()
+        yield
+        self.durations[name] = self.durations.get(name, 0) + (
+            time.perf_counter() - timestamp_start
+        )
+
+
+def ingest_report(entity, report_path, cluster_name, database):
+    """
+    Ingest a synthetic report, timing each stage.
+
+    Returns:
+        A dictionary associating the name of each stage to its duration
+        in seconds, and "total" to the sum of these durations
+    """
+    timer = StageTimer()
+    collection = database[entity]
+
+    with timer.stage("parse"):
+        with open(report_path, "rb") as f:
+            L_slurm_entities = [
+                slurm_entity
+                for key, slurm_entity in iter_json_object_items(
+                    f, streamed_keys=[entity]
+                )
+                if key == entity
+            ]
+
+    with timer.stage("translate"):
+        if entity == "jobs":
+            L_entities = [
+                slurm_job_to_clockwork_job(
+                    dict(
+                        translate_job_v21_v22_and_23(slurm_entity),
+                        cluster_name=cluster_name,
+                    )
+                )
+                for slurm_entity in L_slurm_entities
+            ]
+        else:
+            L_entities = [
+                slurm_node_to_clockwork_node(
+                    dict(
+                        translate_node_v21_and_v22(slurm_entity),
+                        cluster_name=cluster_name,
+                    )
+                )
+                for slurm_entity in L_slurm_entities
+            ]
+
+    if entity == "jobs":
+        with timer.stage("user_lookup"):
+            user_account_lookup = UserAccountIndex(database["users"])
+            L_entities = list(map(user_account_lookup, L_entities))
+
+        # The users are already associated, so the lookup done again while
+        # the operations are computed only hits the index loaded above
+        with timer.stage("diff"):
+            (L_updates_to_do, _, _) = get_jobs_updates_and_insertions(
+                iter(L_entities),
+                cluster_name,
+                collection,
+                database["users"],
+                user_account_lookup=user_account_lookup,
+            )
+    else:
+        with timer.stage("diff"):
+            (L_updates_to_do, _) = get_nodes_updates(
+                iter(L_entities), cluster_name, collection
+            )
+
+    with timer.stage("bulk_write"):
+        bulk_write_in_chunks(collection, L_updates_to_do)
+
+    D_durations = dict(timer.durations)
+    D_durations["total"] = sum(timer.durations.values())
+    return D_durations
+
+
+def run_benchmark(database, cluster_name, sizes, entities, work_dir):
+    """
+    Generate and ingest the synthetic reports of each size.
+
+    Returns:
+        A list of dictionaries, one per entity and size, containing the
+        durations of the stages of the first and second ingestions
+    """
+    L_results = []
+    for entity in entities:
+        for nbr_entities in sizes:
+            for collection_name in ["jobs", "nodes", "users"]:
+                database.drop_collection(collection_name)
+            generate_synthetic_users(database["users"])
+            database["jobs"].create_index(
+                [("slurm.job_id", 1), ("slurm.cluster_name", 1)],
+                name="job_id_and_cluster_name",
+            )
+            database["nodes"].create_index(
+                [("slurm.name", 1), ("slurm.cluster_name", 1)],
+                name="name_and_cluster_name",
+            )
+
+            report_path = os.path.join(work_dir, f"{entity}_{nbr_entities}.json")
+            timestamp_start = time.perf_counter()
+            generate_synthetic_report(entity, nbr_entities, cluster_name, report_path)
+            generation_duration = time.perf_counter() - timestamp_start
+
+            D_result = {
+                "entity": entity,
+                "nbr_entities": nbr_entities,
+                "report_size": os.path.getsize(report_path),
+                "generation": generation_duration,
+            }
+            # The first ingestion inserts all the entities, the second
+            # one finds them unchanged
+            for ingestion in ["first_ingestion", "second_ingestion"]:
+                D_durations = ingest_report(entity, report_path, cluster_name, database)
+                D_durations["entities_per_second"] = nbr_entities / D_durations["total"]
+                D_result[ingestion] = D_durations
+            print(json.dumps(D_result))
+            L_results.append(D_result)
+
+            os.remove(report_path)
+            for collection_name in ["jobs", "nodes", "users"]:
+                database.drop_collection(collection_name)
+
+    return L_results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog=argv[0],
+        description="Measure the throughput of the ingestion of synthetic Slurm reports.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+        help="Numbers of entities of the generated reports.",
+    )
+    parser.add_argument(
+        "--entities",
+        nargs="+",
+        choices=["jobs", "nodes"],
+        default=["jobs", "nodes"],
+        help="Entities for which reports are generated.",
+    )
+    parser.add_argument(
+        "-c",
+        "--cluster_name",
+        default="mila",
+        help="Name of the configured cluster to which the entities belong.",
+    )
+    parser.add_argument(
+        "--mongodb_database",
+        default="clockwork_benchmark",
+        help="Database in which the benchmark collections are created and dropped.",
+    )
+    parser.add_argument(
+        "--in_process",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not an in-memory stand-in of MongoDB (mongomock) is used instead of the configured database.",
+    )
+    parser.add_argument(
+        "--output",
+        help="Path of the JSON file in which the results are written. If None, they are written on stdout.",
+    )
+    args = parser.parse_args(argv[1:])
+
+    if args.in_process:
+        try:
+            import mongomock
+        except ImportError:
+            raise Exception(
+                "The mongomock package is required to run the benchmark with --in_process."
+            )
+        client = mongomock.MongoClient()
+    else:
+        from slurm_state.mongo_client import get_mongo_client
+
+        client = get_mongo_client()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        L_results = run_benchmark(
+            client[args.mongodb_database],
+            args.cluster_name,
+            args.sizes,
+            args.entities,
+            work_dir,
+        )
+
+    D_output = {
+        "date": datetime.datetime.now().isoformat(),
+        "python_version": platform.python_version(),
+        "database": "mongomock" if args.in_process else "mongodb",
+        "bulk_write_chunk_size": get_config("mongo.bulk_write_chunk_size"),
+        "bulk_write_workers": get_config("mongo.bulk_write_workers"),
+        "results": L_results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(D_output, f, indent=4)
+        print(f"Wrote the results to {args.output}.")
+    else:
+        print(json.dumps(D_output, indent=4))
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(sys.argv)
@@ -0,0 +1,105 @@
+"""
+To be run as standalone script, manually, in order to measure how
+many Slurm entities per second are translated by the parsers.
+
+The entities of a sacct or sinfo report are replicated in order to reach
+the requested number of entities, then translated by the field map applied
+one field at a time (as the parsers did before the field maps were compiled)
+and by the compiled function used by the parsers.
+
+Example:
+    python3 -m slurm_state.benchmark_translation \
+        --report slurm_state_test/files/sacct_1 --nbr_entities 100000
+"""
+
+import argparse, copy, json, time
+
+from slurm_state.helpers.parser_helper import translate_with_field_map
+from slurm_state.parsers.job_parser import (
+    JOB_FIELD_MAP_V21_V22_AND_23,
+    translate_job_v21_v22_and_23,
+)
+from slurm_state.parsers.node_parser import (
+    NODE_FIELD_MAP_V21_AND_V22,
+    translate_node_v21_and_v22,
+)
+
+
+def time_translation(translate, L_entities, nbr_repetitions):
+    """
+    Translate all the entities, and return the best number of entities
+    translated per second over the repetitions.
+    """
+    best_duration = None
+    for _ in range(nbr_repetitions):
+        # The entities are copied beforehand, as some translators modify them
+        L_copies = copy.deepcopy(L_entities)
+        timestamp_start = time.perf_counter()
+        for entity in L_copies:
+            translate(entity)
+        duration = time.perf_counter() - timestamp_start
+        if best_duration is None or duration < best_duration:
+            best_duration = duration
+    return len(L_entities) / best_duration
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog=argv[0],
+        description="Measure the translation speed of the Slurm entities.",
+    )
+    parser.add_argument(
+        "--report",
+        default="slurm_state_test/files/sacct_1",
+        help="sacct or sinfo report (in JSON) whose entities are translated.",
+    )
+    parser.add_argument(
+        "--nbr_entities",
+        type=int,
+        default=100000,
+        help="Number of entities to translate.",
+    )
+    parser.add_argument(
+        "--nbr_repetitions",
+        type=int,
+        default=5,
+        help="Number of times the translation is measured. The best measure is kept.",
+    )
+    args = parser.parse_args(argv[1:])
+
+    with open(args.report, "r") as f:
+        D_report = json.load(f)
+
+    if "jobs" in D_report:
+        (L_report_entities, field_map, translate) = (
+            D_report["jobs"],
+            JOB_FIELD_MAP_V21_V22_AND_23,
+            translate_job_v21_v22_and_23,
+        )
+    else:
+        (L_report_entities, field_map, translate) = (
+            D_report["nodes"],
+            NODE_FIELD_MAP_V21_AND_V22,
+            translate_node_v21_and_v22,
+        )
+
+    L_entities = [
+        L_report_entities[i % len(L_report_entities)] for i in range(args.nbr_entities)
+    ]
+
+    field_map_speed = time_translation(
+        lambda entity: translate_with_field_map(field_map, entity),
+        L_entities,
+        args.nbr_repetitions,
+    )
+    compiled_speed = time_translation(translate, L_entities, args.nbr_repetitions)
+
+    print(f"Field map applied field by field: {field_map_speed:.0f} entities/second")
+    print(f"Compiled field map: {compiled_speed:.0f} entities/second")
+    print(f"Speedup: {compiled_speed / field_map_speed:.2f}x")
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(sys.argv)
@@ -0,0 +1,158 @@
+"""
+Helper functions used to write many operations into the database.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from slurm_state.config import get_config, register_config, integer
+
+# Number of operations sent in each bulk write
+register_config("mongo.bulk_write_chunk_size", 1000, validator=integer)
+# Number of bulk writes sent at the same time
+register_config("mongo.bulk_write_workers", 4, validator=integer)
+# Number of times a chunk is sent again after a transient error
+register_config("mongo.bulk_write_retries", 3, validator=integer)
+
+# Error codes of the write errors which are worth retrying
+# (network errors, primary changes, shutdowns in progress, timeouts)
+TRANSIENT_ERROR_CODES = {
+    6,
+    7,
+    89,
+    91,
+    189,
+    262,
+    9001,
+    10107,
+    11600,
+    11602,
+    13435,
+    13436,
+}
+# Error code of a duplicate key, raised when an insertion already done is retried
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# Counters of the results of the bulk writes
+BULK_RESULT_COUNTERS = ["nInserted", "nUpserted", "nMatched", "nModified", "nRemoved"]
+
+
+def write_chunk(collection, L_operations, nbr_retries, retry_delay=1.0):
+    """
+    Send a list of operations in one unordered bulk write.
+
+    The operations which failed because of a transient error are sent
+    again, at most nbr_retries times.
+
+    Returns:
+        A 2-tuple containing (in this order) the following elements:
+            - A dictionary of the counters listed in BULK_RESULT_COUNTERS
+            - A list of the write errors which have not been solved by the retries
+    """
+    D_counters = {counter: 0 for counter in BULK_RESULT_COUNTERS}
+    L_write_errors = []
+
+    for attempt in range(nbr_retries + 1):
+        L_retried_operations = []
+        try:
+            result = collection.bulk_write(L_operations, ordered=False)
+            D_result = result.bulk_api_result
+        except AutoReconnect as err:
+            # The whole chunk is sent again. The updates are idempotent, and the
+            # insertions keep their _id, so the ones already done are detected below
+            if attempt == nbr_retries:
+                raise
+            print(f"Transient error while writing a chunk, retrying: {err}")
+            L_retried_operations = L_operations
+            D_result = {}
+        except BulkWriteError as err:
+            D_result = err.details
+            for D_error in D_result.get("writeErrors", []):
+                operation = L_operations[D_error["index"]]
+                if (
+                    D_error["code"] == DUPLICATE_KEY_ERROR_CODE
+                    and attempt > 0
+                    and isinstance(operation, InsertOne)
+                ):
+                    # This insertion has been done before the transient error
+                    continue
+                if D_error["code"] in TRANSIENT_ERROR_CODES and attempt < nbr_retries:
+                    L_retried_operations.append(operation)
+                else:
+                    L_write_errors.append(D_error)
+
+        for counter in BULK_RESULT_COUNTERS:
+            D_counters[counter] += D_result.get(counter, 0)
+
+        if not L_retried_operations:
+            break
+        L_operations = L_retried_operations
+        time.sleep(retry_delay * 2**attempt)
+
+    return (D_counters, L_write_errors)
+
+
+def bulk_write_in_chunks(
+    collection, L_operations, chunk_size=None, nbr_workers=None, nbr_retries=None
+):
+    """
+    Write a list of operations into a collection, split into unordered
+    bulk writes which are sent concurrently.
+
+    Thus, a slow or failing operation does not block the operations of the
+    other chunks. The operations should not depend on each other, as their
+    order is not kept.
+
+    Parameters:
+        collection      The collection in which the operations are done
+        L_operations    List of operations (InsertOne, UpdateOne, UpdateMany, etc, from pymongo)
+        chunk_size      Number of operations per bulk write. Default is the mongo.bulk_write_chunk_size configuration
+        nbr_workers     Number of bulk writes sent at the same time. Default is the mongo.bulk_write_workers configuration
+        nbr_retries     Number of times the operations failing because of a transient error are sent again.
+                        Default is the mongo.bulk_write_retries configuration
+
+    Returns:
+        A dictionary containing the sums of the counters listed in BULK_RESULT_COUNTERS
+        over all the chunks, and the number of write errors under the key "nWriteErrors"
+
+    Raises:
+        BulkWriteError if some operations failed, once all the chunks have been written.
+        Its details contain the aggregated counters and the write errors.
+    """
+    chunk_size = chunk_size or get_config("mongo.bulk_write_chunk_size")
+    nbr_workers = nbr_workers or get_config("mongo.bulk_write_workers")
+    if nbr_retries is None:
+        nbr_retries = get_config("mongo.bulk_write_retries")
+
+    L_chunks = [
+        L_operations[i : i + chunk_size]
+        for i in range(0, len(L_operations), chunk_size)
+    ]
+
+    D_totals = {counter: 0 for counter in BULK_RESULT_COUNTERS}
+    L_write_errors = []
+
+    with ThreadPoolExecutor(
+        max_workers=max(min(nbr_workers, len(L_chunks)), 1)
+    ) as executor:
+        L_futures = [
+            executor.submit(write_chunk, collection, L_chunk, nbr_retries)
+            for L_chunk in L_chunks
+        ]
+        for chunk_index, future in enumerate(L_futures):
+            (D_counters, L_chunk_errors) = future.result()
+            for counter in BULK_RESULT_COUNTERS:
+                D_totals[counter] += D_counters[counter]
+            L_write_errors.extend(L_chunk_errors)
+            print(
+                f"Chunk {chunk_index + 1}/{len(L_chunks)} written: {D_counters}"
+                + (f", {len(L_chunk_errors)} errors" if L_chunk_errors else "")
+            )
+
+    D_totals["nWriteErrors"] = len(L_write_errors)
+    if L_write_errors:
+        raise BulkWriteError(dict(D_totals, writeErrors=L_write_errors))
+    return D_totals
@@ -4,7 +4,9 @@ Helper functions related to the clusters.
 
 from slurm_state.config import (
     get_config,
+    boolean,
     string,
+    string_choices,
     optional_string,
     string_list,
     integer,
@@ -28,6 +30,20 @@ def alloc_valid(value):
     return string_list(value)
 
 
+def compression_valid(value):
+    """
+    Check if the "remote_compression" field of a cluster is either false
+    or the name of a compression format handled for the reports
+
+    Parameters:
+        - value     The value of the field "remote_compression" for a cluster in the
+                    configuration file
+    """
+    if value is False:
+        return value
+    return string_choices("gzip", "zstd")(value)
+
+
 def _load_clusters_from_config():
     """
     Import the clusters from the config file
@@ -62,10 +78,32 @@ def _load_clusters_from_config():
 
     clusters_valid.add_field("ssh_key_filename", string)
     clusters_valid.add_field("ssh_port", integer)
+    # Compression of the SSH transport
+    clusters_valid.add_field("ssh_compression", boolean, default=False)
+    # Compression of the reports on the cluster before their transfer (false, "gzip" or "zstd")
+    clusters_valid.add_field("remote_compression", compression_valid, default=False)
 
     clusters_valid.add_field("sacct_path", optional_string)
     clusters_valid.add_field("sinfo_path", optional_string)
     clusters_valid.add_field("slurm_version", optional_string, default=None)
+    # Number of seconds during which the Slurm version retrieved from the
+    # cluster is reused, when it is not set in the configuration
+    clusters_valid.add_field("slurm_version_cache_ttl", integer, default=86400)
+    # Remote paths of the sacct and sinfo JSON reports periodically written on the
+    # cluster by its administrators. If set, these reports are copied through SFTP
+    # instead of running sacct or sinfo
+    clusters_valid.add_field("sacct_cached_report", optional_string, default=False)
+    clusters_valid.add_field("sinfo_cached_report", optional_string, default=False)
+    # Time window of the sacct reports, when it starts from the last ingested time.
+    # The overlap (in seconds) is retrieved again at each ingestion, and the window
+    # is limited to sacct_max_window seconds if it is not 0
+    clusters_valid.add_field("sacct_window_overlap", integer, default=60)
+    clusters_valid.add_field("sacct_max_window", integer, default=0)
+    # Scheduling of the cluster by the ingestion daemon, in seconds.
+    # The interval is doubled after each failure, up to ingestion_max_backoff
+    clusters_valid.add_field("ingestion_interval", integer, default=600)
+    clusters_valid.add_field("ingestion_timeout", integer, default=1800)
+    clusters_valid.add_field("ingestion_max_backoff", integer, default=3600)
 
     # Load the clusters from the configuration file, asserting that it uses the
     # predefined format
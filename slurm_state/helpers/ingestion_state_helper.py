@@ -0,0 +1,212 @@
+"""
+Helper functions related to the ingestion state of the clusters.
+
+The ingestion state is stored in a MongoDB collection, with one document
+per cluster and per entity ("jobs" or "nodes"), such as:
+    {
+        "cluster_name": "mila",
+        "entity": "jobs",
+        "watermark": 1680193479.2,
+        "last_report": {
+            "path": "/tmp/slurm_report/mila/sacct_report",
+            "size": 48120,
+            "mtime": 1680193501.6,
+            "hash": "5c3b...",
+            "ingestion_time": 1680193512.1,
+        },
+        "nbr_skipped_reports": 3,
+        "last_skipped_report_time": 1680194112.4,
+    }
+The Slurm version of a cluster, shared by its jobs and nodes, is stored
+in the document of the entity SLURM_VERSION_ENTITY:
+    {
+        "cluster_name": "mila",
+        "entity": "slurm",
+        "slurm_version": "22.05.9",
+        "slurm_version_time": 1680193479.2,
+    }
+"""
+
+import hashlib, os, time
+
+# Name of the collection storing the ingestion state
+INGESTION_STATE_COLLECTION = "ingestion_state"
+# Entity under which the Slurm version of a cluster is stored
+SLURM_VERSION_ENTITY = "slurm"
+
+
+def create_ingestion_state_index(ingestion_state_collection):
+    """
+    Create the index used to retrieve the ingestion state of a cluster.
+    """
+    ingestion_state_collection.create_index(
+        [("cluster_name", 1), ("entity", 1)],
+        name="cluster_name_and_entity",
+        unique=True,
+    )
+
+
+def get_ingestion_state(ingestion_state_collection, cluster_name, entity):
+    """
+    Retrieve the ingestion state of an entity on a cluster.
+
+    Returns:
+        A dictionary, which is empty if nothing has been stored yet
+    """
+    D_state = ingestion_state_collection.find_one(
+        {"cluster_name": cluster_name, "entity": entity}, {"_id": 0}
+    )
+    return D_state or {}
+
+
+def update_ingestion_state(ingestion_state_collection, cluster_name, entity, D_fields):
+    """
+    Set some fields of the ingestion state of an entity on a cluster.
+    """
+    ingestion_state_collection.update_one(
+        {"cluster_name": cluster_name, "entity": entity},
+        {"$set": D_fields},
+        upsert=True,
+    )
+
+
+def get_ingestion_watermark(ingestion_state_collection, cluster_name, entity="jobs"):
+    """
+    Retrieve the end of the last time window which has been successfully
+    committed to the database for a cluster, or None if there is none.
+    """
+    return get_ingestion_state(ingestion_state_collection, cluster_name, entity).get(
+        "watermark", None
+    )
+
+
+def set_ingestion_watermark(
+    ingestion_state_collection, cluster_name, watermark, entity="jobs"
+):
+    """
+    Store the end of the last time window which has been successfully
+    committed to the database for a cluster.
+    """
+    update_ingestion_state(
+        ingestion_state_collection, cluster_name, entity, {"watermark": watermark}
+    )
+
+
+def get_file_hash(file_path, chunk_size=1 << 20):
+    """
+    Compute the hash of a file, reading it one chunk at a time.
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def check_report_unchanged(
+    ingestion_state_collection, cluster_name, entity, report_path
+):
+    """
+    Check whether a report is identical to the last report ingested for
+    an entity on a cluster.
+
+    The report is considered unchanged if it has the same size and
+    modification time as the last one, or the same size and content hash.
+    The hash is only computed when the size matches but the modification
+    time does not, or when there is no previous report to compare with.
+
+    Returns:
+        A 2-tuple containing (in this order) the following elements:
+            - True if the report has not changed, False otherwise
+            - The description of the report to store in the ingestion state
+              once it is ingested (see record_ingested_report)
+    """
+    stat = os.stat(report_path)
+    D_report = {"path": report_path, "size": stat.st_size, "mtime": stat.st_mtime}
+    D_last_report = get_ingestion_state(
+        ingestion_state_collection, cluster_name, entity
+    ).get("last_report", {})
+
+    if (
+        D_last_report.get("size") == D_report["size"]
+        and D_last_report.get("mtime") == D_report["mtime"]
+        and "hash" in D_last_report
+    ):
+        D_report["hash"] = D_last_report["hash"]
+        return (True, D_report)
+
+    D_report["hash"] = get_file_hash(report_path)
+    return (
+        D_last_report.get("size") == D_report["size"]
+        and D_last_report.get("hash") == D_report["hash"],
+        D_report,
+    )
+
+
+def record_ingested_report(ingestion_state_collection, cluster_name, entity, D_report):
+    """
+    Store the description of the last report ingested for an entity on a cluster.
+    """
+    update_ingestion_state(
+        ingestion_state_collection,
+        cluster_name,
+        entity,
+        {"last_report": dict(D_report, ingestion_time=time.time())},
+    )
+
+
+def record_skipped_report(ingestion_state_collection, cluster_name, entity):
+    """
+    Count a report skipped because it did not change since its last ingestion.
+    """
+    ingestion_state_collection.update_one(
+        {"cluster_name": cluster_name, "entity": entity},
+        {
+            "$inc": {"nbr_skipped_reports": 1},
+            "$set": {"last_skipped_report_time": time.time()},
+        },
+        upsert=True,
+    )
+
+
+def get_cached_slurm_version(ingestion_state_collection, cluster_name, ttl):
+    """
+    Retrieve the Slurm version stored for a cluster.
+
+    Parameters:
+        ingestion_state_collection  Collection storing the ingestion state of the clusters
+        cluster_name                Name of the cluster
+        ttl                         Number of seconds during which a stored version is used
+
+    Returns:
+        The Slurm version, or None if none has been stored during the last ttl seconds
+    """
+    D_state = get_ingestion_state(
+        ingestion_state_collection, cluster_name, SLURM_VERSION_ENTITY
+    )
+    if time.time() - D_state.get("slurm_version_time", 0) > ttl:
+        return None
+    return D_state.get("slurm_version", None)
+
+
+def set_cached_slurm_version(ingestion_state_collection, cluster_name, slurm_version):
+    """
+    Store the Slurm version of a cluster.
+    """
+    update_ingestion_state(
+        ingestion_state_collection,
+        cluster_name,
+        SLURM_VERSION_ENTITY,
+        {"slurm_version": slurm_version, "slurm_version_time": time.time()},
+    )
+
+
+def invalidate_cached_slurm_version(ingestion_state_collection, cluster_name):
+    """
+    Remove the Slurm version stored for a cluster, for instance after the
+    ingestion of a report generated by another version.
+    """
+    ingestion_state_collection.update_one(
+        {"cluster_name": cluster_name, "entity": SLURM_VERSION_ENTITY},
+        {"$unset": {"slurm_version": "", "slurm_version_time": ""}},
+    )
@@ -0,0 +1,188 @@
+"""
+This file gathers the functions used to read the JSON reports generated by
+Slurm without loading them entirely in memory.
+
+The reports generated by sacct and sinfo are JSON objects such as
+    {"meta": {...}, "errors": [...], "jobs": [{...}, {...}, ...]}
+in which the array of entities can be huge. Thus, the elements of such an
+array are decoded and yielded one at a time, while the other values
+(such as "meta") are decoded entirely.
+"""
+
+import codecs, json
+
+_decoder = json.JSONDecoder()
+_WHITESPACES = " \t\n\r"
+
+
+class JSONStreamReader:
+    """
+    Read a JSON document from a file object, one value at a time.
+
+    The file object can be opened in text or binary mode (in which case
+    its content is decoded as UTF-8). Only the part of the document which
+    has not been decoded yet is kept in memory.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size=None):
+        """
+        Append the next chunk of the file to the buffer, dropping the part
+        of the buffer which has already been decoded.
+
+        Returns:
+            False if the end of the file has been reached, True otherwise
+        """
+        while True:
+            chunk = self.f.read(size or self.chunk_size)
+            if not chunk:
+                if isinstance(chunk, bytes):
+                    # Fails on a truncated multibyte character
+                    self.utf8_decoder.decode(b"", final=True)
+                self.eof = True
+                return False
+            if isinstance(chunk, bytes):
+                # The chunk can end in the middle of a multibyte character,
+                # which is only returned with the next chunk
+                chunk = self.utf8_decoder.decode(chunk)
+            if chunk:
+                break
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip the whitespaces and return the next character, without
+        consuming it. Returns "" at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACES:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ""
+
+    def _expect(self, expected_chars):
+        """
+        Consume the next character, which has to be one of `expected_chars`.
+        """
+        c = self._peek()
+        if c == "" or c not in expected_chars:
+            raise ValueError(
+                f"Invalid JSON document: expected one of {list(expected_chars)} but found {repr(c)}."
+            )
+        self.pos += 1
+        return c
+
+    def read_value(self):
+        """
+        Decode the next JSON value entirely.
+        """
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A value reaching the end of the buffer could be a truncated number
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Read bigger and bigger chunks in order to avoid decoding a long
+            # value too many times
+            self._read_more(size)
+            size *= 2
+
+    def iter_array(self):
+        """
+        Yield the elements of the next JSON array one at a time.
+        """
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._expect(",]") == "]":
+                return
+
+    def iter_object(self, streamed_keys=()):
+        """
+        Yield the (key, value) pairs of the next JSON object.
+
+        If the value associated to a key of `streamed_keys` is an array,
+        a (key, element) pair is yielded for each one of its elements instead.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            if key in streamed_keys and self._peek() == "[":
+                for element in self.iter_array():
+                    yield (key, element)
+            else:
+                yield (key, self.read_value())
+            if self._expect(",}") == "}":
+                return
+
+
+def iter_json_object_items(f, streamed_keys=()):
+    """
+    Yield the (key, value) pairs of the JSON object stored in the file `f`.
+    The arrays associated to the keys of `streamed_keys` are yielded
+    element by element (see JSONStreamReader.iter_object).
+    """
+    return JSONStreamReader(f).iter_object(streamed_keys=streamed_keys)
+
+
+def iter_json_array_items(f):
+    """
+    Yield the elements of the JSON array stored in the file `f`.
+    """
+    return JSONStreamReader(f).iter_array()
+
+
+def get_slurm_report_version(f):
+    """
+    Retrieve the Slurm version stored in the "meta" field of a report
+    generated by sacct or sinfo, without reading the rest of the report.
+
+    Returns:
+        The Slurm version, as a string
+    """
+    for key, value in iter_json_object_items(f, streamed_keys=["jobs", "nodes"]):
+        if key == "meta":
+            return get_slurm_version_from_meta(value)
+
+    raise Exception('"meta" not found in the report')
+
+
+def get_slurm_version_from_meta(D_meta):
+    """
+    Retrieve the Slurm version stored in the "meta" field of a report
+    generated by sacct or sinfo.
+
+    Returns:
+        The Slurm version, as a string
+    """
+    if "Slurm" in D_meta:
+        version = D_meta["Slurm"]["version"]
+    elif "slurm" in D_meta:
+        version = D_meta["slurm"]["version"]
+    else:
+        raise Exception('"Slurm" or "slurm" not found in data["meta"]')
+    return f"{version['major']}.{version['micro']}.{version['minor']}"
@@ -1,12 +1,42 @@
 """
 This file gathers the function shared by the job parser and the node parser
+
+A translator is a function (k, v, res) storing in the dictionary res the
+fields obtained from the key k and the value v of a Slurm entity. The
+translators of a field map can be compiled into a single function (see
+compile_field_map), for which each translator provides the Python code
+doing its work (see inline).
 """
 
 
+def inline(code_generator):
+    """
+    Attach to a translator the function generating its code.
+
+    Parameters:
+        code_generator  Function (k, v, ctx) returning the list of the lines of
+                        Python code translating the field k, whose value is
+                        stored in the variable named v, into the dictionary res.
+                        ctx is the TranslationCompiler used, which can store
+                        the objects needed by this code
+
+    Returns:
+        A decorator to apply on the translator
+    """
+
+    def decorator(translator):
+        translator.inline = code_generator
+        return translator
+
+    return decorator
+
+
+@inline(lambda k, v, ctx: [f"res[{k!r}] = {v}"])
 def copy(k, v, res):
     res[k] = v
 
 
+@inline(lambda k, v, ctx: [f"res[{k!r}] = None if {v} == '' else {v}"])
 def copy_with_none_as_empty_string(k, v, res):
     if v == "":
         res[k] = None
@@ -15,17 +45,25 @@ def copy_with_none_as_empty_string(k, v, res):
 
 
 def rename(name):
+    @inline(lambda k, v, ctx: [f"res[{name!r}] = {v}"])
     def renamer(k, v, res):
         res[name] = v
 
     return renamer
 
 
+@inline(lambda k, v, ctx: [f"res[{k!r}] = str({v})"])
 def copy_and_stringify(k, v, res):
     res[k] = str(v)
 
 
 def rename_subitems(subitem_dict):
+    @inline(
+        lambda k, v, ctx: [
+            f"res[{name!r}] = {v}[{subitem!r}]"
+            for subitem, name in subitem_dict.items()
+        ]
+    )
     def renamer(k, v, res):
         for subitem, name in subitem_dict.items():
             res[name] = v[subitem]
@@ -51,8 +89,17 @@ def translate_with_value_modification(v_modification, translator, **args):
     # used
     final_translator = translator(**args)
 
+    # The modified value is stored in a new variable, on which the
+    # code of the final translator is applied
+    def generate_code(k, v, ctx):
+        modified_v = ctx.new_variable()
+        return [f"{modified_v} = {ctx.add_global(v_modification)}({v})"] + ctx.get_code(
+            final_translator, k, modified_v
+        )
+
     # This helper is used to update the value v before applying the
     # translator on the triplet (k, v, res)
+    @inline(generate_code)
     def combiner(k, v, res):
         final_translator(k, v_modification(v), res)
 
@@ -78,6 +125,12 @@ def zero_to_null(v):
 
 
 def rename_and_stringify_subitems(subitem_dict):
+    @inline(
+        lambda k, v, ctx: [
+            f"res[{name!r}] = str({v}[{subitem!r}])"
+            for subitem, name in subitem_dict.items()
+        ]
+    )
     def renamer(k, v, res):
         for subitem, name in subitem_dict.items():
             res[name] = str(v[subitem])
@@ -86,6 +139,11 @@ def rename_and_stringify_subitems(subitem_dict):
 
 
 def join_subitems(separator, name):
+    @inline(
+        lambda k, v, ctx: [
+            f"res[{name!r}] = {separator!r}.join([str(value) for value in {v}.values()])"
+        ]
+    )
     def joiner(k, v, res):
         values = []
         for _, value in v.items():
@@ -95,6 +153,31 @@ def join_subitems(separator, name):
     return joiner
 
 
+def get_tres_key(tres_type, tres_name):
+    """
+    Basically, this function is used to rename the element
+    we want to retrieve regarding the TRES type (as we are
+    for now only interested by the "count" of the entity)
+    """
+    if tres_type == "mem" or tres_type == "billing":
+        return tres_type
+    elif tres_type == "cpu":
+        return "num_cpus"
+    elif tres_type == "gres":
+        if tres_name == "gpu":
+            return "num_gpus"
+        else:
+            return "gres"
+    elif tres_type == "node":
+        return "num_nodes"
+    else:
+        return None
+
+
+# Keys already computed by get_tres_key, format: {(tres_type, tres_name): tres_key}
+_tres_keys = {}
+
+
 def extract_tres_data(k, v, res):
     """
     Extract count of the elements present in the value associated to the key "tres"
@@ -134,26 +217,6 @@ def extract_tres_data(k, v, res):
         }
     """
 
-    def get_tres_key(tres_type, tres_name):
-        """
-        Basically, this function is used to rename the element
-        we want to retrieve regarding the TRES type (as we are
-        for now only interested by the "count" of the entity)
-        """
-        if tres_type == "mem" or tres_type == "billing":
-            return tres_type
-        elif tres_type == "cpu":
-            return "num_cpus"
-        elif tres_type == "gres":
-            if tres_name == "gpu":
-                return "num_gpus"
-            else:
-                return "gres"
-        elif tres_type == "node":
-            return "num_nodes"
-        else:
-            return None
-
     tres_subdict_names = [
         {"sacct_name": "allocated", "cw_name": "tres_allocated"},
         {"sacct_name": "requested", "cw_name": "tres_requested"},
@@ -163,10 +226,101 @@ def extract_tres_data(k, v, res):
             tres_subdict_name["cw_name"]
         ] = {}  # Initialize the "tres_allocated" and the "tres_requested" subdicts
         for tres_subdict in v[tres_subdict_name["sacct_name"]]:
-            tres_key = get_tres_key(
-                tres_subdict["type"], tres_subdict["name"]
-            )  # Define the key associated to the TRES
+            # Define the key associated to the TRES. The same few types of
+            # TRES are found in all the jobs, so their keys are only computed once
+            tres_id = (tres_subdict["type"], tres_subdict["name"])
+            tres_key = _tres_keys.get(tres_id, False)
+            if tres_key is False:
+                tres_key = _tres_keys[tres_id] = get_tres_key(*tres_id)
             if tres_key:
                 res[tres_subdict_name["cw_name"]][tres_key] = tres_subdict[
                     "count"
                 ]  # Associate the count of the element, as value associated to the key defined previously
+
+
+def translate_with_field_map(field_map, entity):
+    """
+    Translate a Slurm entity by applying the translator associated to
+    each one of its keys in field_map. The keys without translator are ignored.
+
+    This is the reference behaviour of the functions generated by compile_field_map.
+    """
+    res = dict()
+    for k, v in entity.items():
+        translator = field_map.get(k, None)
+        if translator is not None:
+            translator(k, v, res)
+    return res
+
+
+class TranslationCompiler:
+    """
+    Generate the source code of a function translating a Slurm entity
+    according to a field map, and the objects it needs.
+    """
+
+    def __init__(self):
+        self.globals = {}
+        self.nbr_variables = 0
+
+    def add_global(self, obj):
+        """
+        Make an object available to the generated code, and return its name.
+        """
+        name = f"_g{len(self.globals)}"
+        self.globals[name] = obj
+        return name
+
+    def new_variable(self):
+        """
+        Return the name of a new local variable of the generated code.
+        """
+        self.nbr_variables += 1
+        return f"v{self.nbr_variables}"
+
+    def get_code(self, translator, k, v):
+        """
+        Get the lines of code applying a translator on the field k, whose
+        value is stored in the variable v. A translator which does not provide
+        its code (see inline) is called as is.
+        """
+        code_generator = getattr(translator, "inline", None)
+        if code_generator is None:
+            return [f"{self.add_global(translator)}({k!r}, {v}, res)"]
+        return code_generator(k, v, self)
+
+
+def compile_field_map(field_map, name="translate"):
+    """
+    Compile a field map into a function translating a Slurm entity.
+
+    The returned function gives the same result as translate_with_field_map,
+    but it only looks up the keys of the field map in the entity, instead of
+    iterating over all the fields of the entity, and the code of the
+    translators is inlined instead of being dispatched through closures.
+
+    Parameters:
+        field_map   Dictionary associating the keys of a Slurm entity to their translator
+        name        Name of the generated function
+
+    Returns:
+        A function taking a Slurm entity as argument and returning the
+        dictionary of the translated fields
+    """
+    ctx = TranslationCompiler()
+    missing = ctx.add_global(object())
+
+    L_lines = [f"def {name}(entity):", "    res = {}"]
+    for k, translator in field_map.items():
+        v = ctx.new_variable()
+        L_lines.append(f"    {v} = entity.get({k!r}, {missing})")
+        L_lines.append(f"    if {v} is not {missing}:")
+        L_lines.extend(f"        {line}" for line in ctx.get_code(translator, k, v))
+    L_lines.append("    return res")
+
+    source = "\n".join(L_lines)
+    namespace = dict(ctx.globals)
+    exec(compile(source, f"<compiled field map {name}>", "exec"), namespace)
+    translate = namespace[name]
+    translate.source = source
+    return translate
@@ -1,22 +1,48 @@
-import os
+import atexit, os, threading
 
 from paramiko import SSHClient, AutoAddPolicy, ssh_exception, RSAKey
 
+# Interval (in seconds) between the keepalive packets sent on the
+# connections kept open by the SSH connection pool
+SSH_KEEPALIVE_INTERVAL = 30
 
-def open_connection(hostname, username, ssh_key_path, port=22):
+# Private keys already read from the disk,
+# format: {ssh_key_path: (modification time of the file, key)}
+_private_keys = {}
+_private_keys_lock = threading.Lock()
+
+
+def load_private_key(ssh_key_path):
+    """
+    Read a RSA private key from the disk, or retrieve it from the keys
+    already read if the file has not been modified since.
+    """
+    assert os.path.exists(
+        ssh_key_path
+    ), f"Error. The absolute path given for ssh_key_path does not exist: {ssh_key_path} ."
+    mtime = os.path.getmtime(ssh_key_path)
+    with _private_keys_lock:
+        if ssh_key_path not in _private_keys or _private_keys[ssh_key_path][0] != mtime:
+            _private_keys[ssh_key_path] = (
+                mtime,
+                RSAKey.from_private_key_file(ssh_key_path),
+            )
+        return _private_keys[ssh_key_path][1]
+
+
+def open_connection(hostname, username, ssh_key_path, port=22, compress=False):
     """
     If successful, this will connect to the remote server and
     the value of self.ssh_client will be usable.
     Otherwise, this will set self.ssh_client=None or it will quit().
+
+    If `compress` is True, the compression of the SSH transport is requested.
     """
 
     ssh_client = SSHClient()
     ssh_client.set_missing_host_key_policy(AutoAddPolicy())
     ssh_client.load_system_host_keys()
-    assert os.path.exists(
-        ssh_key_path
-    ), f"Error. The absolute path given for ssh_key_path does not exist: {ssh_key_path} ."
-    pkey = RSAKey.from_private_key_file(ssh_key_path)
+    pkey = load_private_key(ssh_key_path)
 
     # The call to .connect was seen to raise an exception now and then.
     #     raise AuthenticationException("Authentication timeout.")
@@ -26,7 +52,12 @@ def open_connection(hostname, username, ssh_key_path, port=22):
     try:
         # For some reason, we really need to specify which key_filename to use.
         ssh_client.connect(
-            hostname, username=username, port=port, pkey=pkey, look_for_keys=False
+            hostname,
+            username=username,
+            port=port,
+            pkey=pkey,
+            look_for_keys=False,
+            compress=compress,
         )
         print(f"Successful SSH connection to {username}@{hostname} port {port}.")
     except ssh_exception.AuthenticationException as inst:
@@ -45,16 +76,327 @@ def open_connection(hostname, username, ssh_key_path, port=22):
     return ssh_client
 
 
-def launch_slurm_command(command, hostname, username, ssh_key_filename, port=22):
+class SSHConnectionPool:
+    """
+    Keep one SSH connection open per remote host, in order to run all the
+    commands of the process on it instead of connecting for each command.
+
+    Each command is run on its own channel of the shared transport, so that
+    several commands (possibly from several threads) can run at the same
+    time on the same host. Keepalive packets are sent on the idle
+    connections, and a connection found closed is transparently reopened.
+    """
+
+    def __init__(self, keepalive_interval=SSH_KEEPALIVE_INTERVAL):
+        self.keepalive_interval = keepalive_interval
+        # format: {(hostname, username, ssh_key_path, port, compress): SSHClient}
+        self._clients = {}
+        # SFTP sessions opened on these connections, with the same keys
+        self._sftp_clients = {}
+        # One lock per remote host, so that a slow connection to a cluster
+        # does not block the other clusters
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_client(self, hostname, username, ssh_key_path, port=22, compress=False):
+        """
+        Retrieve the SSH client connected to the remote host, connecting
+        to it if no active connection is available.
+
+        Returns:
+            An SSHClient, or None if the connection failed
+        """
+        key = (hostname, username, ssh_key_path, port, compress)
+        with self._get_lock(key):
+            ssh_client = self._clients.get(key, None)
+            if ssh_client is not None:
+                transport = ssh_client.get_transport()
+                if transport is not None and transport.is_active():
+                    return ssh_client
+                # The connection has been lost
+                print(
+                    f"The SSH connection to {username}@{hostname} port {port} is closed."
+                )
+                ssh_client.close()
+                del self._clients[key]
+                self._sftp_clients.pop(key, None)
+
+            ssh_client = open_connection(
+                hostname,
+                username,
+                ssh_key_path=ssh_key_path,
+                port=port,
+                compress=compress,
+            )
+            if ssh_client is not None:
+                ssh_client.get_transport().set_keepalive(self.keepalive_interval)
+                self._clients[key] = ssh_client
+            return ssh_client
+
+    def discard_client(self, hostname, username, ssh_key_path, port=22, compress=False):
+        """
+        Close the connection to a remote host, for instance after a failure.
+        The next command on this host will open a new connection.
+        """
+        key = (hostname, username, ssh_key_path, port, compress)
+        with self._get_lock(key):
+            ssh_client = self._clients.pop(key, None)
+            sftp_client = self._sftp_clients.pop(key, None)
+        if sftp_client is not None:
+            sftp_client.close()
+        if ssh_client is not None:
+            ssh_client.close()
+
+    def get_sftp(self, hostname, username, ssh_key_path, port=22, compress=False):
+        """
+        Retrieve the SFTP session opened on the connection to the remote
+        host, opening it (and the connection) if needed.
+
+        Returns:
+            An SFTPClient, or None if the connection failed
+        """
+        key = (hostname, username, ssh_key_path, port, compress)
+        ssh_client = self.get_client(hostname, username, ssh_key_path, port, compress)
+        if ssh_client is None:
+            return None
+        with self._get_lock(key):
+            sftp_client = self._sftp_clients.get(key, None)
+            if sftp_client is None or sftp_client.get_channel().closed:
+                sftp_client = ssh_client.open_sftp()
+                self._sftp_clients[key] = sftp_client
+            return sftp_client
+
+    def exec_command(
+        self, command, hostname, username, ssh_key_path, port=22, compress=False
+    ):
+        """
+        Run a command on a new channel of the connection to the remote host.
+        If the channel can not be opened, the connection is reopened once.
+
+        Returns:
+            The (stdin, stdout, stderr) triplet returned by SSHClient.exec_command,
+            or None if the connection failed
+        """
+        for attempt in range(2):
+            ssh_client = self.get_client(
+                hostname, username, ssh_key_path, port, compress
+            )
+            if ssh_client is None:
+                return None
+            try:
+                return ssh_client.exec_command(command)
+            except (ssh_exception.SSHException, EOFError, OSError) as inst:
+                print(
+                    f"Error while running a command through SSH on {username}@{hostname} port {port}."
+                )
+                print(inst)
+                self.discard_client(hostname, username, ssh_key_path, port, compress)
+                if attempt > 0:
+                    raise
+
+    def discard_host(self, hostname):
+        """
+        Close all the connections to a remote host, for instance to interrupt
+        the commands blocked on it.
+        """
+        with self._lock:
+            keys = [key for key in self._clients if key[0] == hostname]
+        for key in keys:
+            self.discard_client(*key)
+
+    def close_all(self):
+        """
+        Close all the connections of the pool.
+        """
+        with self._lock:
+            clients = list(self._sftp_clients.values()) + list(self._clients.values())
+            self._sftp_clients.clear()
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+# The SSH connections shared by all the Slurm commands of the process
+_connection_pool = SSHConnectionPool()
+atexit.register(_connection_pool.close_all)
+
+
+def get_ssh_connection_pool():
+    """
+    Get the SSH connection pool of the process.
+    """
+    return _connection_pool
+
+
+def open_slurm_command_stream(
+    command, hostname, username, ssh_key_filename, port=22, compress=False
+):
+    """
+    Launch a Slurm command through SSH and return its standard output as
+    a file-like object, from which the bytes can be read as they arrive.
+
+    Parameters:
+        command             The Slurm command to launch through SSH
+        hostname            The hostname used for the SSH connection to launch the Slurm command
+        username            The username used for the SSH connection to launch the Slurm command
+        ssh_key_filename    The name of the private key in .ssh folder used for the SSH connection to launch the Slurm command
+        port                The port used for the SSH connection to launch the Slurm command
+        compress            Whether or not the compression of the SSH transport is requested
+    """
+    # Print the command to use
+    print(f"The command launched through SSH is:\n{command}")
+
+    # Check the given SSH key
+    assert ssh_key_filename, "Missing ssh_key_filename from config."
+
+    # Now this is the private ssh key that we are using with Paramiko.
+    ssh_key_path = os.path.join(os.path.expanduser("~"), ".ssh", ssh_key_filename)
+
+    # Connect through SSH, or reuse the existing connection
+    response = get_ssh_connection_pool().exec_command(
+        command,
+        hostname,
+        username,
+        ssh_key_path=ssh_key_path,
+        port=port,
+        compress=compress,
+    )
+    if response is None:
+        raise Exception(
+            f"No SSH connection has been established while trying to run {command}."
+        )
+
+    ssh_stdin, ssh_stdout, ssh_stderr = response
+    return ssh_stdout
+
+
+def get_sftp_client(hostname, username, ssh_key_filename, port=22, compress=False):
+    """
+    Get the SFTP session of the connection pool to a remote host.
+    """
+    # Check the given SSH key
+    assert ssh_key_filename, "Missing ssh_key_filename from config."
+    ssh_key_path = os.path.join(os.path.expanduser("~"), ".ssh", ssh_key_filename)
+
+    sftp_client = get_ssh_connection_pool().get_sftp(
+        hostname, username, ssh_key_path=ssh_key_path, port=port, compress=compress
+    )
+    if sftp_client is None:
+        raise Exception(
+            f"No SSH connection has been established with {username}@{hostname} port {port}."
+        )
+    return sftp_client
+
+
+def open_remote_file(
+    remote_path, hostname, username, ssh_key_filename, port=22, compress=False
+):
+    """
+    Open a remote file through the SFTP session of the connection pool,
+    as a binary file-like object.
+    """
+    sftp_client = get_sftp_client(hostname, username, ssh_key_filename, port, compress)
+    remote_file = sftp_client.open(remote_path, "rb")
+    # Request the following chunks without waiting for each one of them
+    remote_file.prefetch()
+    return remote_file
+
+
+def fetch_remote_file(
+    remote_path,
+    local_path,
+    hostname,
+    username,
+    ssh_key_filename,
+    port=22,
+    compress=False,
+    chunk_size=1 << 20,
+):
+    """
+    Copy a remote file through the SFTP session of the connection pool,
+    only if it changed since its last copy.
+
+    The copy gets the modification time of the remote file. Thus, the file is
+    downloaded again only if its size or its modification time changed. The
+    file is first downloaded to a ".part" file named after the modification
+    time of the remote file, so that an interrupted transfer of the same
+    version of the file is resumed instead of being restarted.
+
+    Parameters:
+        remote_path         Path of the file on the remote host
+        local_path          Path of the copy
+        hostname            The hostname used for the SSH connection
+        username            The username used for the SSH connection
+        ssh_key_filename    The name of the private key in .ssh folder used for the SSH connection
+        port                The port used for the SSH connection
+        compress            Whether or not the compression of the SSH transport is requested
+        chunk_size          Size of the chunks read from the remote file
+
+    Returns:
+        True if the file has been downloaded, False if the copy was up to date
+    """
+    sftp_client = get_sftp_client(hostname, username, ssh_key_filename, port, compress)
+    remote_stat = sftp_client.stat(remote_path)
+    if os.path.exists(local_path):
+        local_stat = os.stat(local_path)
+        if local_stat.st_size == remote_stat.st_size and int(
+            local_stat.st_mtime
+        ) == int(remote_stat.st_mtime):
+            print(f"The copy of {hostname}:{remote_path} is up to date.")
+            return False
+
+    # Remove the partial transfers of the previous versions of the file
+    local_dir = os.path.dirname(local_path) or "."
+    os.makedirs(local_dir, exist_ok=True)
+    part_path = f"{local_path}.{int(remote_stat.st_mtime)}.part"
+    part_prefix = f"{os.path.basename(local_path)}."
+    for file_name in os.listdir(local_dir):
+        if file_name.startswith(part_prefix) and file_name.endswith(".part"):
+            if os.path.join(local_dir, file_name) != part_path:
+                os.remove(os.path.join(local_dir, file_name))
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > remote_stat.st_size:
+        offset = 0
+    print(
+        f"Fetch {hostname}:{remote_path} ({remote_stat.st_size} bytes) to {local_path}"
+        + (f", resuming at byte {offset}." if offset else ".")
+    )
+
+    with sftp_client.open(remote_path, "rb") as remote_file:
+        remote_file.seek(offset)
+        # Request the following chunks without waiting for each one of them
+        remote_file.prefetch(remote_stat.st_size)
+        with open(part_path, "ab" if offset else "wb") as part_file:
+            while chunk := remote_file.read(chunk_size):
+                part_file.write(chunk)
+
+    os.replace(part_path, local_path)
+    os.utime(local_path, (remote_stat.st_atime, remote_stat.st_mtime))
+    return True
+
+
+def launch_slurm_command(
+    command, hostname, username, ssh_key_filename, port=22, compress=False
+):
     """
     Launch a Slurm command through SSH and retrieve its response.
 
+    The SSH connection to the remote host is kept open by the connection
+    pool of the process (see SSHConnectionPool), and reused by the
+    following commands.
+
     Parameters:
         command             The Slurm command to launch through SSH
         hostname            The hostname used for the SSH connection to launch the Slurm command
         username            The username used for the SSH connection to launch the Slurm command
         ssh_key_filename    The name of the private key in .ssh folder used for the SSH connection to launch the Slurm command
         port                The port used for the SSH connection to launch the sinfo command
+        compress            Whether or not the compression of the SSH transport is requested
     """
     # Print the command to use
     print(f"The command launched through SSH is:\n{command}")
@@ -65,10 +407,15 @@ def launch_slurm_command(command, hostname, username, ssh_key_filename, port=22)
     # Now this is the private ssh key that we are using with Paramiko.
     ssh_key_path = os.path.join(os.path.expanduser("~"), ".ssh", ssh_key_filename)
 
-    # Connect through SSH
+    # Connect through SSH, or reuse the existing connection
     try:
-        ssh_client = open_connection(
-            hostname, username, ssh_key_path=ssh_key_path, port=port
+        response = get_ssh_connection_pool().exec_command(
+            command,
+            hostname,
+            username,
+            ssh_key_path=ssh_key_path,
+            port=port,
+            compress=compress,
         )
     except Exception as inst:
         print(
@@ -78,8 +425,8 @@ def launch_slurm_command(command, hostname, username, ssh_key_filename, port=22)
         return []
 
     # If a connection has been established
-    if ssh_client:
-        ssh_stdin, ssh_stdout, ssh_stderr = ssh_client.exec_command(command)
+    if response is not None:
+        ssh_stdin, ssh_stdout, ssh_stderr = response
 
         # We should find a better option to retrieve stderr
         """
@@ -89,9 +436,7 @@ def launch_slurm_command(command, hostname, username, ssh_key_filename, port=22)
                     f"Stderr in sinfo call on {hostname}. This doesn't mean that the call failed entirely, though.\n{response_stderr}"
                 )
             """
-        stdout = ssh_stdout.readlines()
-        ssh_client.close()
-        return stdout
+        return ssh_stdout.readlines()
 
     else:
         print(
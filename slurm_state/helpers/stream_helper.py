@@ -0,0 +1,132 @@
+"""
+This file gathers the helpers used to handle the streams from which
+the Slurm reports are read.
+
+The package "zstandard" is only required to handle zstd-compressed reports.
+"""
+
+import gzip, os
+
+
+class TeeReader:
+    """
+    File-like object reading from a stream, and writing a copy of
+    everything which is read into another file object.
+
+    This is used to keep a copy of a report while it is parsed, without
+    having to write it entirely on the disk before parsing it.
+    """
+
+    def __init__(self, stream, copy_file):
+        self.stream = stream
+        self.copy_file = copy_file
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if data:
+            self.copy_file.write(data)
+        return data
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.copy_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ClosingReader:
+    """
+    File-like object reading from a stream, and closing another
+    stream along with it (for instance, the compressed stream on
+    which a decompressed stream is built).
+    """
+
+    def __init__(self, stream, underlying_stream):
+        self.stream = stream
+        self.underlying_stream = underlying_stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.underlying_stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Compression formats handled for the reports, identified by the
+# extensions of the report files
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception(
+            'The package "zstandard" is required in order to handle zstd-compressed reports.'
+        )
+    return zstandard
+
+
+def get_compression_from_path(file_path):
+    """
+    Retrieve the compression format of a file from its extension.
+
+    Returns:
+        "gzip", "zstd" or None if the file is not compressed
+    """
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(file_path)[1], None)
+
+
+def open_decompressed_stream(stream, compression):
+    """
+    Build a binary file-like object decompressing the content of
+    `stream` while it is read. Closing it also closes `stream`.
+
+    Parameters:
+        stream          A binary file-like object
+        compression     "gzip", "zstd" or None (in which case `stream` is returned)
+    """
+    if compression is None:
+        return stream
+    elif compression == "gzip":
+        return ClosingReader(gzip.GzipFile(fileobj=stream, mode="rb"), stream)
+    elif compression == "zstd":
+        zstandard = _import_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+    raise ValueError(f'Unknown compression format "{compression}".')
+
+
+def open_report_file(file_path, mode="rb"):
+    """
+    Open a report file in binary mode, compressing or decompressing
+    its content according to the extension of the file (".gz" or ".zst").
+
+    Parameters:
+        file_path       The path of the report file
+        mode            "rb" to read the file, "wb" to write it, "ab" to append
+                        to it (the compressed formats allow concatenating streams)
+    """
+    assert mode in ["rb", "wb", "ab"]
+    compression = get_compression_from_path(file_path)
+    if compression == "gzip":
+        # A fast compression level is enough for such repetitive reports
+        return gzip.open(file_path, mode, compresslevel=1)
+    elif compression == "zstd":
+        zstandard = _import_zstandard()
+        return zstandard.open(file_path, mode)
+    return open(file_path, mode)
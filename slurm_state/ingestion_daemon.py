@@ -0,0 +1,319 @@
+"""
+This script ingests continuously the jobs and nodes of all the configured
+clusters, as an alternative to calling "read_report_commit_to_db.py" from cron
+for each cluster.
+
+Each cluster is ingested in its own thread, according to its own schedule
+(see the "ingestion_interval", "ingestion_timeout" and "ingestion_max_backoff"
+fields of the clusters configuration). Thus, a slow cluster does not delay the
+ingestion of the other ones. A cluster which fails, or which takes longer than
+its interval, is polled less often until it recovers.
+
+The process stays alive between the ingestions, so the MongoDB client and the
+SSH connections (see SSHConnectionPool) are reused from one ingestion to the
+next. The Slurm versions of the clusters are stored in the ingestion state
+collection, so they are also reused after a restart.
+"""
+
+import argparse, os, signal, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from slurm_state.config import get_config
+from slurm_state.helpers.clusters_helper import get_all_clusters
+from slurm_state.helpers.ingestion_state_helper import (
+    INGESTION_STATE_COLLECTION,
+    create_ingestion_state_index,
+)
+from slurm_state.helpers.ssh_helper import get_ssh_connection_pool
+from slurm_state.mongo_client import get_mongo_client
+from slurm_state.mongo_update import (
+    main_read_jobs_since_watermark,
+    main_read_report_and_update_collection,
+)
+
+
+class ClusterSchedule:
+    """
+    Scheduling state of the ingestion of a cluster.
+    """
+
+    def __init__(self, cluster_name, interval, timeout, max_backoff):
+        self.cluster_name = cluster_name
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max(max_backoff, interval)
+
+        self.next_run = 0  # The first ingestion is done as soon as possible
+        self.nbr_failures = 0  # Number of consecutive failures
+        self.future = None  # Ingestion in progress, if any
+        self.started_at = None
+        self.timed_out = False
+
+    def get_delay(self, duration):
+        """
+        Get the delay before the next ingestion of the cluster, given the
+        duration of the last one.
+
+        The delay is doubled after each consecutive failure, and it is at
+        least as long as the last ingestion, so that a slow cluster is not
+        polled continuously.
+        """
+        delay = self.interval * 2 ** min(self.nbr_failures, 16)
+        return min(max(delay, duration), self.max_backoff)
+
+    def start(self, executor, ingest, now):
+        """
+        Submit the ingestion of the cluster to the executor.
+        """
+        self.started_at = now
+        self.timed_out = False
+        self.future = executor.submit(ingest, self.cluster_name)
+
+    def finish(self, now):
+        """
+        Record the result of the ingestion in progress, and schedule the next one.
+
+        Returns:
+            True if the ingestion succeeded, False otherwise
+        """
+        try:
+            success = bool(self.future.result()) and not self.timed_out
+        except Exception:
+            print(f"Error while ingesting the {self.cluster_name} cluster:")
+            traceback.print_exc()
+            success = False
+
+        duration = now - self.started_at
+        self.nbr_failures = 0 if success else self.nbr_failures + 1
+        self.next_run = now + self.get_delay(duration)
+        self.future = None
+        print(
+            f"Ingestion of the {self.cluster_name} cluster {'succeeded' if success else 'failed'} "
+            f"in {duration:.1f} seconds. Next one in {self.next_run - now:.1f} seconds."
+        )
+        return success
+
+
+class ClusterIngester:
+    """
+    Ingest the jobs and nodes of a cluster into the database.
+    """
+
+    def __init__(
+        self,
+        database,
+        reports_dir=None,
+        use_watermark=False,
+        upsert_jobs=False,
+        stream_reports=False,
+    ):
+        self.database = database
+        self.reports_dir = reports_dir
+        self.use_watermark = use_watermark
+        self.upsert_jobs = upsert_jobs
+        self.stream_reports = stream_reports
+
+    def get_report_file_path(self, cluster_name, entity):
+        """
+        Get the path of the report of an entity on a cluster, or None
+        if the reports are not kept.
+        """
+        if self.reports_dir is None:
+            return None
+        cluster_dir = os.path.join(self.reports_dir, cluster_name)
+        os.makedirs(cluster_dir, exist_ok=True)
+        return os.path.join(cluster_dir, f"slurm_{entity}.json.gz")
+
+    def __call__(self, cluster_name):
+        """
+        Ingest the jobs, then the nodes of a cluster.
+
+        Returns:
+            True if both reports have been entirely ingested, False otherwise
+        """
+        ingestion_state_collection = self.database[INGESTION_STATE_COLLECTION]
+        jobs_collection = self.database["jobs"]
+        jobs_report_path = self.get_report_file_path(cluster_name, "jobs")
+
+        if self.use_watermark:
+            jobs_success = main_read_jobs_since_watermark(
+                jobs_collection,
+                self.database["users"],
+                ingestion_state_collection,
+                cluster_name,
+                jobs_report_path,
+                upsert_jobs=self.upsert_jobs,
+                stream_report=self.stream_reports,
+                version_cache_collection=ingestion_state_collection,
+            )
+        else:
+            jobs_success = main_read_report_and_update_collection(
+                "jobs",
+                jobs_collection,
+                self.database["users"],
+                cluster_name,
+                jobs_report_path,
+                upsert_jobs=self.upsert_jobs,
+                stream_report=self.stream_reports,
+                version_cache_collection=ingestion_state_collection,
+            )
+
+        nodes_success = main_read_report_and_update_collection(
+            "nodes",
+            self.database["nodes"],
+            None,
+            cluster_name,
+            self.get_report_file_path(cluster_name, "nodes"),
+            stream_report=self.stream_reports,
+            version_cache_collection=ingestion_state_collection,
+        )
+
+        return jobs_success and nodes_success
+
+
+def run_ingestion_daemon(L_schedules, ingest, stop_event, tick=1.0):
+    """
+    Ingest the clusters according to their schedules until stop_event is set.
+
+    Parameters:
+        L_schedules     List of ClusterSchedule, one per cluster
+        ingest          Function ingesting a cluster, given its name. It returns
+                        True on success and False (or raises an exception) on failure
+        stop_event      threading.Event stopping the daemon once set. The ingestions
+                        in progress are then awaited
+        tick            Maximum duration (in seconds) between two checks of the schedules
+    """
+    # One thread per cluster: a slow cluster never holds the thread of another one
+    with ThreadPoolExecutor(
+        max_workers=max(len(L_schedules), 1), thread_name_prefix="ingestion"
+    ) as executor:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            for schedule in L_schedules:
+                if schedule.future is None:
+                    if now >= schedule.next_run:
+                        schedule.start(executor, ingest, now)
+                elif schedule.future.done():
+                    schedule.finish(now)
+                elif (
+                    schedule.timeout
+                    and not schedule.timed_out
+                    and now - schedule.started_at > schedule.timeout
+                ):
+                    # The thread can not be killed, but closing the SSH connection
+                    # interrupts the commands which are blocked on it
+                    print(
+                        f"The ingestion of the {schedule.cluster_name} cluster exceeded {schedule.timeout} seconds."
+                    )
+                    schedule.timed_out = True
+                    hostname = get_all_clusters()[schedule.cluster_name][
+                        "remote_hostname"
+                    ]
+                    if hostname:
+                        get_ssh_connection_pool().discard_host(hostname)
+
+            # Sleep until the next scheduled ingestion
+            L_next_runs = [s.next_run for s in L_schedules if s.future is None]
+            delay = min([tick] + [t - time.monotonic() for t in L_next_runs])
+            stop_event.wait(max(delay, 0.01))
+
+        for schedule in L_schedules:
+            if schedule.future is not None:
+                schedule.future.exception()  # Wait for the ingestion to end
+                schedule.finish(time.monotonic())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog=argv[0],
+        description="Ingest continuously the jobs and nodes of the clusters into the database.",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--cluster_names",
+        nargs="*",
+        help="Names of the clusters to ingest. Default is all the configured clusters.",
+    )
+
+    parser.add_argument(
+        "--reports_dir",
+        required=False,
+        help="Directory in which the last reports of each cluster are kept. If None, the reports are not kept.",
+    )
+
+    parser.add_argument(
+        "--use_watermark",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the sacct reports start from the end of the last time window stored in db.",
+    )
+
+    parser.add_argument(
+        "--upsert_jobs",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the jobs are upserted without reading the jobs currently stored in db.",
+    )
+
+    parser.add_argument(
+        "--stream_reports",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the reports are parsed while they are received.",
+    )
+
+    parser.add_argument(
+        "--mongodb_collection",
+        default=get_config("mongo.database_name"),
+        help="Database to populate.",
+    )
+
+    args = parser.parse_args(argv[1:])
+    if not args.reports_dir and not args.stream_reports:
+        parser.error("--reports_dir is required when the reports are not streamed.")
+
+    clusters = get_all_clusters()
+    cluster_names = args.cluster_names or list(clusters.keys())
+    for cluster_name in cluster_names:
+        assert cluster_name in clusters, f"Unknown cluster {cluster_name}."
+
+    # The client is kept for the whole life of the process
+    database = get_mongo_client()[args.mongodb_collection]
+    database["jobs"].create_index(
+        [("slurm.job_id", 1), ("slurm.cluster_name", 1)],
+        name="job_id_and_cluster_name",
+    )
+    database["nodes"].create_index(
+        [("slurm.name", 1), ("slurm.cluster_name", 1)],
+        name="name_and_cluster_name",
+    )
+    create_ingestion_state_index(database[INGESTION_STATE_COLLECTION])
+
+    L_schedules = [
+        ClusterSchedule(
+            cluster_name,
+            interval=clusters[cluster_name]["ingestion_interval"],
+            timeout=clusters[cluster_name]["ingestion_timeout"],
+            max_backoff=clusters[cluster_name]["ingestion_max_backoff"],
+        )
+        for cluster_name in cluster_names
+    ]
+    ingest = ClusterIngester(
+        database,
+        reports_dir=args.reports_dir,
+        use_watermark=bool(args.use_watermark),
+        upsert_jobs=bool(args.upsert_jobs),
+        stream_reports=bool(args.stream_reports),
+    )
+
+    # Stop gracefully on SIGTERM and SIGINT
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stop_event.set())
+
+    print(f"Start the ingestion of the clusters {', '.join(cluster_names)}.")
+    run_ingestion_daemon(L_schedules, ingest, stop_event)
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(sys.argv)
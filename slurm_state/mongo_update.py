@@ -2,17 +2,33 @@
 Insert elements extracted from the Slurm reports into the database.
 """
 
-import copy, json, logging, os, time
-from pymongo import InsertOne, ReplaceOne, UpdateOne
+import copy, hashlib, json, logging, os, time
+from pymongo import InsertOne, ReplaceOne, UpdateMany, UpdateOne
 
 
 from slurm_state.helpers.gpu_helper import get_cw_gres_description
+from slurm_state.helpers.bulk_write_helper import bulk_write_in_chunks
 from slurm_state.helpers.clusters_helper import get_all_clusters
+from slurm_state.helpers.ingestion_state_helper import (
+    check_report_unchanged,
+    get_cached_slurm_version,
+    get_ingestion_watermark,
+    invalidate_cached_slurm_version,
+    record_ingested_report,
+    record_skipped_report,
+    set_cached_slurm_version,
+    set_ingestion_watermark,
+)
+from slurm_state.helpers.json_stream_helper import get_slurm_report_version
+from slurm_state.helpers.stream_helper import (
+    get_compression_from_path,
+    open_report_file,
+)
 
 # Import parser classes
 from slurm_state.parsers.job_parser import JobParser
 from slurm_state.parsers.node_parser import NodeParser
-from slurm_state.parsers.entity_parser import IdentityParser
+from slurm_state.parsers.entity_parser import IdentityParser, SlurmVersionError
 
 
 def pprint_bulk_result(result):
@@ -27,21 +43,36 @@ def fetch_slurm_report(parser, report_path):
     Yields elements ready to be slotted into the "slurm" field,
     but they have to be processed further before committing to MongoDB.
     """
+    assert os.path.exists(report_path), f"The report path {report_path} is missing."
+
+    # The report is decompressed according to its extension (".gz" or ".zst")
+    with open_report_file(report_path) as f:
+        yield from fetch_slurm_report_from_stream(parser, f)
+
+
+def fetch_slurm_report_from_stream(parser, report_stream):
+    """
+    Similar to fetch_slurm_report, but the report is read from a
+    file-like object (such as the output of a command launched through SSH)
+    instead of a file on the disk.
+
+    If the report can not be parsed entirely, the error is logged and
+    stored in parser.parse_error.
+    """
+    parser.parse_error = None
     # Retrieve the cluster name
     cluster_name = parser.cluster["name"]
 
-    assert os.path.exists(report_path), f"The report path {report_path} is missing."
-
     ctx = get_all_clusters().get(cluster_name, None)
     assert ctx is not None, f"{cluster_name} not configured"
 
-    with open(report_path, "r") as f:
-        try:
-            for e in parser.parser(f):
-                e["cluster_name"] = cluster_name
-                yield e
-        except Exception as err:
-            logging.warning(str(err))
+    try:
+        for e in parser.parser(report_stream):
+            e["cluster_name"] = cluster_name
+            yield e
+    except Exception as err:
+        parser.parse_error = err
+        logging.warning(str(err))
 
 
 def slurm_job_to_clockwork_job(slurm_job: dict):
@@ -92,25 +123,135 @@ def slurm_node_to_clockwork_node(slurm_node: dict):
     return clockwork_node
 
 
-def lookup_user_account(users_collection):
+def get_slurm_fingerprint(D_slurm: dict):
+    """
+    Compute a fingerprint of the "slurm" subdocument of a job or a node.
+    It is stored in the "cw" subdocument, under the key "slurm_fingerprint",
+    in order to detect the entities which did not change since the previous
+    ingestion.
+
+    The fingerprint does not depend on the order of the keys.
     """
-    Mutates the argument in order to fill in the
-    field for "cw" pertaining to the user account.
-    Returns the mutated value to facilitate a `map` call.
+    return hashlib.blake2b(
+        json.dumps(D_slurm, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
+
+
+def get_stored_cw_fields(collection, cluster_name, id_key, L_cw_fields, L_ids=None):
     """
+    Retrieve some fields of the "cw" subdocument of the entities stored in the database,
+    without retrieving the rest of these entities.
+
+    Parameters:
+        collection      Collection of the jobs or nodes in the database
+        cluster_name    Name of the cluster on which we are working
+        id_key          Key of the "slurm" subdocument identifying an entity ("job_id" or "name")
+        L_cw_fields     List of the fields of the "cw" subdocument to retrieve
+        L_ids           List of the IDs of the entities to retrieve. If None, all
+                        the entities of the cluster are retrieved
+
+    Returns:
+        A dictionary presenting the format {entity_id: {cw_field: value}}
+    """
+    mongodb_filter = {"slurm.cluster_name": cluster_name}
+    if L_ids is not None:
+        mongodb_filter[f"slurm.{id_key}"] = {"$in": L_ids}
+
+    projection = {"_id": 0, f"slurm.{id_key}": 1}
+    for cw_field in L_cw_fields:
+        projection[f"cw.{cw_field}"] = 1
+
+    return {
+        D_entity["slurm"][id_key]: D_entity.get("cw", {})
+        for D_entity in collection.find(mongodb_filter, projection)
+    }
 
-    def _lookup_user_account(clockwork_job: dict[dict]):
+
+def get_heartbeat_update(cluster_name, id_key, L_ids, now):
+    """
+    Retrieve a database operation (UpdateMany, from pymongo) only updating the
+    timestamps of the entities which have not changed since the previous ingestion.
+    """
+    return UpdateMany(
+        {"slurm.cluster_name": cluster_name, f"slurm.{id_key}": {"$in": L_ids}},
+        {"$set": {"cw.last_slurm_update": now, "cw.last_slurm_update_by_sacct": now}},
+    )
+
+
+class UserAccountIndex:
+    """
+    In-memory index of the users accounts on the clusters, used to
+    associate the jobs to their Clockwork user.
+
+    For each account field (e.g. "mila_cluster_username" or "cc_account_username"),
+    the users collection is read once, only retrieving this field and
+    "mila_email_username". The jobs are then resolved without any
+    other request to the database.
+    """
+
+    def __init__(self, users_collection):
+        self.users_collection = users_collection
+        self.clusters = get_all_clusters()
+        # format: {account_field: {cluster_username: mila_email_username}}
+        self.DD_users_by_account_field = {}
+        self.nbr_hits = 0
+        self.nbr_misses = 0
+
+    def get_users_by_account(self, account_field):
+        """
+        Retrieve the Clockwork users indexed by their username on the
+        clusters using the account field `account_field`, loading them
+        from the database on the first call.
+        """
+        if account_field not in self.DD_users_by_account_field:
+            D_users_by_account = {}
+            for D_user in self.users_collection.find(
+                {account_field: {"$ne": None}},
+                {"_id": 0, "mila_email_username": 1, account_field: 1},
+            ):
+                # Keep the first match, as find_one would do
+                D_users_by_account.setdefault(
+                    D_user[account_field], D_user["mila_email_username"]
+                )
+            self.DD_users_by_account_field[account_field] = D_users_by_account
+
+        return self.DD_users_by_account_field[account_field]
+
+    def __call__(self, clockwork_job: dict[dict]):
+        """
+        Mutates the argument in order to fill in the
+        field for "cw" pertaining to the user account.
+        Returns the mutated value to facilitate a `map` call.
+        """
         cluster_name = clockwork_job["slurm"]["cluster_name"]
         cluster_username = clockwork_job["slurm"]["username"]
 
-        account_field = get_all_clusters()[cluster_name]["account_field"]
-        result = users_collection.find_one({account_field: cluster_username})
-        if result is not None:
-            clockwork_job["cw"]["mila_email_username"] = result["mila_email_username"]
+        account_field = self.clusters[cluster_name]["account_field"]
+        mila_email_username = self.get_users_by_account(account_field).get(
+            cluster_username, None
+        )
+        if mila_email_username is not None:
+            clockwork_job["cw"]["mila_email_username"] = mila_email_username
+            self.nbr_hits += 1
+        else:
+            self.nbr_misses += 1
 
         return clockwork_job
 
-    return _lookup_user_account
+    def print_counters(self):
+        print(
+            f"User accounts lookup: {self.nbr_hits} jobs associated to a user, "
+            f"{self.nbr_misses} jobs without a known user."
+        )
+
+
+def lookup_user_account(users_collection):
+    """
+    Returns a function filling in the field for "cw" pertaining to the
+    user account of a job (see UserAccountIndex).
+    """
+    return UserAccountIndex(users_collection)
 
 
 def main_read_report_and_update_collection(
@@ -122,6 +263,12 @@ def main_read_report_and_update_collection(
     from_file=None,
     want_commit_to_db=True,
     dump_file="",
+    upsert_jobs=False,
+    stream_report=False,
+    time_window=None,
+    slurm_version=None,
+    ingestion_state_collection=None,
+    version_cache_collection=None,
 ):
     """
     Create a Clockwork jobs or nodes list from a sacct report file and store it into
@@ -134,10 +281,36 @@ def main_read_report_and_update_collection(
         cluster_name        Name of the cluster we are working on
         report_file_path    Path to the report from which the jobs or nodes information is extracted. This report is generated through
                             the command sacct for the jobs, or sinfo for the nodes. If None, a new report is generated.
+                            Reports ending with ".gz" or ".zst" are compressed.
         from_file           Value contained in ["cw", "slurm", None] indicating whether the jobs or nodes are extracted from a Slurm file, a CW file (ie JSON file presenting a list of the entities formatted as used in Clockwork) or from no file. If "cw" or "slurm", the input file
                             is report_file_path. If None, the file is generated at the report_file_path path.
         want_commit_to_db   Boolean indicating whether or not the jobs or nodes are stored in the database. Default is True
         dump_file           String containing the path to the file in which we want to dump the data. Default is "", which means nothing is stored in an output file
+        upsert_jobs         Boolean indicating whether the jobs are written through upserts (see get_jobs_upserts) instead of being compared
+                            to the jobs currently stored in the database. Default is False
+        stream_report       Boolean indicating whether the report generated through the Slurm command is parsed while it is
+                            received, instead of being written in a file first. In this case, a compressed copy of the
+                            report is written at report_file_path (with a ".gz" suffix if it does not end with ".gz" or
+                            ".zst"), if report_file_path is provided.
+                            Only used when from_file is None. Default is False
+        time_window         Tuple (start, end) of timestamps defining the jobs requested to sacct, when a report
+                            is generated. Default is None, which means the jobs of the last 10 minutes are requested
+        slurm_version       Version of Slurm on the cluster, if already known. Default is None, which means it is read
+                            from the report if from_file is "slurm", and retrieved from the cluster otherwise
+        ingestion_state_collection
+                            Collection storing the ingestion state of the clusters. If provided, the report is
+                            skipped when it is identical to the last report ingested for this entity on this cluster
+                            (see check_report_unchanged). Only used when the report is not streamed, and
+                            want_commit_to_db is True. Default is None
+        version_cache_collection
+                            Collection storing the ingestion state of the clusters. If provided and the Slurm version
+                            is neither given nor set in the configuration, the version retrieved from the cluster is
+                            stored in it and reused during slurm_version_cache_ttl seconds. It is removed if the
+                            report has been generated by another version. Default is None
+
+    Returns:
+        True if the whole report has been parsed (and committed to the database, if requested),
+        False if an error occurred while parsing it
     """
     # Initialize the time of this operation's beginning
     timestamp_start = time.time()
@@ -151,23 +324,29 @@ def main_read_report_and_update_collection(
     # be stored in it, else the parser will try to get the version
     # through an SSH command
     # Initialize the parser version
-    parser_version = None
-    if from_file:
-        with open(report_file_path, "r") as infile:
-            infile_data = json.load(infile)
-
-            if from_file == "slurm":
-                if "Slurm" in infile_data["meta"]:
-                    version = infile_data["meta"]["Slurm"]["version"]
-                elif "slurm" in infile_data["meta"]:
-                    version = infile_data["meta"]["slurm"]["version"]
-                else:
-                    raise Exception(
-                        f'"Slurm" or "slurm" not found in data["meta"] for file {report_file_path}'
-                    )
-                parser_version = (
-                    f"{version['major']}.{version['micro']}.{version['minor']}"
-                )
+    parser_version = slurm_version
+    if from_file == "slurm":
+        with open_report_file(report_file_path) as infile:
+            try:
+                parser_version = get_slurm_report_version(infile)
+            except Exception as err:
+                raise Exception(f"{err} for file {report_file_path}")
+
+    # Reuse the Slurm version previously retrieved from the cluster
+    use_version_cache = (
+        version_cache_collection is not None
+        and parser_version is None
+        and from_file is None
+        and clusters[cluster_name]["slurm_version"] is None
+    )
+    if use_version_cache:
+        parser_version = get_cached_slurm_version(
+            version_cache_collection,
+            cluster_name,
+            clusters[cluster_name]["slurm_version_cache_ttl"],
+        )
+        if parser_version is not None:
+            print(f"Use the Slurm version {parser_version} stored for {cluster_name}.")
 
     # Check the input parameters
     assert entity in ["jobs", "nodes"]
@@ -177,7 +356,9 @@ def main_read_report_and_update_collection(
             "job_id"  # The id_key is used to determine how to retrieve the ID of a job
         )
         parser = JobParser(
-            cluster_name=cluster_name, slurm_version=parser_version
+            cluster_name=cluster_name,
+            slurm_version=parser_version,
+            time_window=time_window,
         )  # This parser is used to retrieve and format useful information from a sacct job
         from_slurm_to_clockwork = slurm_job_to_clockwork_job  # This function is used to translate a Slurm job (created through the parser) to a Clockwork job
 
@@ -198,27 +379,72 @@ def main_read_report_and_update_collection(
             f'Incorrect value for entity in main_read_sacct_and_update_collection: "{entity}" when it should be "jobs" or "nodes".'
         )
 
+    if use_version_cache and parser_version is None:
+        # The version has been retrieved from the cluster by the parser
+        set_cached_slurm_version(
+            version_cache_collection, cluster_name, parser.slurm_version
+        )
+
     ## Retrieve entities ##
 
-    # Generate a report file if required
-    if not from_file or not os.path.exists(report_file_path):
-        print(
-            f"Generate report file for the {cluster_name} cluster at location {report_file_path}."
+    D_report = None  # Description of the report file, to store once it is ingested
+    if stream_report and not from_file:
+        # Parse the report while it is received
+        copy_file_path = None
+        if report_file_path:
+            copy_file_path = (
+                report_file_path
+                if get_compression_from_path(report_file_path)
+                else f"{report_file_path}.gz"
+            )
+            print(
+                f"Stream report for the {cluster_name} cluster, with a copy at location {copy_file_path}."
+            )
+        report_stream = parser.stream_report(copy_file_path)
+        I_slurm_entities = (
+            fetch_slurm_report_from_stream(parser, report_stream)
+            if report_stream is not None
+            else iter([])
         )
-        parser.generate_report(report_file_path)
+    else:
+        # Generate a report file if required
+        if not from_file or not os.path.exists(report_file_path):
+            print(
+                f"Generate report file for the {cluster_name} cluster at location {report_file_path}."
+            )
+            parser.generate_report(report_file_path)
+        report_stream = None
+
+        # Skip the report if it has already been ingested
+        if ingestion_state_collection is not None and want_commit_to_db:
+            (report_unchanged, D_report) = check_report_unchanged(
+                ingestion_state_collection, cluster_name, entity, report_file_path
+            )
+            if report_unchanged:
+                print(
+                    f"The {entity} report {report_file_path} of the {cluster_name} cluster has not changed since its last ingestion. Skipping it."
+                )
+                record_skipped_report(ingestion_state_collection, cluster_name, entity)
+                return True
+
+        I_slurm_entities = fetch_slurm_report(parser, report_file_path)
 
     # Construct an iterator over the list of entities in the report file,
     # each one of them is turned into a clockwork job or node, according to applicability
     I_clockwork_entities_from_report = map(
         from_slurm_to_clockwork,
-        fetch_slurm_report(parser, report_file_path),
+        I_slurm_entities,
     )
 
     L_updates_to_do = []  # Entity updates to store in the database if requested
     L_users_updates = []  # Users updates to store in the database if requested
     L_data_for_dump_file = []  # Data to store in the dump file if requested
 
-    if entity == "jobs":
+    if entity == "jobs" and upsert_jobs:
+        (L_updates_to_do, L_users_updates, L_data_for_dump_file) = get_jobs_upserts(
+            I_clockwork_entities_from_report, cluster_name, collection, users_collection
+        )
+    elif entity == "jobs":
         (
             L_updates_to_do,
             L_users_updates,
@@ -228,17 +454,20 @@ def main_read_report_and_update_collection(
         )
     elif entity == "nodes":
         (L_updates_to_do, L_data_for_dump_file) = get_nodes_updates(
-            I_clockwork_entities_from_report
+            I_clockwork_entities_from_report, cluster_name, collection
         )
 
+    if report_stream is not None:
+        report_stream.close()
+
     # Commit new elements and changes to the database, if requested
     if want_commit_to_db:
         # Store the jobs or nodes
         if L_updates_to_do:
             assert collection is not None
-            print(f"{entity}: collection.bulk_write(L_updates_to_do)")
-            result = collection.bulk_write(L_updates_to_do)
-            pprint_bulk_result(result)
+            print(f"{entity}: bulk_write_in_chunks(collection, L_updates_to_do)")
+            D_totals = bulk_write_in_chunks(collection, L_updates_to_do)
+            print(D_totals)
         else:
             print(
                 f"Empty list found for updates to {entity} collection."
@@ -266,9 +495,128 @@ def main_read_report_and_update_collection(
             json.dump(L_data_for_dump_file, f, indent=4)
         print(f"Wrote {entity} to dump_file {dump_file}.")
 
+    parse_error = getattr(parser, "parse_error", None)
+    if isinstance(parse_error, SlurmVersionError) and use_version_cache:
+        # The version will be retrieved again at the next ingestion
+        invalidate_cached_slurm_version(version_cache_collection, cluster_name)
+
+    success = parse_error is None
+    if success and D_report is not None:
+        # Remember the report, in order to skip it if it is found again
+        record_ingested_report(
+            ingestion_state_collection, cluster_name, entity, D_report
+        )
+
+    return success
+
+
+def get_sacct_time_window(watermark, now, overlap, max_window=0, default_window=600):
+    """
+    Compute the time window of the jobs to request to sacct, starting from
+    the end of the last window committed to the database.
+
+    Parameters:
+        watermark       End of the last committed window, as a timestamp. If None,
+                        the window covers the last `default_window` seconds
+        now             Current timestamp
+        overlap         Number of seconds before the watermark which are requested
+                        again, in order not to miss the jobs updated in the meantime
+        max_window      Maximum duration of the window, in seconds, in order to catch up
+                        a long interruption in several chunks. 0 means no maximum
+        default_window  Duration of the window when there is no watermark
+
+    Returns:
+        A tuple (start, end) of timestamps
+    """
+    if watermark is None:
+        start = now - default_window
+    else:
+        start = min(watermark, now) - overlap
+
+    end = now
+    if max_window:
+        assert (
+            max_window > overlap
+        ), f"The sacct window ({max_window}s) should be longer than its overlap ({overlap}s)."
+        end = min(end, start + max_window)
+
+    return (start, end)
+
+
+def main_read_jobs_since_watermark(
+    jobs_collection,
+    users_collection,
+    ingestion_state_collection,
+    cluster_name,
+    report_file_path,
+    want_commit_to_db=True,
+    dump_file="",
+    **kwargs,
+):
+    """
+    Generate sacct reports from the end of the last time window committed
+    to the database (the "watermark" of the cluster) up to now, and store
+    the retrieved jobs (see main_read_report_and_update_collection).
+
+    The windows are limited to the sacct_max_window seconds set in the cluster
+    configuration. If the watermark is older than that, several reports are
+    generated in a row. The watermark only moves forward once the jobs of a
+    window have been committed to the database.
+
+    Parameters:
+        jobs_collection             Collection of the jobs in the database
+        users_collection            Collection of the users in the database
+        ingestion_state_collection  Collection storing the watermarks of the clusters
+        cluster_name                Name of the cluster we are working on
+        report_file_path            Path where the reports are written. It is overwritten by each window
+        want_commit_to_db           Boolean indicating whether or not the jobs are stored in the database.
+                                    The watermark is not updated if they are not. Default is True
+        dump_file                   See main_read_report_and_update_collection
+        kwargs                      Other arguments of main_read_report_and_update_collection
+
+    Returns:
+        True if all the windows up to now have been committed, False otherwise
+    """
+    cluster = get_all_clusters()[cluster_name]
+
+    while True:
+        now = time.time()
+        watermark = get_ingestion_watermark(ingestion_state_collection, cluster_name)
+        (window_start, window_end) = get_sacct_time_window(
+            watermark,
+            now,
+            overlap=cluster["sacct_window_overlap"],
+            max_window=cluster["sacct_max_window"],
+        )
+        print(
+            f"Retrieve the jobs of the {cluster_name} cluster between {window_start} and {window_end}."
+        )
+
+        success = main_read_report_and_update_collection(
+            "jobs",
+            jobs_collection,
+            users_collection,
+            cluster_name,
+            report_file_path,
+            want_commit_to_db=want_commit_to_db,
+            dump_file=dump_file,
+            time_window=(window_start, window_end),
+            **kwargs,
+        )
+        if not (success and want_commit_to_db):
+            return success and want_commit_to_db
+
+        set_ingestion_watermark(ingestion_state_collection, cluster_name, window_end)
+        if window_end >= now:
+            return True
+
 
 def get_jobs_updates_and_insertions(
-    I_clockwork_jobs, cluster_name, jobs_collection, users_collection
+    I_clockwork_jobs,
+    cluster_name,
+    jobs_collection,
+    users_collection,
+    user_account_lookup=None,
 ):
     """
     Retrieve lists of database operations (InsertOne, ReplaceOne and UpdateOne, from pymongo) summarizing the updates
@@ -279,6 +627,8 @@ def get_jobs_updates_and_insertions(
         cluster_name        Name of the cluster on which we are working
         jobs_collection     Collection of the jobs in the database
         users_collection    Collection of the users in the database
+        user_account_lookup Optional. UserAccountIndex already loaded from users_collection,
+                            which is built from it otherwise
 
     Returns:
         A 3-tuple containing (in this order) the following elements:
@@ -290,6 +640,7 @@ def get_jobs_updates_and_insertions(
     """
 
     L_updates_to_do = []  # Initialize the list of elements to update
+    L_unchanged_ids = []  # Initialize the list of jobs only needing a timestamps update
     L_data_for_dump_file = (
         []
     )  # Initialize the list of elements to store into the dump file
@@ -312,12 +663,15 @@ def get_jobs_updates_and_insertions(
     # Apply the function lookup_user_account to each element, which are then gathered in a list
     # (We previously added a filter in order to keep only the Mila related jobs, but this is now
     # done while retrieving these jobs)
+    if user_account_lookup is None:
+        user_account_lookup = lookup_user_account(users_collection)
     LD_sacct = list(
         map(
-            lookup_user_account(users_collection),
+            user_account_lookup,
             I_clockwork_jobs,
         )
     )
+    user_account_lookup.print_counters()
 
     # Index the jobs by ID
     DD_sacct = dict((D_job["slurm"]["job_id"], D_job) for D_job in LD_sacct)
@@ -351,6 +705,7 @@ def get_jobs_updates_and_insertions(
         now = time.time()
         D_job_new["cw"]["last_slurm_update"] = now
         D_job_new["cw"]["last_slurm_update_by_sacct"] = now
+        D_job_new["cw"]["slurm_fingerprint"] = get_slurm_fingerprint(D_job_new["slurm"])
         # No need to the empty user dict because it's done earlier
         # by `slurm_job_to_clockwork_job`.
 
@@ -386,16 +741,35 @@ def get_jobs_updates_and_insertions(
         now = time.time()
         D_job_new["cw"]["last_slurm_update"] = now
         D_job_new["cw"]["last_slurm_update_by_sacct"] = now
-
-        L_updates_to_do.append(
-            ReplaceOne({"_id": D_job_db["_id"]}, D_job_new, upsert=False)
-        )
+        D_job_new["cw"]["slurm_fingerprint"] = get_slurm_fingerprint(D_job_new["slurm"])
+
+        if D_job_new["cw"]["slurm_fingerprint"] == D_job_db["cw"].get(
+            "slurm_fingerprint"
+        ) and D_job_new["cw"]["mila_email_username"] == D_job_db["cw"].get(
+            "mila_email_username"
+        ):
+            # The job has not changed since the previous ingestion: only
+            # its timestamps are updated, along with the other unchanged jobs
+            L_unchanged_ids.append(job_id)
+        else:
+            L_updates_to_do.append(
+                ReplaceOne({"_id": D_job_db["_id"]}, D_job_new, upsert=False)
+            )
 
         # Save the data to store in the dump file (just omit the "_id" part of the job)
         L_data_for_dump_file.append(
             {k: D_job_new[k] for k in D_job_new.keys() if k != "_id"}
         )
 
+    # -- Timestamps update of the unchanged jobs --
+    print(
+        f"jobs: {len(L_unchanged_ids)} unchanged jobs, {len(L_updates_to_do)} jobs to write."
+    )
+    if L_unchanged_ids:
+        L_updates_to_do.append(
+            get_heartbeat_update(cluster_name, "job_id", L_unchanged_ids, time.time())
+        )
+
     # -- Account association -- #
     # L_users_updates = associate_account(LD_sacct)
 
@@ -403,35 +777,176 @@ def get_jobs_updates_and_insertions(
     return (L_updates_to_do, [], L_data_for_dump_file)
 
 
-def get_nodes_updates(I_clockwork_nodes):
+def get_jobs_upserts(I_clockwork_jobs, cluster_name, jobs_collection, users_collection):
+    """
+    Retrieve a list of database operations (UpdateOne with upsert, from pymongo) inserting
+    or updating the jobs in the database, and data to store in the dump file.
+
+    Contrary to get_jobs_updates_and_insertions, the jobs currently stored in the database
+    are not read: each job is matched on the index (slurm.job_id, slurm.cluster_name).
+    Only the fingerprints of the jobs of the report are retrieved, in order to skip
+    the jobs which did not change. Thus, the cost of an ingestion depends on the size
+    of the report, not on the size of the database.
+
+    The Slurm fields of the report are set one by one, so that the fields stored in the
+    database but absent from the report are kept, as done by get_jobs_updates_and_insertions.
+    The user associated to the job is only overwritten if it has been found.
+
+    Parameters:
+        I_clockwork_jobs    Iterator on Clockwork jobs we want to insert or update in the database
+        cluster_name        Name of the cluster on which we are working
+        jobs_collection     Collection of the jobs in the database
+        users_collection    Collection of the users in the database
+
+    Returns:
+        A 3-tuple containing (in this order) the following elements:
+            - A list of the database operations (UpdateOne and UpdateMany, from pymongo) summarizing
+              the updates to be done into the database for the jobs
+            - A list of the database operations (UpdateOne, from pymongo) summarizing the updates to be
+              done into the database for the users
+            - A list of the elements to store in the dump file
+    """
+    L_updates_to_do = []  # Initialize the list of elements to update
+    L_unchanged_ids = []  # Initialize the list of jobs only needing a timestamps update
+
+    user_account_lookup = lookup_user_account(users_collection)
+    LD_jobs = list(map(user_account_lookup, I_clockwork_jobs))
+    user_account_lookup.print_counters()
+
+    # Retrieve the fingerprints of the jobs of the report already stored in the database
+    DD_stored_cw = get_stored_cw_fields(
+        jobs_collection,
+        cluster_name,
+        "job_id",
+        ["slurm_fingerprint", "mila_email_username"],
+        L_ids=[D_job["slurm"]["job_id"] for D_job in LD_jobs],
+    )
+
+    for D_job in LD_jobs:
+        # Add these field each time an entry is updated
+        now = time.time()
+        D_job["cw"]["last_slurm_update"] = now
+        D_job["cw"]["last_slurm_update_by_sacct"] = now
+        D_job["cw"]["slurm_fingerprint"] = get_slurm_fingerprint(D_job["slurm"])
+
+        D_stored_cw = DD_stored_cw.get(D_job["slurm"]["job_id"], None)
+        if (
+            D_stored_cw is not None
+            and D_stored_cw.get("slurm_fingerprint") == D_job["cw"]["slurm_fingerprint"]
+            and D_job["cw"]["mila_email_username"]
+            in [None, D_stored_cw.get("mila_email_username")]
+        ):
+            # The job has not changed since the previous ingestion: only
+            # its timestamps are updated, along with the other unchanged jobs
+            L_unchanged_ids.append(D_job["slurm"]["job_id"])
+            continue
+
+        D_set = {f"slurm.{k}": v for (k, v) in D_job["slurm"].items()}
+        D_set_on_insert = {}
+        for k, v in D_job["cw"].items():
+            if k == "mila_email_username" and v is None:
+                # Do not remove a user previously associated to the job
+                D_set_on_insert[f"cw.{k}"] = v
+            else:
+                D_set[f"cw.{k}"] = v
+        D_update = {"$set": D_set}
+        if D_set_on_insert:
+            D_update["$setOnInsert"] = D_set_on_insert
+
+        L_updates_to_do.append(
+            UpdateOne(
+                # rule to match if already present in collection
+                {
+                    "slurm.job_id": D_job["slurm"]["job_id"],
+                    "slurm.cluster_name": D_job["slurm"]["cluster_name"],
+                },
+                # the data that we write in the collection
+                D_update,
+                # create if missing, update if present
+                upsert=True,
+            )
+        )
+
+    print(
+        f"jobs: {len(L_unchanged_ids)} unchanged jobs, {len(L_updates_to_do)} jobs to write."
+    )
+    if L_unchanged_ids:
+        L_updates_to_do.append(
+            get_heartbeat_update(cluster_name, "job_id", L_unchanged_ids, time.time())
+        )
+
+    return (L_updates_to_do, [], LD_jobs)
+
+
+def get_nodes_updates(I_clockwork_nodes, cluster_name=None, nodes_collection=None):
     """
     Retrieve a list of database operations (UpdateOne, from pymongo) summarizing
     the updates to be done on nodes in the database, and data to store in the dump file.
 
     Parameters:
         I_clockwork_nodes   Iterator on Clockwork nodes we want to insert or update in the database
+        cluster_name        Name of the cluster on which we are working
+        nodes_collection    Collection of the nodes in the database. If provided, the nodes
+                            which did not change since the previous ingestion are not rewritten:
+                            only their timestamps are updated
 
     Returns:
         A 2-tuple containing (in this order) the following elements:
-            - A list of the database operations (UpdateOne, from pymongo) summarizing the
-              updates to be done into the database for the nodes
+            - A list of the database operations (UpdateOne and UpdateMany, from pymongo) summarizing
+              the updates to be done into the database for the nodes
             - A list of elements to store in the dump file
     """
 
     L_updates_to_do = []  # Initialize the list of elements to update
+    L_unchanged_ids = (
+        []
+    )  # Initialize the list of nodes only needing a timestamps update
     L_data_for_dump_file = (
         []
     )  # Initialize the list of elements to store into the dump file
 
+    # Retrieve the fingerprints of the nodes of the cluster already stored in the database
+    DD_stored_cw = {}
+    if nodes_collection is not None:
+        DD_stored_cw = get_stored_cw_fields(
+            nodes_collection, cluster_name, "name", ["slurm_fingerprint"]
+        )
+
     for D_node in I_clockwork_nodes:
 
         # Add these field each time an entry is updated
         now = time.time()
         D_node["cw"]["last_slurm_update"] = now
         D_node["cw"]["last_slurm_update_by_sacct"] = now
+        D_node["cw"]["slurm_fingerprint"] = get_slurm_fingerprint(D_node["slurm"])
 
         L_data_for_dump_file.append(D_node)
 
+        D_stored_cw = DD_stored_cw.get(D_node["slurm"]["name"], {})
+        if D_stored_cw.get("slurm_fingerprint") == D_node["cw"]["slurm_fingerprint"]:
+            # The node has not changed since the previous ingestion: only
+            # its timestamps are updated, along with the other unchanged nodes
+            L_unchanged_ids.append(D_node["slurm"]["name"])
+            continue
+
+        # The timestamps and the fingerprint are updated each time the node changes,
+        # the other fields of "cw" (such as the GPU information) are only set at insertion
+        L_updated_cw_fields = [
+            "last_slurm_update",
+            "last_slurm_update_by_sacct",
+            "slurm_fingerprint",
+        ]
+        D_set = {"slurm": D_node["slurm"]}
+        D_set_on_insert = {}
+        for k, v in D_node["cw"].items():
+            if k in L_updated_cw_fields:
+                D_set[f"cw.{k}"] = v
+            else:
+                D_set_on_insert[f"cw.{k}"] = v
+        D_update = {"$set": D_set}
+        if D_set_on_insert:
+            D_update["$setOnInsert"] = D_set_on_insert
+
         L_updates_to_do.append(
             UpdateOne(
                 # rule to match if already present in collection
@@ -440,15 +955,21 @@ def get_nodes_updates(I_clockwork_nodes):
                     "slurm.cluster_name": D_node["slurm"]["cluster_name"],
                 },
                 # the data that we write in the collection
-                {
-                    "$set": {"slurm": D_node["slurm"]},
-                    "$setOnInsert": {"cw": D_node["cw"]},
-                },
+                D_update,
                 # create if missing, update if present
                 upsert=True,
             )
         )
 
+    if nodes_collection is not None:
+        print(
+            f"nodes: {len(L_unchanged_ids)} unchanged nodes, {len(L_updates_to_do)} nodes to write."
+        )
+    if L_unchanged_ids:
+        L_updates_to_do.append(
+            get_heartbeat_update(cluster_name, "name", L_unchanged_ids, time.time())
+        )
+
     return (L_updates_to_do, L_data_for_dump_file)
 
 
@@ -1,9 +1,36 @@
 # Imports to retrieve the values related to Slurm command
-from slurm_state.helpers.ssh_helper import launch_slurm_command, open_connection
+from slurm_state.helpers.ssh_helper import (
+    fetch_remote_file,
+    launch_slurm_command,
+    open_remote_file,
+    open_connection,
+    open_slurm_command_stream,
+)
 from slurm_state.helpers.clusters_helper import get_all_clusters
+from slurm_state.helpers.json_stream_helper import (
+    get_slurm_version_from_meta,
+    iter_json_array_items,
+)
+from slurm_state.helpers.stream_helper import (
+    TeeReader,
+    get_compression_from_path,
+    open_decompressed_stream,
+    open_report_file,
+)
 
 # Common imports
-import json, os, re
+import os, re, shutil
+
+# Commands used on the clusters to compress the reports before their transfer
+REMOTE_COMPRESSION_COMMANDS = {"gzip": "gzip -1", "zstd": "zstd -1 -c"}
+
+
+class SlurmVersionError(Exception):
+    """
+    Raised when a report can not be parsed according to the expected
+    Slurm version: either this version is not handled, or the report has
+    been generated by a version which should be parsed differently.
+    """
 
 
 class EntityParser:
@@ -61,6 +88,42 @@ class EntityParser:
                 f'The version "{response[0]}" has not been recognized as a Slurm version.'
             )
 
+    def get_version_parser(self, slurm_version):
+        """
+        Get the parsing method handling the reports of a Slurm version,
+        or None if this version is not handled.
+        Implemented by the parsers of each entity.
+        """
+        raise NotImplementedError
+
+    def parser(self, f):
+        """
+        Parse a report generated by the expected Slurm version, yielding
+        its entities one at a time.
+        """
+        version_parser = self.get_version_parser(self.slurm_version)
+        if version_parser is None:
+            raise SlurmVersionError(
+                f'The {self.entity} parser is not implemented for the Slurm version "{self.slurm_version}".'
+            )
+        return version_parser(f)
+
+    def check_report_version(self, D_meta):
+        """
+        Check that the "meta" field of a report has been generated by a Slurm
+        version handled the same way as the one expected by the parser.
+
+        Raises:
+            SlurmVersionError if the report should be parsed differently
+        """
+        report_version = get_slurm_version_from_meta(D_meta)
+        if self.get_version_parser(report_version) != self.get_version_parser(
+            self.slurm_version
+        ):
+            raise SlurmVersionError(
+                f'The {self.entity} report of the {self.cluster["name"]} cluster has been generated by Slurm {report_version}, while Slurm {self.slurm_version} was expected.'
+            )
+
     def launch_slurm_command(self, remote_command):
         """ """
         return launch_slurm_command(
@@ -69,28 +132,177 @@ class EntityParser:
             self.cluster["remote_user"],
             self.cluster["ssh_key_filename"],
             self.cluster["ssh_port"],
+            compress=self.cluster.get("ssh_compression", False),
+        )
+
+    def open_report_stream(self, remote_command):
+        """
+        Launch the Slurm command and return its raw output as a stream.
+        If the "remote_compression" of the cluster is set, the output is
+        compressed on the cluster before its transfer (see
+        open_decompressed_stream to read it).
+        """
+        remote_compression = self.cluster.get("remote_compression", False)
+        if remote_compression:
+            remote_command = (
+                f"{remote_command} | {REMOTE_COMPRESSION_COMMANDS[remote_compression]}"
+            )
+        return open_slurm_command_stream(
+            remote_command,
+            self.cluster["remote_hostname"],
+            self.cluster["remote_user"],
+            self.cluster["ssh_key_filename"],
+            self.cluster["ssh_port"],
+            compress=self.cluster.get("ssh_compression", False),
         )
 
-    def generate_report(self, remote_command, file_name):
+    def get_report_command(self):
+        """
+        Get the Slurm command used to retrieve the JSON report containing
+        jobs or nodes information, or None if nothing has to be retrieved.
+        Implemented by the parsers of each entity.
+        """
+        raise NotImplementedError
+
+    def get_cached_report_path(self):
+        """
+        Get the remote path of the report periodically written on the cluster
+        (see the "sacct_cached_report" and "sinfo_cached_report" configurations),
+        or None if the report has to be generated through the Slurm command.
+        """
+        return self.cluster.get(f"{self.slurm_command}_cached_report", False) or None
+
+    def fetch_cached_report(self, file_name):
+        """
+        Copy the report periodically written on the cluster, if it changed
+        since its last copy (see fetch_remote_file).
+
+        If the compression of the remote report does not match the extension
+        of file_name, the remote report is copied as it is next to file_name
+        (in order to check later whether it changed), then converted.
+
+        Parameters:
+            file_name           The path of the copy
+
+        Returns:
+            True if the report has been downloaded, False if the copy was up to date
+        """
+        cached_report_path = self.get_cached_report_path()
+        remote_extension = os.path.splitext(cached_report_path)[1]
+        same_compression = get_compression_from_path(
+            file_name
+        ) == get_compression_from_path(cached_report_path)
+        raw_copy_name = (
+            file_name if same_compression else f"{file_name}.remote{remote_extension}"
+        )
+
+        downloaded = fetch_remote_file(
+            cached_report_path,
+            raw_copy_name,
+            self.cluster["remote_hostname"],
+            self.cluster["remote_user"],
+            self.cluster["ssh_key_filename"],
+            self.cluster["ssh_port"],
+            compress=self.cluster.get("ssh_compression", False),
+        )
+
+        if not same_compression and (downloaded or not os.path.exists(file_name)):
+            with open_report_file(raw_copy_name) as infile:
+                with open_report_file(file_name, "wb") as outfile:
+                    shutil.copyfileobj(infile, outfile)
+            # The conversion keeps the modification time of the remote report
+            raw_copy_stat = os.stat(raw_copy_name)
+            os.utime(file_name, (raw_copy_stat.st_atime, raw_copy_stat.st_mtime))
+        return downloaded
+
+    def generate_report(self, file_name):
         """
         Launch a Slurm command in order to retrieve JSON report containing
-        jobs or nodes information
+        jobs or nodes information. If a cached report is configured for the
+        cluster, it is copied instead.
 
         Parameters:
-            cluster_name        The name of the cluster on which the Slurm command will be launched
-            remote_command      The command used to retrieve the data from Slurm
             file_name           The path of the report file to write
         """
-        # Launch the requested command in order to retrieve Slurm information
-        stdout = self.launch_slurm_command(remote_command)
+        if self.get_cached_report_path():
+            self.fetch_cached_report(file_name)
+            return
+
+        remote_command = self.get_report_command()
+        if remote_command is None:
+            return
 
         # Create directories if needed
         os.makedirs(os.path.dirname(file_name), exist_ok=True)
 
-        # Write the command output to a file
-        with open(file_name, "w") as outfile:
-            for line in stdout:
-                outfile.write(line)
+        # Write the command output to a file, as it is received.
+        # The file is compressed according to its extension (".gz" or ".zst")
+        remote_compression = self.cluster.get("remote_compression", False) or None
+        with self.open_report_stream(remote_command) as raw_stream:
+            if remote_compression == get_compression_from_path(file_name):
+                # The report can be stored as it is received
+                with open(file_name, "wb") as outfile:
+                    shutil.copyfileobj(raw_stream, outfile)
+            else:
+                with open_decompressed_stream(
+                    raw_stream, remote_compression
+                ) as report_stream:
+                    with open_report_file(file_name, "wb") as outfile:
+                        shutil.copyfileobj(report_stream, outfile)
+
+    def stream_report(self, copy_file_name=None):
+        """
+        Launch a Slurm command in order to retrieve JSON report containing
+        jobs or nodes information, and return its output as a stream which
+        can be directly given to the parser.
+
+        Parameters:
+            copy_file_name      Optional path of a file in which a copy of the report
+                                is written while it is read. The copy is compressed
+                                according to the extension of the file (".gz" or ".zst")
+
+        Returns:
+            A file-like object, or None if nothing has to be retrieved
+        """
+        cached_report_path = self.get_cached_report_path()
+        if cached_report_path and copy_file_name:
+            # The cached report is only downloaded if it changed,
+            # then the copy is read
+            self.fetch_cached_report(copy_file_name)
+            return open_report_file(copy_file_name)
+        elif cached_report_path:
+            return open_decompressed_stream(
+                open_remote_file(
+                    cached_report_path,
+                    self.cluster["remote_hostname"],
+                    self.cluster["remote_user"],
+                    self.cluster["ssh_key_filename"],
+                    self.cluster["ssh_port"],
+                    compress=self.cluster.get("ssh_compression", False),
+                ),
+                get_compression_from_path(cached_report_path),
+            )
+
+        remote_command = self.get_report_command()
+        if remote_command is None:
+            return None
+
+        remote_compression = self.cluster.get("remote_compression", False) or None
+        raw_stream = self.open_report_stream(remote_command)
+        if not copy_file_name:
+            return open_decompressed_stream(raw_stream, remote_compression)
+
+        # Create directories if needed
+        os.makedirs(os.path.dirname(copy_file_name) or ".", exist_ok=True)
+        if remote_compression == get_compression_from_path(copy_file_name):
+            # Copy the report as it is received, before its decompression
+            return open_decompressed_stream(
+                TeeReader(raw_stream, open(copy_file_name, "wb")), remote_compression
+            )
+        return TeeReader(
+            open_decompressed_stream(raw_stream, remote_compression),
+            open_report_file(copy_file_name, "wb"),
+        )
 
 
 class IdentityParser(EntityParser):
@@ -101,9 +313,7 @@ class IdentityParser(EntityParser):
         self.cluster["name"] = cluster_name
 
     def parser(self, f):
-        # Load the JSON file generated using the Slurm command
-        # (At this point, slurm_data is a hierarchical structure of dictionaries and lists)
-        entities = json.load(f)
-        for entity in entities:
+        # Stream the entities from the JSON file listing Clockwork entities
+        for entity in iter_json_array_items(f):
             if entity["slurm"]["cluster_name"] == self.cluster["name"]:
                 yield entity
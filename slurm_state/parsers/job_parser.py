@@ -2,6 +2,7 @@
 # we could encounter while parsing a job dictionary retrieved from a
 # sacct command.
 from slurm_state.helpers.parser_helper import (
+    compile_field_map,
     copy,
     copy_and_stringify,
     extract_tres_data,
@@ -15,17 +16,76 @@ from slurm_state.helpers.parser_helper import (
 
 from slurm_state.parsers.entity_parser import EntityParser
 
+from slurm_state.helpers.json_stream_helper import iter_json_object_items
+
 # Common imports
-import json, re
+from datetime import datetime
+import re
+
+
+# Translators to apply on each field of the jobs retrieved
+# through sacct, for the Slurm versions 21, 22 and 23
+JOB_FIELD_MAP_V21_V22_AND_23 = {
+    "account": copy,
+    "array": rename_and_stringify_subitems(
+        {"job_id": "array_job_id", "task_id": "array_task_id"}
+    ),
+    "cluster": rename("cluster_name"),
+    "exit_code": join_subitems(":", "exit_code"),
+    "job_id": copy_and_stringify,
+    "name": copy,
+    "nodes": copy,
+    "partition": copy,
+    "state": rename_subitems({"current": "job_state"}),
+    "time": translate_with_value_modification(
+        zero_to_null,
+        rename_subitems,
+        subitem_dict={
+            "limit": "time_limit",
+            "submission": "submit_time",
+            "start": "start_time",
+            "end": "end_time",
+        },
+    ),
+    "tres": extract_tres_data,
+    "user": rename("username"),
+    "working_directory": copy,
+}
+# The translation of the jobs is compiled once, when this module is imported
+translate_job_v21_v22_and_23 = compile_field_map(
+    JOB_FIELD_MAP_V21_V22_AND_23, name="translate_job_v21_v22_and_23"
+)
 
 
 class JobParser(EntityParser):
     """ """
 
-    def __init__(self, cluster_name, slurm_version=None):
+    def __init__(self, cluster_name, slurm_version=None, time_window=None):
         super().__init__("jobs", cluster_name, "sacct", slurm_version=slurm_version)
 
-    def generate_report(self, file_name):
+        # Time window (start, end) of the requested jobs, as timestamps.
+        # If None, the jobs of the last 10 minutes are requested
+        self.time_window = time_window
+
+    def get_time_window_args(self):
+        """
+        Get the sacct arguments defining the time window of the requested jobs.
+        """
+        if self.time_window is None:
+            # -S is a condition on the start time, 600 being in seconds
+            # -E is a condition on the end time
+            return "-S now-600 -E now"
+
+        # The times are given to sacct in the timezone of the cluster
+        (start_time, end_time) = [
+            datetime.fromtimestamp(int(t), tz=self.cluster["timezone"]).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+            for t in self.time_window
+        ]
+        return f"-S {start_time} -E {end_time}"
+
+    def get_report_command(self):
 
         # Retrieve the allocations associated to the cluster
         allocations = self.cluster["allocations"]
@@ -35,10 +95,10 @@ class JobParser(EntityParser):
             print(
                 f"The cluster {self.cluster['name']} has no allocation related to it. Thus, no job has been retrieved. Associated allocations can be provided in the Clockwork configuration file."
             )
-            return []
+            return None
         else:
             # Set the sacct command
-            # -S is a condition on the start time, 600 being in seconds
+            # -S is a condition on the start time
             # -E is a condition on the end time
             # -X means "Only show statistics relevant to the job allocation itself, not taking steps into consideration."
             # --associations is used in order to limit the fetched jobs to the ones related to Mila and/or professors who
@@ -46,76 +106,58 @@ class JobParser(EntityParser):
             if allocations == "*":
                 # We do not provide --associations information because the default for this parameter
                 # is "all associations"
-                remote_command = (
-                    f"{self.slurm_command_path} -S now-600 -E now -X --allusers --json"
-                )
+                remote_command = f"{self.slurm_command_path} {self.get_time_window_args()} -X --allusers --json"
             else:
                 accounts_list = ",".join(allocations)
-                remote_command = f"{self.slurm_command_path} -S now-600 -E now -X --accounts={accounts_list} --allusers --json"
+                remote_command = f"{self.slurm_command_path} {self.get_time_window_args()} -X --accounts={accounts_list} --allusers --json"
             print(f"remote_command is\n{remote_command}")
 
-        return super().generate_report(remote_command, file_name)
-
-    def parser(self, f):
-        """ """
-        if re.search(r"^21\..*$", self.slurm_version):
-            return self.parser_v21_v22_and_23(f)
-        elif re.search(r"^22\..*$", self.slurm_version):
-            return self.parser_v21_v22_and_23(f)
-        elif re.search(r"^23\..*$", self.slurm_version):
-            return self.parser_v21_v22_and_23(f)
-        else:
-            raise Exception(
-                f'The {self.entity} parser is not implemented for the Slurm version "{self.slurm_version}".'
-            )
+        return remote_command
+
+    def get_version_parser(self, slurm_version):
+        """
+        Get the parsing method handling the reports of a Slurm version,
+        or None if this version is not handled.
+        """
+        if re.search(r"^21\..*$", slurm_version):
+            return self.parser_v21_v22_and_23
+        elif re.search(r"^22\..*$", slurm_version):
+            return self.parser_v21_v22_and_23
+        elif re.search(r"^23\..*$", slurm_version):
+            return self.parser_v21_v22_and_23
+        return None
+
+    def get_filtered_accounts(self):
+        """
+        Get the accounts whose jobs are kept from the report, or None if all
+        the jobs are kept.
+
+        The sacct command only requests the jobs of the allocations of the
+        cluster, but the cached reports (see get_cached_report_path) contain
+        the jobs of all the accounts.
+        """
+        allocations = self.cluster["allocations"]
+        if self.get_cached_report_path() and allocations != "*":
+            return set(allocations)
+        return None
 
     def parser_v21_v22_and_23(self, f):
-        JOB_FIELD_MAP = {
-            "account": copy,
-            "array": rename_and_stringify_subitems(
-                {"job_id": "array_job_id", "task_id": "array_task_id"}
-            ),
-            "cluster": rename("cluster_name"),
-            "exit_code": join_subitems(":", "exit_code"),
-            "job_id": copy_and_stringify,
-            "name": copy,
-            "nodes": copy,
-            "partition": copy,
-            "state": rename_subitems({"current": "job_state"}),
-            "time": translate_with_value_modification(
-                zero_to_null,
-                rename_subitems,
-                subitem_dict={
-                    "limit": "time_limit",
-                    "submission": "submit_time",
-                    "start": "start_time",
-                    "end": "end_time",
-                },
-            ),
-            "tres": extract_tres_data,
-            "user": rename("username"),
-            "working_directory": copy,
-        }
-
-        # Load the JSON file generated using the Slurm command
-        # (At this point, slurm_data is a hierarchical structure of dictionaries and lists)
-        slurm_data = json.load(f)
-
-        slurm_entities = slurm_data[self.entity]
-
-        for slurm_entity in slurm_entities:
-            res_entity = (
-                dict()
-            )  # Initialize the dictionary which will store the newly formatted Slurm data
-
-            for k, v in slurm_entity.items():
-                # We will use a handler mapping to translate this
-                translator = JOB_FIELD_MAP.get(k, None)
-
-                if translator is not None:
-                    # Translate using the translator retrieved from the fields map
-                    translator(k, v, res_entity)
-
-                # If no translator has been provided: ignore the field
-
-            yield res_entity
+        filtered_accounts = self.get_filtered_accounts()
+
+        # Stream the entities from the JSON file generated using the Slurm command,
+        # without loading the whole report in memory
+        for key, slurm_entity in iter_json_object_items(f, streamed_keys=[self.entity]):
+            if key == "meta":
+                self.check_report_version(slurm_entity)
+            if key != self.entity:
+                # Ignore the other fields of the report (such as "meta" or "errors")
+                continue
+
+            # Translate the job using the function compiled from its fields map.
+            # The fields without translator are ignored
+            res_entity = translate_job_v21_v22_and_23(slurm_entity)
+            if (
+                filtered_accounts is None
+                or res_entity.get("account") in filtered_accounts
+            ):
+                yield res_entity
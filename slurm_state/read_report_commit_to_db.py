@@ -16,7 +16,14 @@ connect to it through a simple connection string given as command-line argument.
 import os
 import argparse
 from slurm_state.mongo_client import get_mongo_client
-from slurm_state.mongo_update import main_read_report_and_update_collection
+from slurm_state.mongo_update import (
+    main_read_jobs_since_watermark,
+    main_read_report_and_update_collection,
+)
+from slurm_state.helpers.ingestion_state_helper import (
+    INGESTION_STATE_COLLECTION,
+    create_ingestion_state_index,
+)
 
 
 def main(argv):
@@ -78,6 +85,36 @@ def main(argv):
         help="Whether or not the jobs and nodes are stored in db.",
     )
 
+    parser.add_argument(
+        "--upsert_jobs",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the jobs are upserted without reading the jobs currently stored in db. The ingestion time then depends on the size of the sacct report instead of the size of the db.",
+    )
+
+    parser.add_argument(
+        "--stream_reports",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the reports generated through sacct and sinfo are parsed while they are received, instead of being written in files first. If --slurm_jobs_file or --slurm_nodes_file is given, a compressed copy of the report is written at this path (with a .gz suffix if it does not end with .gz or .zst).",
+    )
+
+    parser.add_argument(
+        "--use_watermark",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the sacct report starts from the end of the last time window stored in db, instead of covering the last 10 minutes. Only used when the jobs are stored in db and not retrieved from a file.",
+    )
+
+    parser.add_argument(
+        "--skip_unchanged_reports",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the reports identical to the last ones ingested for the cluster are skipped. Only used when the jobs and nodes are stored in db.",
+    )
+
+    parser.add_argument(
+        "--cache_slurm_version",
+        action=argparse.BooleanOptionalAction,
+        help="Whether or not the Slurm version retrieved from the cluster is stored in db, in order to reuse it instead of asking it again to the cluster. Only used when the jobs and nodes are stored in db.",
+    )
+
     parser.add_argument(
         "--mongodb_collection", default="clockwork", help="Collection to populate."
     )
@@ -95,6 +132,22 @@ def main(argv):
     # Get the database instance
     client = get_mongo_client()
 
+    # Collection storing the ingestion state of the clusters, if needed
+    ingestion_state_collection = None
+    if args.store_in_db and (
+        args.use_watermark or args.skip_unchanged_reports or args.cache_slurm_version
+    ):
+        ingestion_state_collection = client[collection_name][INGESTION_STATE_COLLECTION]
+        create_ingestion_state_index(ingestion_state_collection)
+    # The reports are compared to the last ones only if requested
+    report_state_collection = (
+        ingestion_state_collection if args.skip_unchanged_reports else None
+    )
+    # The Slurm version is stored only if requested
+    version_cache_collection = (
+        ingestion_state_collection if args.cache_slurm_version else None
+    )
+
     #
     #   Parse the jobs
     #
@@ -112,16 +165,33 @@ def main(argv):
     if args.from_existing_slurm_jobs_file:
         input_jobs_file_type = "slurm"
 
-    main_read_report_and_update_collection(
-        "jobs",
-        jobs_collection,
-        client[collection_name]["users"],
-        args.cluster_name,
-        args.cw_jobs_file if input_jobs_file_type == "cw" else args.slurm_jobs_file,
-        from_file=input_jobs_file_type,
-        want_commit_to_db=args.store_in_db,
-        dump_file=args.cw_jobs_file,
-    )
+    if args.use_watermark and args.store_in_db and input_jobs_file_type is None:
+        main_read_jobs_since_watermark(
+            jobs_collection,
+            client[collection_name]["users"],
+            ingestion_state_collection,
+            args.cluster_name,
+            args.slurm_jobs_file,
+            dump_file=args.cw_jobs_file,
+            upsert_jobs=bool(args.upsert_jobs),
+            stream_report=bool(args.stream_reports),
+            version_cache_collection=version_cache_collection,
+        )
+    else:
+        main_read_report_and_update_collection(
+            "jobs",
+            jobs_collection,
+            client[collection_name]["users"],
+            args.cluster_name,
+            args.cw_jobs_file if input_jobs_file_type == "cw" else args.slurm_jobs_file,
+            from_file=input_jobs_file_type,
+            want_commit_to_db=args.store_in_db,
+            dump_file=args.cw_jobs_file,
+            upsert_jobs=bool(args.upsert_jobs),
+            stream_report=bool(args.stream_reports),
+            ingestion_state_collection=report_state_collection,
+            version_cache_collection=version_cache_collection,
+        )
 
     #
     #   Parse the nodes
@@ -151,6 +221,9 @@ def main(argv):
         from_file=input_nodes_file_type,
         want_commit_to_db=args.store_in_db,
         dump_file=dump_file,
+        stream_report=bool(args.stream_reports),
+        ingestion_state_collection=report_state_collection,
+        version_cache_collection=version_cache_collection,
     )
 
 
@@ -0,0 +1,43 @@
+"""
+Tests for slurm_state.benchmark_ingestion
+"""
+
+import json
+
+from slurm_state.benchmark_ingestion import generate_synthetic_report, run_benchmark
+from slurm_state.mongo_client import get_mongo_client
+
+
+def test_generate_synthetic_report(tmp_path):
+    report_path = tmp_path / "sacct_report"
+    generate_synthetic_report("jobs", 25, "mila", report_path)
+
+    with open(report_path, "r") as f:
+        D_report = json.load(f)
+    assert "meta" in D_report
+    assert len(D_report["jobs"]) == 25
+    assert len({job["job_id"] for job in D_report["jobs"]}) == 25
+    assert {job["cluster"] for job in D_report["jobs"]} == {"mila"}
+
+
+def test_run_benchmark(tmp_path):
+    # A dedicated database, as the benchmark drops its collections
+    database = get_mongo_client()["clockwork_benchmark_test"]
+
+    L_results = run_benchmark(database, "mila", [30], ["jobs", "nodes"], tmp_path)
+
+    assert [(D["entity"], D["nbr_entities"]) for D in L_results] == [
+        ("jobs", 30),
+        ("nodes", 30),
+    ]
+    assert set(L_results[0]["first_ingestion"]) == {
+        "parse",
+        "translate",
+        "user_lookup",
+        "diff",
+        "bulk_write",
+        "total",
+        "entities_per_second",
+    }
+    assert "user_lookup" not in L_results[1]["second_ingestion"]
+    assert database.list_collection_names() == []
@@ -0,0 +1,81 @@
+"""
+Tests for slurm_state.helpers.bulk_write_helper
+"""
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from slurm_state.config import get_config
+from slurm_state.helpers import bulk_write_helper
+from slurm_state.helpers.bulk_write_helper import bulk_write_in_chunks
+from slurm_state.mongo_client import get_mongo_client
+
+
+class FlakyCollection:
+    """
+    Stand-in for a collection, whose first bulk writes fail before
+    being forwarded to the actual collection.
+    """
+
+    def __init__(self, collection, errors):
+        self.collection = collection
+        self.errors = list(errors)
+        self.nbr_calls = 0
+
+    def bulk_write(self, L_operations, ordered=True):
+        self.nbr_calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.collection.bulk_write(L_operations, ordered=ordered)
+
+
+@pytest.fixture
+def test_collection(monkeypatch):
+    monkeypatch.setattr(bulk_write_helper.time, "sleep", lambda delay: None)
+    db = get_mongo_client()[get_config("mongo.database_name")]
+    db.drop_collection("test_bulk_write")
+    yield db.test_bulk_write
+    db.drop_collection("test_bulk_write")
+
+
+def test_bulk_write_in_chunks(test_collection):
+    test_collection.insert_many([{"job_id": i, "state": "PENDING"} for i in range(5)])
+
+    L_operations = [
+        UpdateOne({"job_id": i}, {"$set": {"state": "RUNNING"}}, upsert=True)
+        for i in range(10)
+    ]
+    D_totals = bulk_write_in_chunks(
+        test_collection, L_operations, chunk_size=3, nbr_workers=2
+    )
+
+    assert D_totals["nMatched"] == 5
+    assert D_totals["nModified"] == 5
+    assert D_totals["nUpserted"] == 5
+    assert D_totals["nWriteErrors"] == 0
+    assert test_collection.count_documents({"state": "RUNNING"}) == 10
+
+
+def test_bulk_write_in_chunks_retries_transient_errors(test_collection):
+    flaky_collection = FlakyCollection(test_collection, [AutoReconnect("reset")])
+
+    L_operations = [InsertOne({"job_id": i}) for i in range(4)]
+    D_totals = bulk_write_in_chunks(
+        flaky_collection, L_operations, chunk_size=4, nbr_retries=1
+    )
+
+    assert flaky_collection.nbr_calls == 2
+    assert D_totals["nInserted"] == 4
+    assert test_collection.count_documents({}) == 4
+
+
+def test_bulk_write_in_chunks_reports_errors(test_collection):
+    flaky_collection = FlakyCollection(
+        test_collection, [AutoReconnect("reset"), AutoReconnect("reset")]
+    )
+
+    with pytest.raises(AutoReconnect):
+        bulk_write_in_chunks(
+            flaky_collection, [InsertOne({"job_id": 1})], nbr_retries=1
+        )
@@ -0,0 +1,80 @@
+"""
+Tests for slurm_state.ingestion_daemon
+"""
+
+import threading, time
+
+from slurm_state.ingestion_daemon import ClusterSchedule, run_ingestion_daemon
+
+
+def test_cluster_schedule_backoff():
+    schedule = ClusterSchedule("mila", interval=10, timeout=0, max_backoff=60)
+
+    assert schedule.get_delay(duration=1) == 10
+    # A slow ingestion delays the next one
+    assert schedule.get_delay(duration=25) == 25
+
+    # The delay is doubled after each failure, up to the maximum backoff
+    schedule.nbr_failures = 2
+    assert schedule.get_delay(duration=1) == 40
+    schedule.nbr_failures = 3
+    assert schedule.get_delay(duration=1) == 60
+
+
+def run_daemon_for(L_schedules, ingest, duration):
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_ingestion_daemon,
+        args=(L_schedules, ingest, stop_event),
+        kwargs={"tick": 0.01},
+    )
+    thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_slow_cluster_does_not_delay_other_clusters():
+    """
+    Check that a fast cluster keeps being ingested while
+    the ingestion of a slow cluster is in progress.
+    """
+    D_nbr_ingestions = {"mila": 0, "cedar": 0}
+
+    def ingest(cluster_name):
+        D_nbr_ingestions[cluster_name] += 1
+        if cluster_name == "cedar":
+            time.sleep(0.5)
+        return True
+
+    L_schedules = [
+        ClusterSchedule("mila", interval=0.02, timeout=0, max_backoff=1),
+        ClusterSchedule("cedar", interval=0.02, timeout=0, max_backoff=1),
+    ]
+    run_daemon_for(L_schedules, ingest, 0.4)
+
+    assert D_nbr_ingestions["cedar"] == 1
+    assert D_nbr_ingestions["mila"] >= 5
+
+
+def test_failing_cluster_backs_off():
+    D_nbr_ingestions = {"mila": 0, "graham": 0}
+
+    def ingest(cluster_name):
+        D_nbr_ingestions[cluster_name] += 1
+        if cluster_name == "graham":
+            raise Exception("Connection refused")
+        return True
+
+    L_schedules = [
+        ClusterSchedule("mila", interval=0.02, timeout=0, max_backoff=10),
+        ClusterSchedule("graham", interval=0.02, timeout=0, max_backoff=10),
+    ]
+    run_daemon_for(L_schedules, ingest, 0.3)
+
+    # The delays of graham are 0.04, 0.08, 0.16, ... after its failures
+    assert L_schedules[1].nbr_failures == D_nbr_ingestions["graham"]
+    assert D_nbr_ingestions["graham"] <= 4
+    assert D_nbr_ingestions["mila"] > D_nbr_ingestions["graham"]
+    assert L_schedules[0].nbr_failures == 0
@@ -0,0 +1,100 @@
+"""
+Tests for slurm_state.helpers.json_stream_helper
+"""
+
+import io
+import json
+
+import pytest
+
+from slurm_state.helpers.json_stream_helper import (
+    JSONStreamReader,
+    get_slurm_report_version,
+    iter_json_array_items,
+    iter_json_object_items,
+)
+
+
+@pytest.mark.parametrize(
+    "report_name,entity", [("sacct_1", "jobs"), ("sinfo_1", "nodes")]
+)
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_iter_object_streams_entities(report_name, entity, chunk_size):
+    """
+    Check that the streamed entities are the ones loaded by json.load,
+    whatever the size of the chunks read from the file.
+    """
+    with open(f"slurm_state_test/files/{report_name}", "r") as f:
+        expected_data = json.load(f)
+
+    with open(f"slurm_state_test/files/{report_name}", "r") as f:
+        reader = JSONStreamReader(f, chunk_size=chunk_size)
+        items = list(reader.iter_object(streamed_keys=[entity]))
+
+    assert [value for (key, value) in items if key == entity] == expected_data[entity]
+    assert dict((key, value) for (key, value) in items if key != entity) == {
+        key: value for (key, value) in expected_data.items() if key != entity
+    }
+
+
+def test_iter_object_binary_file():
+    """
+    Check that a file opened in binary mode is decoded as UTF-8.
+    """
+    data = {"meta": {"a": 1.5e3, "b": [True, False, None]}, "jobs": [{"name": "é"}, {}]}
+    reader = JSONStreamReader(
+        io.BytesIO(json.dumps(data, ensure_ascii=False).encode("utf-8")), chunk_size=1
+    )
+    assert list(reader.iter_object(streamed_keys=["jobs"])) == [
+        ("meta", data["meta"]),
+        ("jobs", {"name": "é"}),
+        ("jobs", {}),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5])
+def test_iter_array_multibyte_characters(chunk_size):
+    """
+    Check that no element is lost when a multi-byte character is split
+    between two chunks.
+    """
+    data = ["é", 12345, {"name": "é"}, "ça coûte 10 €, 🎉", {}]
+    f = io.BytesIO(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    assert list(JSONStreamReader(f, chunk_size=chunk_size).iter_array()) == data
+
+
+def test_iter_truncated_binary_file():
+    """
+    Check that a file ending in the middle of a multi-byte character
+    is reported as invalid.
+    """
+    with pytest.raises(ValueError):
+        list(iter_json_array_items(io.BytesIO('["é"]'.encode("utf-8")[:3])))
+
+
+def test_iter_empty_containers():
+    assert list(iter_json_object_items(io.StringIO(" { } "))) == []
+    assert list(iter_json_object_items(io.StringIO('{"jobs": []}'), ["jobs"])) == []
+    assert list(iter_json_array_items(io.StringIO("[ ]"))) == []
+    assert list(iter_json_array_items(io.StringIO("[1, 23 ,456]"))) == [1, 23, 456]
+
+
+def test_iter_invalid_document():
+    with pytest.raises(ValueError):
+        list(iter_json_array_items(io.StringIO('{"jobs": []}')))
+    with pytest.raises(ValueError):
+        list(iter_json_array_items(io.StringIO("[1, 2")))
+
+
+def test_get_slurm_report_version():
+    with open("slurm_state_test/files/sacct_1", "r") as f:
+        assert get_slurm_report_version(f) == "21.8.8"
+
+    # The "meta" field can be after the entities
+    f = io.StringIO(
+        '{"nodes": [{}, {}], "meta": {"slurm": {"version": {"major": 22, "micro": 5, "minor": 9}}}}'
+    )
+    assert get_slurm_report_version(f) == "22.5.9"
+
+    with pytest.raises(Exception):
+        get_slurm_report_version(io.StringIO('{"jobs": []}'))
@@ -1,6 +1,11 @@
 from slurm_state.mongo_update import *
 from slurm_state.mongo_client import get_mongo_client
 from slurm_state.config import get_config
+from slurm_state.helpers.ingestion_state_helper import (
+    get_cached_slurm_version,
+    get_ingestion_state,
+    set_cached_slurm_version,
+)
 
 # Import jobs and nodes parsers
 from slurm_state.parsers.job_parser import JobParser
@@ -8,7 +13,10 @@ from slurm_state.parsers.node_parser import NodeParser
 
 # Common imports
 from datetime import datetime
+import gzip
+import io
 import pytest
+import shutil
 
 
 def test_fetch_slurm_report_jobs():
@@ -220,6 +228,52 @@ def test_slurm_node_to_clockwork_node():
     }
 
 
+def test_lookup_user_account():
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_users")
+    db.test_users.insert_many(
+        [
+            {
+                "mila_email_username": "student00@mila.quebec",
+                "mila_cluster_username": "milauser00",
+                "cc_account_username": "ccuser00",
+            },
+            {
+                "mila_email_username": "student01@mila.quebec",
+                "mila_cluster_username": "milauser01",
+                "cc_account_username": None,
+            },
+        ]
+    )
+
+    lookup = lookup_user_account(db.test_users)
+    jobs = [
+        slurm_job_to_clockwork_job({"username": username, "cluster_name": cluster})
+        for (username, cluster) in [
+            ("ccuser00", "cedar"),
+            ("milauser01", "mila"),
+            ("milauser01", "cedar"),
+            ("unknown", "mila"),
+        ]
+    ]
+    assert [job["cw"]["mila_email_username"] for job in map(lookup, jobs)] == [
+        "student00@mila.quebec",
+        "student01@mila.quebec",
+        None,
+        None,
+    ]
+    assert (lookup.nbr_hits, lookup.nbr_misses) == (2, 2)
+    # The users are loaded once per account field
+    assert set(lookup.DD_users_by_account_field.keys()) == {
+        "cc_account_username",
+        "mila_cluster_username",
+    }
+
+    db.drop_collection("test_users")
+
+
 def test_main_read_jobs_and_update_collection():
     client = get_mongo_client()
     db = client[get_config("mongo.database_name")]
@@ -251,6 +305,446 @@ def test_main_read_jobs_and_update_collection():
     db.drop_collection("test_jobs")
 
 
+def test_main_read_jobs_and_upsert_collection():
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+
+    main_read_report_and_update_collection(
+        "jobs",
+        db.test_jobs,
+        db.test_users,
+        "cedar",
+        "slurm_state_test/files/sacct_1",
+        from_file=True,
+        upsert_jobs=True,
+    )
+
+    assert db.test_jobs.count_documents({}) == 2
+    job = db.test_jobs.find_one({"slurm.job_id": "10", "slurm.cluster_name": "cedar"})
+    assert job["slurm"]["name"] == "test-job-1"
+    assert job["cw"]["mila_email_username"] is None
+    assert "last_slurm_update" in job["cw"]
+
+    # A user associated to a job is kept if the job's user is not found again
+    db.test_jobs.update_one(
+        {"_id": job["_id"]}, {"$set": {"cw.mila_email_username": "nobody@mila.quebec"}}
+    )
+
+    main_read_report_and_update_collection(
+        "jobs",
+        db.test_jobs,
+        db.test_users,
+        "cedar",
+        "slurm_state_test/files/sacct_2",
+        from_file=True,
+        upsert_jobs=True,
+    )
+
+    assert db.test_jobs.count_documents({}) == 3
+    job = db.test_jobs.find_one({"_id": job["_id"]})
+    assert job["cw"]["mila_email_username"] == "nobody@mila.quebec"
+
+    db.drop_collection("test_jobs")
+
+
+def test_get_slurm_fingerprint():
+    fingerprint = get_slurm_fingerprint({"name": "sh", "job_id": "1", "tres": {"a": 1}})
+    # The fingerprint does not depend on the order of the keys
+    assert fingerprint == get_slurm_fingerprint(
+        {"tres": {"a": 1}, "job_id": "1", "name": "sh"}
+    )
+    assert fingerprint != get_slurm_fingerprint(
+        {"name": "sh", "job_id": "1", "tres": {"a": 2}}
+    )
+
+
+@pytest.mark.parametrize("upsert_jobs", [False, True])
+def test_main_read_jobs_skips_unchanged_jobs(upsert_jobs):
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+
+    def read_report(report_path):
+        main_read_report_and_update_collection(
+            "jobs",
+            db.test_jobs,
+            db.test_users,
+            "cedar",
+            report_path,
+            from_file=True,
+            upsert_jobs=upsert_jobs,
+        )
+        return {job["slurm"]["job_id"]: job for job in db.test_jobs.find()}
+
+    DD_jobs_1 = read_report("slurm_state_test/files/sacct_1")
+    DD_jobs_2 = read_report("slurm_state_test/files/sacct_1")
+
+    assert DD_jobs_1.keys() == DD_jobs_2.keys()
+    for job_id, D_job_1 in DD_jobs_1.items():
+        D_job_2 = DD_jobs_2[job_id]
+        assert D_job_1["slurm"] == D_job_2["slurm"]
+        assert D_job_1["cw"]["slurm_fingerprint"] == D_job_2["cw"]["slurm_fingerprint"]
+        # Only the timestamps of the unchanged jobs are updated
+        assert D_job_1["cw"]["last_slurm_update"] < D_job_2["cw"]["last_slurm_update"]
+
+    # The job "10" changes in sacct_2
+    DD_jobs_3 = read_report("slurm_state_test/files/sacct_2")
+    assert (
+        DD_jobs_3["10"]["cw"]["slurm_fingerprint"]
+        != DD_jobs_2["10"]["cw"]["slurm_fingerprint"]
+    )
+    assert DD_jobs_3["10"]["slurm"]["name"] == "new_name"
+
+    db.drop_collection("test_jobs")
+
+
+def test_main_read_nodes_skips_unchanged_nodes():
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_nodes")
+
+    def read_report(report_path):
+        main_read_report_and_update_collection(
+            "nodes",
+            db.test_nodes,
+            None,
+            "mila",
+            report_path,
+            from_file="slurm",
+        )
+        return {node["slurm"]["name"]: node for node in db.test_nodes.find()}
+
+    DD_nodes_1 = read_report("slurm_state_test/files/sinfo_1")
+    DD_nodes_2 = read_report("slurm_state_test/files/sinfo_1")
+
+    for name, D_node_1 in DD_nodes_1.items():
+        D_node_2 = DD_nodes_2[name]
+        assert D_node_1["slurm"] == D_node_2["slurm"]
+        assert D_node_1["cw"]["gpu"] == D_node_2["cw"]["gpu"]
+        assert D_node_1["cw"]["last_slurm_update"] < D_node_2["cw"]["last_slurm_update"]
+
+    db.drop_collection("test_nodes")
+
+
+def test_main_read_jobs_from_stream(monkeypatch, tmp_path):
+    """
+    Check that a report can be parsed while it is received, and
+    that a compressed copy of it is kept.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+
+    # Stand-in for the output of sacct, received through SSH
+    L_remote_commands = []
+
+    def open_report_stream(parser, remote_command):
+        L_remote_commands.append(remote_command)
+        return open("slurm_state_test/files/sacct_1", "rb")
+
+    monkeypatch.setattr(JobParser, "open_report_stream", open_report_stream)
+
+    main_read_report_and_update_collection(
+        "jobs",
+        db.test_jobs,
+        db.test_users,
+        "cedar",
+        str(tmp_path / "reports" / "sacct_cedar"),
+        from_file=None,
+        stream_report=True,
+    )
+
+    assert len(L_remote_commands) == 1
+    assert L_remote_commands[0].startswith("/opt/software/slurm/bin/sacct")
+    assert db.test_jobs.count_documents({}) == 2
+    with gzip.open(tmp_path / "reports" / "sacct_cedar.gz", "rb") as f_copy:
+        with open("slurm_state_test/files/sacct_1", "rb") as f_report:
+            assert f_copy.read() == f_report.read()
+
+    db.drop_collection("test_jobs")
+
+
+def test_get_sacct_time_window():
+    # Without watermark, the last 10 minutes are requested
+    assert get_sacct_time_window(None, 10000, overlap=60) == (9400, 10000)
+    # The window starts before the watermark
+    assert get_sacct_time_window(9000, 10000, overlap=60) == (8940, 10000)
+    # A long interruption is caught up in several windows
+    assert get_sacct_time_window(1000, 10000, overlap=60, max_window=3600) == (
+        940,
+        4540,
+    )
+
+
+def test_main_read_jobs_since_watermark(monkeypatch, tmp_path):
+    """
+    Check that the sacct windows start from the watermark of the cluster,
+    which moves forward once the jobs have been committed.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+    db.drop_collection("test_ingestion_state")
+
+    L_remote_commands = []
+
+    def open_report_stream(parser, remote_command):
+        L_remote_commands.append(remote_command)
+        return open("slurm_state_test/files/sacct_1", "rb")
+
+    monkeypatch.setattr(JobParser, "open_report_stream", open_report_stream)
+    monkeypatch.setitem(get_all_clusters()["cedar"], "sacct_max_window", 3600)
+
+    # The previous ingestion ended 2 hours ago: 2 windows are needed to catch up
+    watermark = time.time() - 2 * 3600
+    set_ingestion_watermark(db.test_ingestion_state, "cedar", watermark)
+
+    assert main_read_jobs_since_watermark(
+        db.test_jobs,
+        db.test_users,
+        db.test_ingestion_state,
+        "cedar",
+        str(tmp_path / "sacct_cedar"),
+        stream_report=True,
+    )
+
+    assert len(L_remote_commands) == 3
+    timezone = get_all_clusters()["cedar"]["timezone"]
+    first_start = datetime.fromtimestamp(int(watermark - 60), tz=timezone)
+    assert f"-S {first_start.strftime('%Y-%m-%dT%H:%M:%S')} " in L_remote_commands[0]
+    assert "now-600" not in L_remote_commands[0]
+    assert get_ingestion_watermark(db.test_ingestion_state, "cedar") > time.time() - 60
+    assert db.test_jobs.count_documents({}) == 2
+
+    db.drop_collection("test_jobs")
+    db.drop_collection("test_ingestion_state")
+
+
+def test_main_read_jobs_from_cached_report(monkeypatch, tmp_path):
+    """
+    Check that the report written on the cluster is copied instead of
+    running sacct, and that only the jobs of the allocations are kept.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+
+    L_fetched_paths = []
+
+    def fetch_remote_file(remote_path, local_path, *args, **kwargs):
+        L_fetched_paths.append(remote_path)
+        shutil.copyfile(remote_path, local_path)
+        return True
+
+    monkeypatch.setattr(
+        "slurm_state.parsers.entity_parser.fetch_remote_file", fetch_remote_file
+    )
+
+    # The report written on the cluster contains the jobs of other accounts
+    with open("slurm_state_test/files/sacct_1", "r") as f:
+        D_report = json.load(f)
+    D_report["jobs"][1]["account"] = "def-other-rrg"
+    cached_report_path = str(tmp_path / "cached_sacct_report")
+    with open(cached_report_path, "w") as f:
+        json.dump(D_report, f)
+
+    cluster = get_all_clusters()["cedar"]
+    monkeypatch.setitem(cluster, "sacct_cached_report", cached_report_path)
+
+    main_read_report_and_update_collection(
+        "jobs",
+        db.test_jobs,
+        db.test_users,
+        "cedar",
+        str(tmp_path / "sacct_cedar"),
+        from_file=None,
+    )
+
+    assert L_fetched_paths == [cached_report_path]
+    assert db.test_jobs.count_documents({}) == 1
+    assert db.test_jobs.count_documents({"slurm.account": "def-cerise-rrg"}) == 1
+
+    db.drop_collection("test_jobs")
+
+
+def test_main_read_jobs_caches_slurm_version(monkeypatch, tmp_path):
+    """
+    Check that the Slurm version retrieved from the cluster is reused,
+    and retrieved again once the stored one does not match the reports.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+    db.drop_collection("test_ingestion_state")
+
+    L_version_requests = []
+
+    def get_slurm_version(parser):
+        L_version_requests.append(parser.cluster["name"])
+        return "21.08.8"
+
+    def open_report_stream(parser, remote_command):
+        return open("slurm_state_test/files/sacct_1", "rb")
+
+    monkeypatch.setattr(JobParser, "get_slurm_version", get_slurm_version)
+    monkeypatch.setattr(JobParser, "open_report_stream", open_report_stream)
+    monkeypatch.setitem(get_all_clusters()["cedar"], "slurm_version", None)
+
+    def ingest():
+        return main_read_report_and_update_collection(
+            "jobs",
+            db.test_jobs,
+            db.test_users,
+            "cedar",
+            None,
+            stream_report=True,
+            version_cache_collection=db.test_ingestion_state,
+        )
+
+    assert ingest()
+    assert ingest()
+    assert L_version_requests == ["cedar"]
+    assert (
+        get_cached_slurm_version(db.test_ingestion_state, "cedar", ttl=60) == "21.08.8"
+    )
+
+    # A stored version which can not be used is removed
+    set_cached_slurm_version(db.test_ingestion_state, "cedar", "17.11.2")
+    assert not ingest()
+    assert get_cached_slurm_version(db.test_ingestion_state, "cedar", ttl=60) is None
+    assert ingest()
+    assert L_version_requests == ["cedar", "cedar"]
+    assert db.test_jobs.count_documents({}) == 2
+
+    db.drop_collection("test_jobs")
+    db.drop_collection("test_ingestion_state")
+
+
+def test_main_read_jobs_from_compressed_stream(monkeypatch, tmp_path):
+    """
+    Check that a report compressed on the cluster is decompressed while it is
+    parsed, and that its copy is stored without being compressed again.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_jobs")
+
+    with open("slurm_state_test/files/sacct_1", "rb") as f_report:
+        report = f_report.read()
+
+    L_remote_commands = []
+
+    def open_slurm_command_stream(remote_command, *args, **kwargs):
+        L_remote_commands.append(remote_command)
+        return io.BytesIO(gzip.compress(report))
+
+    monkeypatch.setitem(get_all_clusters()["cedar"], "remote_compression", "gzip")
+    monkeypatch.setattr(
+        "slurm_state.parsers.entity_parser.open_slurm_command_stream",
+        open_slurm_command_stream,
+    )
+
+    main_read_report_and_update_collection(
+        "jobs",
+        db.test_jobs,
+        db.test_users,
+        "cedar",
+        str(tmp_path / "sacct_cedar.gz"),
+        from_file=None,
+        stream_report=True,
+    )
+
+    assert L_remote_commands[0].endswith("--json | gzip -1")
+    assert db.test_jobs.count_documents({}) == 2
+    with gzip.open(tmp_path / "sacct_cedar.gz", "rb") as f_copy:
+        assert f_copy.read() == report
+
+    db.drop_collection("test_jobs")
+
+
+def test_main_read_nodes_from_compressed_file(tmp_path):
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_nodes")
+
+    with open("slurm_state_test/files/sinfo_1", "rb") as f_report:
+        with gzip.open(tmp_path / "sinfo_1.gz", "wb") as f_compressed:
+            f_compressed.write(f_report.read())
+
+    main_read_report_and_update_collection(
+        "nodes",
+        db.test_nodes,
+        None,
+        "mila",
+        str(tmp_path / "sinfo_1.gz"),
+        from_file="slurm",
+    )
+
+    assert db.test_nodes.count_documents({}) == 2
+
+    db.drop_collection("test_nodes")
+
+
+def test_main_read_nodes_skips_unchanged_reports(tmp_path):
+    """
+    Check that a report identical to the last ingested one is skipped,
+    even if its modification time changed.
+    """
+    client = get_mongo_client()
+    db = client[get_config("mongo.database_name")]
+
+    db.drop_collection("test_nodes")
+    db.drop_collection("test_ingestion_state")
+
+    report_path = str(tmp_path / "sinfo_report")
+    with open("slurm_state_test/files/sinfo_1", "rb") as f_report:
+        report_content = f_report.read()
+    with open(report_path, "wb") as f:
+        f.write(report_content)
+
+    def ingest():
+        return main_read_report_and_update_collection(
+            "nodes",
+            db.test_nodes,
+            None,
+            "mila",
+            report_path,
+            from_file="slurm",
+            ingestion_state_collection=db.test_ingestion_state,
+        )
+
+    assert ingest()
+    assert db.test_nodes.count_documents({}) == 2
+
+    # Same report, then same report with another modification time
+    db.test_nodes.delete_many({})
+    assert ingest()
+    os.utime(report_path, (time.time() + 60, time.time() + 60))
+    assert ingest()
+    assert db.test_nodes.count_documents({}) == 0
+    D_state = get_ingestion_state(db.test_ingestion_state, "mila", "nodes")
+    assert D_state["nbr_skipped_reports"] == 2
+
+    # A different report is ingested
+    with open(report_path, "wb") as f:
+        f.write(report_content.replace(b"test-node-1", b"test-node-9"))
+    assert ingest()
+    assert db.test_nodes.count_documents({}) == 2
+
+    db.drop_collection("test_nodes")
+    db.drop_collection("test_ingestion_state")
+
+
 def test_main_read_nodes_and_update_collection():
     client = get_mongo_client()
     db = client[get_config("mongo.database_name")]
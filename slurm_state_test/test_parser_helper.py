@@ -0,0 +1,127 @@
+"""
+Tests for slurm_state.helpers.parser_helper
+"""
+
+import copy, json
+import pytest
+
+from slurm_state.helpers.parser_helper import (
+    compile_field_map,
+    copy_with_none_as_empty_string,
+    extract_tres_data,
+    join_subitems,
+    rename,
+    translate_with_field_map,
+    translate_with_value_modification,
+    rename_subitems,
+    zero_to_null,
+)
+from slurm_state.parsers.job_parser import (
+    JOB_FIELD_MAP_V21_V22_AND_23,
+    translate_job_v21_v22_and_23,
+)
+from slurm_state.parsers.node_parser import (
+    NODE_FIELD_MAP_V21_AND_V22,
+    translate_node_v21_and_v22,
+)
+
+
+@pytest.mark.parametrize(
+    "report_path,entity,field_map,translate",
+    [
+        (
+            "slurm_state_test/files/sacct_1",
+            "jobs",
+            JOB_FIELD_MAP_V21_V22_AND_23,
+            translate_job_v21_v22_and_23,
+        ),
+        (
+            "slurm_state_test/files/sacct_2",
+            "jobs",
+            JOB_FIELD_MAP_V21_V22_AND_23,
+            translate_job_v21_v22_and_23,
+        ),
+        (
+            "slurm_state_test/files/sinfo_1",
+            "nodes",
+            NODE_FIELD_MAP_V21_AND_V22,
+            translate_node_v21_and_v22,
+        ),
+        (
+            "slurm_state_test/files/sinfo_2",
+            "nodes",
+            NODE_FIELD_MAP_V21_AND_V22,
+            translate_node_v21_and_v22,
+        ),
+    ],
+)
+def test_compiled_field_map_matches_field_map(
+    report_path, entity, field_map, translate
+):
+    """
+    Check that the compiled translations give the same results
+    as the translators applied one field at a time.
+    """
+    with open(report_path, "r") as f:
+        L_entities = json.load(f)[entity]
+    assert L_entities
+
+    for slurm_entity in L_entities:
+        # Some translators modify the values they receive
+        assert translate(copy.deepcopy(slurm_entity)) == translate_with_field_map(
+            field_map, copy.deepcopy(slurm_entity)
+        )
+
+
+def test_compile_field_map():
+    def custom_translator(k, v, res):
+        res[f"custom_{k}"] = v * 2
+
+    field_map = {
+        "a": rename("alpha"),
+        "b": copy_with_none_as_empty_string,
+        "c": join_subitems("-", "joined"),
+        "d": translate_with_value_modification(
+            zero_to_null, rename_subitems, subitem_dict={"x": "d_x", "y": "d_y"}
+        ),
+        "e": custom_translator,
+    }
+    translate = compile_field_map(field_map)
+
+    L_entities = [
+        {"a": 1, "b": "", "c": {"u": 1, "v": "w"}, "d": {"x": 0, "y": 3}, "e": 4},
+        {"b": "value", "ignored": True},
+        {},
+    ]
+    for entity in L_entities:
+        assert translate(copy.deepcopy(entity)) == translate_with_field_map(
+            field_map, copy.deepcopy(entity)
+        )
+    assert translate(L_entities[0]) == {
+        "alpha": 1,
+        "b": None,
+        "joined": "1-w",
+        "d_x": None,
+        "d_y": 3,
+        "custom_e": 8,
+    }
+
+
+def test_extract_tres_data():
+    res = {}
+    extract_tres_data(
+        "tres",
+        {
+            "allocated": [
+                {"type": "cpu", "name": None, "id": 1, "count": 4},
+                {"type": "gres", "name": "gpu", "id": 1001, "count": 2},
+                {"type": "energy", "name": None, "id": 3, "count": 7},
+            ],
+            "requested": [{"type": "gres", "name": "shard", "id": 1002, "count": 1}],
+        },
+        res,
+    )
+    assert res == {
+        "tres_allocated": {"num_cpus": 4, "num_gpus": 2},
+        "tres_requested": {"gres": 1},
+    }
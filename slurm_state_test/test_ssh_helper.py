@@ -0,0 +1,212 @@
+"""
+Tests for slurm_state.helpers.ssh_helper
+"""
+
+import os
+import pytest
+from paramiko import ssh_exception
+
+from slurm_state.helpers import ssh_helper
+from slurm_state.helpers.ssh_helper import SSHConnectionPool
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class FakeSSHClient:
+    """
+    Stand-in for paramiko.SSHClient, recording the commands it runs.
+    """
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.commands = []
+        self.closed = False
+        self.fail_next_command = False
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command):
+        if self.fail_next_command:
+            self.fail_next_command = False
+            raise ssh_exception.SSHException("Channel closed.")
+        self.commands.append(command)
+        return (None, [f"{command} output\n"], None)
+
+    def open_sftp(self):
+        return FakeSFTPClient()
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+class FakeSFTPFile:
+    """
+    Stand-in for paramiko.SFTPFile, reading a local file.
+    """
+
+    def __init__(self, path, sftp_client):
+        self.f = open(path, "rb")
+        self.sftp_client = sftp_client
+
+    def seek(self, offset):
+        self.f.seek(offset)
+
+    def prefetch(self, file_size=None):
+        pass
+
+    def read(self, size):
+        chunk = self.f.read(size)
+        self.sftp_client.nbr_read_bytes += len(chunk)
+        return chunk
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeChannel:
+    closed = False
+
+
+class FakeSFTPClient:
+    """
+    Stand-in for paramiko.SFTPClient, giving access to the local files.
+    """
+
+    def __init__(self):
+        self.nbr_read_bytes = 0
+        self.closed = False
+
+    def get_channel(self):
+        return FakeChannel()
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode):
+        return FakeSFTPFile(path, self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    clients = []
+
+    def fake_open_connection(hostname, username, ssh_key_path, port=22, compress=False):
+        clients.append(FakeSSHClient())
+        return clients[-1]
+
+    monkeypatch.setattr(ssh_helper, "open_connection", fake_open_connection)
+    return clients
+
+
+def test_pool_reuses_connection(fake_clients):
+    pool = SSHConnectionPool(keepalive_interval=10)
+    for command in ["sacct -V", "sacct --json", "sinfo -V", "sinfo --json"]:
+        pool.exec_command(command, "cluster", "user", "/key", 22)
+
+    # One connection is used for all the commands on the same host
+    assert len(fake_clients) == 1
+    assert fake_clients[0].commands == [
+        "sacct -V",
+        "sacct --json",
+        "sinfo -V",
+        "sinfo --json",
+    ]
+    assert fake_clients[0].transport.keepalive == 10
+
+    # Another host gets its own connection
+    pool.exec_command("sinfo -V", "other_cluster", "user", "/key", 22)
+    assert len(fake_clients) == 2
+
+    pool.close_all()
+    assert all(client.closed for client in fake_clients)
+
+
+def test_pool_reconnects(fake_clients):
+    pool = SSHConnectionPool()
+    pool.exec_command("sacct -V", "cluster", "user", "/key", 22)
+
+    # A closed connection is reopened
+    fake_clients[0].transport.active = False
+    pool.exec_command("sacct -V", "cluster", "user", "/key", 22)
+    assert len(fake_clients) == 2
+    assert fake_clients[0].closed
+
+    # A failure while opening a channel leads to a new connection
+    fake_clients[1].fail_next_command = True
+    (_, stdout, _) = pool.exec_command("sinfo -V", "cluster", "user", "/key", 22)
+    assert stdout == ["sinfo -V output\n"]
+    assert len(fake_clients) == 3
+    assert fake_clients[1].closed
+    assert fake_clients[2].commands == ["sinfo -V"]
+
+
+def test_pool_reuses_sftp_session(fake_clients):
+    pool = SSHConnectionPool()
+    sftp_client = pool.get_sftp("cluster", "user", "/key", 22)
+    assert pool.get_sftp("cluster", "user", "/key", 22) is sftp_client
+    assert len(fake_clients) == 1
+
+    pool.discard_client("cluster", "user", "/key", 22)
+    assert sftp_client.closed
+    assert pool.get_sftp("cluster", "user", "/key", 22) is not sftp_client
+
+
+def test_fetch_remote_file(fake_clients, monkeypatch, tmp_path):
+    monkeypatch.setattr(ssh_helper, "_connection_pool", SSHConnectionPool())
+    remote_path = str(tmp_path / "remote" / "sacct_report")
+    local_path = str(tmp_path / "local" / "sacct_report")
+    os.makedirs(os.path.dirname(remote_path))
+    with open(remote_path, "wb") as f:
+        f.write(b"0123456789" * 1000)
+
+    def fetch():
+        return ssh_helper.fetch_remote_file(
+            remote_path, local_path, "cluster", "user", "key", chunk_size=100
+        )
+
+    assert fetch()
+    with open(local_path, "rb") as f:
+        assert f.read() == b"0123456789" * 1000
+    assert int(os.path.getmtime(local_path)) == int(os.path.getmtime(remote_path))
+
+    # The copy is up to date
+    sftp_client = ssh_helper.get_ssh_connection_pool().get_sftp(
+        "cluster", "user", os.path.join(os.path.expanduser("~"), ".ssh", "key"), 22
+    )
+    sftp_client.nbr_read_bytes = 0
+    assert not fetch()
+    assert sftp_client.nbr_read_bytes == 0
+
+    # A new version of the remote file, whose transfer has been interrupted
+    with open(remote_path, "wb") as f:
+        f.write(b"abcdefghij" * 1500)
+    os.utime(remote_path, (1700000000, 1700000000))
+    with open(f"{local_path}.1700000000.part", "wb") as f:
+        f.write(b"abcdefghij" * 600)
+
+    assert fetch()
+    assert sftp_client.nbr_read_bytes == 9000
+    with open(local_path, "rb") as f:
+        assert f.read() == b"abcdefghij" * 1500
+    assert not os.path.exists(f"{local_path}.1700000000.part")
@@ -0,0 +1,52 @@
+"""
+Tests for slurm_state.helpers.stream_helper
+"""
+
+import gzip
+import io
+
+import pytest
+
+from slurm_state.helpers.stream_helper import (
+    TeeReader,
+    get_compression_from_path,
+    open_decompressed_stream,
+    open_report_file,
+)
+
+
+def test_get_compression_from_path():
+    assert get_compression_from_path("reports/sacct_mila.gz") == "gzip"
+    assert get_compression_from_path("reports/sacct_mila.zst") == "zstd"
+    assert get_compression_from_path("reports/sacct_mila") is None
+    assert get_compression_from_path("reports/sacct_mila.json") is None
+
+
+@pytest.mark.parametrize("file_name", ["report", "report.gz"])
+def test_open_report_file(tmp_path, file_name):
+    with open("slurm_state_test/files/sinfo_1", "rb") as f:
+        data = f.read()
+
+    with open_report_file(str(tmp_path / file_name), "wb") as f:
+        f.write(data)
+    with open_report_file(str(tmp_path / file_name)) as f:
+        assert f.read() == data
+
+
+def test_tee_and_decompress_stream():
+    data = b'{"jobs": [' + b",".join([b'{"name": "sh"}'] * 1000) + b"]}"
+    compressed_stream = io.BytesIO(gzip.compress(data))
+    copy_file = io.BytesIO()
+
+    # Keep a copy of the compressed stream while it is decompressed
+    stream = open_decompressed_stream(TeeReader(compressed_stream, copy_file), "gzip")
+    chunks = []
+    while chunk := stream.read(100):
+        chunks.append(chunk)
+
+    assert b"".join(chunks) == data
+    assert gzip.decompress(copy_file.getvalue()) == data
+
+    stream.close()
+    assert compressed_stream.closed
+    assert copy_file.closed
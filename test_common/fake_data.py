@@ -56,23 +56,15 @@ def populate_fake_data(db_insertion_point, json_file=None, mutate=False):
 
     # Create indices. This isn't half as important as when we're
     # dealing with large quantities of data, but it's part of the
-    # set up for the database.
-    db_insertion_point["jobs"].create_index(
-        [("slurm.job_id", 1), ("slurm.cluster_name", 1), ("cw.mila_email_username", 1)],
-        name="job_id_and_cluster_name",
-    )
-    db_insertion_point["nodes"].create_index(
-        [("slurm.name", 1), ("slurm.cluster_name", 1)],
-        name="name_and_cluster_name",
-    )
-    db_insertion_point["users"].create_index(
-        [("mila_email_username", 1)], name="users_email_index"
-    )
-    db_insertion_point["gpu"].create_index([("name", 1)], name="gpu_name")
-    db_insertion_point["job_user_props"].create_index(
-        [("mila_email_username", 1), ("job_id", 1), ("cluster_name", 1)],
-        name="job_user_props_index",
-    )
+    # set up for the database. They are declared in clockwork_web,
+    # which is not available in every test image (e.g. the one of
+    # clockwork_tools_test): the fake data is small enough to do without.
+    try:
+        from clockwork_web.core.indexes_helper import ensure_indexes
+    except ImportError:
+        pass
+    else:
+        ensure_indexes(db_insertion_point)
 
     for k in ["users", "jobs", "nodes", "gpu", "job_user_props"]:
         if k in E: